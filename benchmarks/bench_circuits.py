@@ -0,0 +1,47 @@
+""" Benchmarks of circuit evaluation by circuit size and spectrum length """
+
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits.fitting import buildCircuit
+
+from .common import arcs, nested, spectrum
+
+
+class PredictSize:
+    params = ([1, 2, 4, 8], [50, 200, 1000])
+    param_names = ['n_arcs', 'n_freq']
+
+    def setup(self, n_arcs, n_freq):
+        circuit, parameters = arcs(n_arcs)
+        self.frequencies, _ = spectrum(circuit, parameters, n_freq)
+        self.model = CustomCircuit(circuit, initial_guess=list(parameters))
+        self.model.parameters_ = parameters
+
+    def time_predict(self, n_arcs, n_freq):
+        self.model.predict(self.frequencies)
+
+    def peakmem_predict(self, n_arcs, n_freq):
+        self.model.predict(self.frequencies)
+
+
+class PredictDepth(PredictSize):
+    params = ([1, 2, 4, 8], [200])
+    param_names = ['depth', 'n_freq']
+
+    def setup(self, depth, n_freq):
+        circuit, parameters = nested(depth)
+        self.frequencies, _ = spectrum(circuit, parameters, n_freq)
+        self.model = CustomCircuit(circuit, initial_guess=list(parameters))
+        self.model.parameters_ = parameters
+
+
+class BuildCircuit:
+    params = [1, 4, 16]
+    param_names = ['n_arcs']
+
+    def setup(self, n_arcs):
+        self.circuit, self.parameters = arcs(n_arcs)
+        self.frequencies, _ = spectrum(self.circuit, self.parameters, 200)
+
+    def time_buildCircuit(self, n_arcs):
+        buildCircuit(self.circuit, self.frequencies, *self.parameters,
+                     constants={}, eval_string='', index=0)
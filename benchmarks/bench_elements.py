@@ -0,0 +1,74 @@
+"""
+Benchmarks of circuit evaluation for each element type
+
+The classes follow the conventions of airspeed velocity (asv). Running this
+file directly prints the time per evaluation of each element with NumPy and
+with the numba-compiled backend::
+
+    python benchmarks/bench_elements.py
+"""
+
+import timeit
+
+import numpy as np
+
+from impedance.models.circuits.compiler import CompiledCircuit
+from impedance.models.circuits.jit import JITCircuit
+
+ELEMENTS = ['R', 'C', 'L', 'W', 'Wo', 'Ws', 'CPE', 'La', 'G', 'Gs', 'K',
+            'Zarc', 'TLMQ', 'T']
+CIRCUITS = ['R0-p(R1,C1)', 'R0-p(R1,CPE1)-p(R2-Wo1,C2)']
+
+
+def _parameters(model):
+    """ parameters with exponents below 1 and everything else above """
+    return np.array([0.9 if name.endswith('_1') else 1.5
+                     for name in model.param_names])
+
+
+class ElementEvaluation:
+    params = (ELEMENTS, [100, 500])
+    param_names = ['element', 'n_freq']
+
+    def setup(self, element, n_freq):
+        self.frequencies = np.logspace(5, -2, n_freq)
+        self.numpy = CompiledCircuit(element + '1')
+        self.jit = JITCircuit(element + '1')
+        self.parameters = _parameters(self.numpy)
+        # compile outside of the timed region
+        self.jit(self.frequencies, self.parameters)
+
+    def time_numpy(self, element, n_freq):
+        self.numpy(self.frequencies, self.parameters)
+
+    def time_jit(self, element, n_freq):
+        self.jit(self.frequencies, self.parameters)
+
+
+class CircuitEvaluation(ElementEvaluation):
+    params = (CIRCUITS, [100, 500])
+    param_names = ['circuit', 'n_freq']
+
+    def setup(self, circuit, n_freq):
+        self.frequencies = np.logspace(5, -2, n_freq)
+        self.numpy = CompiledCircuit(circuit)
+        self.jit = JITCircuit(circuit)
+        self.parameters = _parameters(self.numpy)
+        self.jit(self.frequencies, self.parameters)
+
+
+def _time(function, number=2000):
+    return min(timeit.repeat(function, number=number, repeat=3)) / number
+
+
+if __name__ == '__main__':
+    print(f'{"circuit":>28} {"n_freq":>6} {"numpy (us)":>10} ' +
+          f'{"jit (us)":>9} {"speedup":>7}')
+    for suite in [ElementEvaluation(), CircuitEvaluation()]:
+        for name in suite.params[0]:
+            for n_freq in suite.params[1]:
+                suite.setup(name, n_freq)
+                t_numpy = _time(lambda: suite.time_numpy(name, n_freq))
+                t_jit = _time(lambda: suite.time_jit(name, n_freq))
+                print(f'{name:>28} {n_freq:>6} {1e6 * t_numpy:>10.1f} ' +
+                      f'{1e6 * t_jit:>9.1f} {t_numpy / t_jit:>7.1f}')
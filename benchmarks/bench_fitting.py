@@ -0,0 +1,55 @@
+""" Benchmarks of local, global and batched fitting """
+
+import warnings
+
+import numpy as np
+
+from impedance.models.circuits.batch import batch_circuit_fit
+from impedance.models.circuits.fitting import circuit_fit
+
+from .common import arcs, spectrum
+
+CIRCUIT, PARAMETERS = arcs(2)
+INITIAL_GUESS = PARAMETERS * 1.5
+
+
+class CircuitFit:
+    params = ([50, 200, 1000], [False, True])
+    param_names = ['n_freq', 'global_opt']
+    timeout = 300
+
+    def setup(self, n_freq, global_opt):
+        self.frequencies, self.Z = spectrum(CIRCUIT, PARAMETERS, n_freq)
+        # a few basinhopping steps are enough to track the cost per step
+        self.kwargs = {'niter': 3} if global_opt else {}
+
+    def time_circuit_fit(self, n_freq, global_opt):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            circuit_fit(self.frequencies, self.Z, CIRCUIT, INITIAL_GUESS,
+                        global_opt=global_opt, **self.kwargs)
+
+    def peakmem_circuit_fit(self, n_freq, global_opt):
+        self.time_circuit_fit(n_freq, global_opt)
+
+
+class BatchFit:
+    params = [1, 10, 100]
+    param_names = ['n_spectra']
+    timeout = 300
+
+    def setup(self, n_spectra):
+        spectra = [spectrum(CIRCUIT, PARAMETERS, 100, seed=seed)
+                   for seed in range(n_spectra)]
+        self.frequencies = spectra[0][0]
+        self.Z = np.array([Z for _, Z in spectra])
+
+    def time_batch_circuit_fit(self, n_spectra):
+        batch_circuit_fit(self.frequencies, self.Z, CIRCUIT, INITIAL_GUESS)
+
+    def time_serial_circuit_fit(self, n_spectra):
+        for Z in self.Z:
+            circuit_fit(self.frequencies, Z, CIRCUIT, INITIAL_GUESS)
+
+    def peakmem_batch_circuit_fit(self, n_spectra):
+        batch_circuit_fit(self.frequencies, self.Z, CIRCUIT, INITIAL_GUESS)
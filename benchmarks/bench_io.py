@@ -0,0 +1,40 @@
+""" Benchmarks of file parsing and of importing the package """
+
+import os
+
+from impedance.preprocessing import readFile
+
+from .common import DATA
+
+FILES = {'csv': ('exampleData.csv', None),
+         'gamry': ('exampleDataGamry.DTA', 'gamry'),
+         'autolab': ('exampleDataAutolab.txt', 'autolab'),
+         'biologic': ('exampleDataBioLogic.mpt', 'biologic'),
+         'parstat': ('exampleDataParstat.txt', 'parstat'),
+         'zplot': ('exampleDataZPlot.z', 'zplot'),
+         'versastudio': ('exampleDataVersaStudio.par', 'versastudio'),
+         'powersuite': ('exampleDataPowersuite.txt', 'powersuite'),
+         'chinstruments': ('exampleDataCHInstruments.txt', 'chinstruments')}
+
+
+class ReadFile:
+    params = list(FILES)
+    param_names = ['format']
+
+    def setup(self, file_format):
+        filename, self.instrument = FILES[file_format]
+        self.filename = os.path.join(DATA, filename)
+
+    def time_readFile(self, file_format):
+        readFile(self.filename, instrument=self.instrument)
+
+    def peakmem_readFile(self, file_format):
+        readFile(self.filename, instrument=self.instrument)
+
+
+class Import:
+    def timeraw_import_impedance(self):
+        return 'import impedance.models.circuits'
+
+    def timeraw_import_preprocessing(self):
+        return 'import impedance.preprocessing'
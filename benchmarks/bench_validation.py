@@ -0,0 +1,23 @@
+""" Benchmarks of the lin-KK validity test """
+
+import os
+
+from impedance.preprocessing import ignoreBelowX, readCSV
+from impedance.validation import linKK
+
+from .common import DATA
+
+
+class LinKK:
+    params = ([10, 50, 100], ['real', 'complex'])
+    param_names = ['max_M', 'fit_type']
+
+    def setup(self, max_M, fit_type):
+        f, Z = readCSV(os.path.join(DATA, 'exampleData.csv'))
+        self.f, self.Z = ignoreBelowX(f, Z)
+
+    def time_linKK(self, max_M, fit_type):
+        linKK(self.f, self.Z, max_M=max_M, fit_type=fit_type)
+
+    def peakmem_linKK(self, max_M, fit_type):
+        linKK(self.f, self.Z, max_M=max_M, fit_type=fit_type)
@@ -0,0 +1,40 @@
+""" Shared inputs for the benchmarks """
+
+import os
+
+import numpy as np
+
+from impedance.models.circuits.compiler import CompiledCircuit
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def arcs(n_arcs):
+    """ a resistor in series with n_arcs parallel RC arcs, with parameters
+    that give arcs spread over the frequency range """
+    circuit = '-'.join(['R0'] + [f'p(R{i},C{i})'
+                                 for i in range(1, n_arcs + 1)])
+    parameters = [0.01]
+    for i in range(n_arcs):
+        parameters += [0.01 * (i + 1), 10.0**(-5 + 5 * i / max(n_arcs, 1))]
+    return circuit, np.array(parameters)
+
+
+def nested(depth):
+    """ RC arcs nested `depth` levels deep, p(R1,C1-p(R2,C2-...)) """
+    circuit = f'p(R{depth},C{depth})'
+    for i in reversed(range(1, depth)):
+        circuit = f'p(R{i},C{i}-{circuit})'
+    circuit = 'R0-' + circuit
+    n_params = CompiledCircuit(circuit).num_params
+    return circuit, np.linspace(0.01, 0.1, n_params)
+
+
+def spectrum(circuit, parameters, n_freq, noise=0.002, seed=0):
+    """ frequencies and impedance of a circuit with multiplicative noise """
+    frequencies = np.logspace(5, -2, n_freq)
+    Z = CompiledCircuit(circuit)(frequencies, parameters)
+    rng = np.random.default_rng(seed)
+    Z = Z * (1 + noise * (rng.standard_normal(Z.shape) +
+                          1j * rng.standard_normal(Z.shape)))
+    return frequencies, Z
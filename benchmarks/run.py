@@ -0,0 +1,144 @@
+""" Runs the benchmarks without asv and compares them with a baseline
+
+The benchmark classes follow the `asv <https://asv.readthedocs.io>`_
+conventions (``params``, ``param_names``, ``setup``, and ``time_``,
+``peakmem_`` and ``timeraw_`` methods), so ``asv run`` picks them up as
+well. This runner only needs the packages impedance.py already depends on:
+
+    python -m benchmarks.run                     # run everything
+    python -m benchmarks.run -b fitting          # benchmarks matching a name
+    python -m benchmarks.run -o results.json     # save the results
+    python -m benchmarks.run --compare benchmarks/baseline.json
+
+With ``--compare``, it exits with a nonzero status if any benchmark is
+slower (or uses more memory) than the baseline by more than ``--factor``.
+Timings are machine-specific, so compare results from the same machine.
+"""
+
+import argparse
+import contextlib
+import importlib
+import inspect
+import itertools
+import io
+import json
+import pkgutil
+import platform
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+
+import benchmarks
+
+PREFIXES = ('time_', 'peakmem_', 'timeraw_')
+
+
+def discover(pattern=''):
+    """ yields (name, class, method name, parameters) of every benchmark
+    whose name contains `pattern` """
+    for module in pkgutil.iter_modules(benchmarks.__path__):
+        if not module.name.startswith('bench_'):
+            continue
+        module = importlib.import_module('benchmarks.' + module.name)
+        for _, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            params = getattr(cls, 'params', [])
+            if params and not isinstance(params[0], (list, tuple)):
+                params = [params]
+            for method in sorted(dir(cls)):
+                if method.startswith(PREFIXES):
+                    name = f'{module.__name__[11:]}.{cls.__name__}.{method}'
+                    if pattern in name:
+                        for args in itertools.product(*params):
+                            yield name, cls, method, args
+
+
+def measure(cls, method, args, repeat=5):
+    """ seconds per call (minimum over `repeat` rounds) or peak bytes """
+    # some functions (e.g. linKK) print progress on every call
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _measure(cls, method, args, repeat)
+
+
+def _measure(cls, method, args, repeat):
+    instance = cls()
+    if hasattr(instance, 'setup'):
+        instance.setup(*args)
+    function = getattr(instance, method)
+
+    if method.startswith('timeraw_'):
+        code = function(*args)
+        times = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, '-c',
+                 'import time; start = time.perf_counter()\n' + code +
+                 '\nprint(time.perf_counter() - start)'],
+                capture_output=True, text=True, check=True).stdout
+            times.append(float(output.split()[-1]))
+        return min(times)
+
+    if method.startswith('peakmem_'):
+        tracemalloc.start()
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    timer = timeit.Timer(lambda: function(*args))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def compare(results, baseline, factor):
+    """ names of the benchmarks that regressed by more than `factor` """
+    regressions = []
+    for key, value in results.items():
+        reference = baseline.get(key)
+        if reference and value > factor * reference:
+            regressions.append(key)
+            print(f'REGRESSION {key}: {value:.4g} vs. {reference:.4g}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-b', '--bench', default='',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('-o', '--output', help='JSON file for the results')
+    parser.add_argument('--compare', help='baseline JSON file')
+    parser.add_argument('--factor', type=float, default=1.5,
+                        help='allowed slowdown relative to the baseline')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, cls, method, params in discover(args.bench):
+        key = name + (str(list(params)) if params else '')
+        results[key] = measure(cls, method, params, args.repeat)
+        unit = 'bytes' if method.startswith('peakmem_') else 's'
+        print(f'{key:<72} {results[key]:10.4g} {unit}', flush=True)
+
+    if args.output:
+        machine = {'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'machine': platform.machine(),
+                   'processor': platform.processor()}
+        with open(args.output, 'w') as f:
+            json.dump({'machine': machine, 'results': results}, f,
+                      indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.factor):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,3 @@
 __version__ = "1.7.1"
+
+from .profiling import Profile, profile  # noqa: F401, E402
@@ -0,0 +1,230 @@
+"""
+Fitting and validation from asyncio code
+
+The functions of impedance.py block while they run, which would stall an
+event loop. :class:`FitPool` runs them on a pool of threads or processes
+and limits how many run at once, so that many concurrent requests queue
+up in the event loop instead of overloading the machine::
+
+    pool = FitPool(max_concurrency=8)
+
+    async def handle(frequencies, Z):
+        circuit = CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, .1, 1])
+        await pool.fit(circuit, frequencies, Z, timeout=5)
+        return circuit.parameters_
+"""
+
+import asyncio
+import concurrent.futures
+import copy
+import functools
+import threading
+import weakref
+
+from .models.circuits.fitting import circuit_fit
+from .validation import linKK
+
+
+class FitPool:
+    """ A bounded pool for running fits from coroutines
+
+    At most `max_concurrency` calls run at a time; further calls wait in
+    the event loop, where they can be cancelled without ever starting.
+
+    If a running fit is cancelled or exceeds its `timeout`, the optimizer
+    is stopped after its next evaluation of the circuit (through the `stop`
+    argument of `circuit_fit`) and `asyncio.CancelledError` or
+    `asyncio.TimeoutError` is raised once it has stopped, so the worker is
+    free again before the next call starts. Processes cannot be signalled,
+    so with processes=True a timeout is passed to the fit as its
+    time_budget and cancelled fits run to completion in the background.
+    linKK is not iterative and always runs to completion.
+
+    Parameters
+    ----------
+    max_concurrency : int, optional
+        Maximum number of calls running at once (and number of workers).
+        Defaults to 4
+    processes : bool, optional
+        Whether to run calls in worker processes instead of threads, which
+        avoids contention for the GIL at the cost of copying the data.
+        Defaults to False
+
+    Examples
+    --------
+    >>> async def main(spectra):
+    ...     async with FitPool(max_concurrency=8) as pool:
+    ...         return await asyncio.gather(*[
+    ...             pool.circuit_fit(f, Z, 'R0-p(R1,C1)', [.01, .1, 1])
+    ...             for f, Z in spectra])
+    """
+    def __init__(self, max_concurrency=4, processes=False):
+        self.max_concurrency = max_concurrency
+        self.processes = processes
+        self._executor = None
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @property
+    def executor(self):
+        """ the pool of workers, started on first use """
+        if self._executor is None:
+            if self.processes:
+                executor = concurrent.futures.ProcessPoolExecutor
+            else:
+                executor = concurrent.futures.ThreadPoolExecutor
+            self._executor = executor(self.max_concurrency)
+        return self._executor
+
+    def _semaphore(self):
+        # semaphores belong to an event loop (up to Python 3.9)
+        loop = asyncio.get_event_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
+    async def circuit_fit(self, frequencies, impedances, circuit,
+                          initial_guess, timeout=None, **kwargs):
+        """ Runs `circuit_fit` on the pool
+
+        Parameters
+        ----------
+        frequencies, impedances, circuit, initial_guess :
+            As for `impedance.models.circuits.fitting.circuit_fit`
+        timeout : float, optional
+            Seconds after which the fit is stopped and
+            asyncio.TimeoutError is raised. Defaults to None
+        kwargs :
+            Keyword arguments passed to `circuit_fit`
+
+        Returns
+        -------
+        The return value of `circuit_fit`
+        """
+        function = functools.partial(circuit_fit, frequencies, impedances,
+                                     circuit, initial_guess)
+        return await self._run(function, kwargs, timeout)
+
+    async def fit(self, model, frequencies, impedance, timeout=None,
+                  **kwargs):
+        """ Runs `model.fit` on the pool
+
+        The model is only updated if the fit completes, so a cancelled or
+        timed out fit leaves it as it was. Do not fit the same model
+        concurrently.
+
+        Parameters
+        ----------
+        model : BaseCircuit
+            Circuit to fit (e.g. a CustomCircuit)
+        frequencies, impedance :
+            As for `BaseCircuit.fit`
+        timeout : float, optional
+            Seconds after which the fit is stopped and
+            asyncio.TimeoutError is raised. Defaults to None
+        kwargs :
+            Keyword arguments passed to `BaseCircuit.fit`
+
+        Returns
+        -------
+        model : BaseCircuit
+            The fitted model
+        """
+        function = functools.partial(_fit_copy, model, frequencies,
+                                     impedance)
+        fitted = await self._run(function, kwargs, timeout)
+        model.__dict__.update(vars(fitted))
+        return model
+
+    async def linKK(self, f, Z, timeout=None, **kwargs):
+        """ Runs `impedance.validation.linKK` on the pool
+
+        Parameters
+        ----------
+        f, Z :
+            As for `linKK`
+        timeout : float, optional
+            Seconds after which asyncio.TimeoutError is raised. Defaults
+            to None
+        kwargs :
+            Keyword arguments passed to `linKK`
+
+        Returns
+        -------
+        The return value of `linKK`
+        """
+        function = functools.partial(linKK, f, Z, **kwargs)
+        return await self._run(function, None, timeout)
+
+    async def _run(self, function, fit_kwargs, timeout):
+        """ runs function(**fit_kwargs) on a worker, stopping a fit (if
+        fit_kwargs is not None) when cancelled or timed out """
+        stop = None
+        if fit_kwargs is not None:
+            fit_kwargs = dict(fit_kwargs)
+            if self.processes:
+                if timeout is not None:
+                    budget = fit_kwargs.get('time_budget')
+                    fit_kwargs['time_budget'] = timeout if budget is None \
+                        else min(timeout, budget)
+            else:
+                stop = threading.Event()
+                fit_kwargs['stop'] = _stoppable(stop, fit_kwargs.get('stop'))
+            function = functools.partial(function, **fit_kwargs)
+
+        async with self._semaphore():
+            loop = asyncio.get_event_loop()
+            future = loop.run_in_executor(self.executor, function)
+            try:
+                done, _ = await asyncio.wait([future], timeout=timeout)
+            except asyncio.CancelledError:
+                await _stop(future, stop)
+                raise
+            if not done:
+                await _stop(future, stop)
+                raise asyncio.TimeoutError()
+            return future.result()
+
+    def shutdown(self, wait=True):
+        """ Stops the workers
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Whether to wait for running calls to finish. Defaults to True
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.shutdown(wait=False)
+
+
+def _fit_copy(model, frequencies, impedance, **kwargs):
+    """ fits a copy of a model, so a fit stopped by cancellation does not
+    change the original """
+    return copy.copy(model).fit(frequencies, impedance, **kwargs)
+
+
+def _stoppable(stop, callback):
+    """ a `stop` argument for circuit_fit that ends the fit once the event
+    `stop` is set or `callback` (the caller's own `stop`) returns True """
+    if callback is None:
+        return stop.is_set
+    return lambda: stop.is_set() or bool(callback())
+
+
+async def _stop(future, stop):
+    """ signals a running fit to stop and waits until it has (processes
+    and non-iterative calls cannot be stopped and are left running) """
+    if stop is None:
+        future.cancel()
+        return
+    stop.set()
+    try:
+        await asyncio.wait([future])
+    except asyncio.CancelledError:
+        pass
@@ -0,0 +1,352 @@
+"""
+The ``impedance`` command
+
+::
+
+    impedance validate data/*.z --jobs 8 -o linkk.csv
+    impedance fit data/ -c 'R0-p(R1,CPE1)' -g .01 .1 1e-3 .9 -o fits.jsonl
+    impedance fit data/ -m model.json --jobs 8 -o fits.jsonl
+    impedance simulate -m model.json -n 100000 -o synthetic/
+
+Files are given as paths, directories (all files in them) or glob
+patterns. Fits are written with
+:func:`~impedance.models.circuits.checkpoint.resumable_fit`, so running an
+interrupted fit command again continues where it stopped. With
+``--manifest``, only files that changed since the previous run are read
+and fit (see :func:`~impedance.manifest.incremental_fit`). Progress is
+shown on stderr. The exit status is 1 if any file could not be read,
+validated or fit.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from .models.circuits import CustomCircuit
+from .models.circuits.checkpoint import resumable_fit
+from .manifest import incremental_fit
+from .models.circuits.simulation import save_spectra, simulate_spectra
+from .preprocessing import cropFrequencies, ignoreBelowX, readFile
+from .validation import linKK
+
+_INSTRUMENTS = ['gamry', 'autolab', 'parstat', 'zplot', 'versastudio',
+                'powersuite', 'biologic', 'chinstruments']
+
+
+class _Progress:
+    """ a progress line on stderr and a throughput summary """
+    def __init__(self, total, verb, quiet=False, interval=.2):
+        self.total = total
+        self.verb = verb
+        self.quiet = quiet
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._shown = 0
+
+    def update(self, n=1, failed=0):
+        self.done += n
+        self.failed += failed
+        now = time.perf_counter()
+        if not self.quiet and now - self._shown > self.interval:
+            self._shown = now
+            rate = self.done / max(now - self.start, 1e-9)
+            sys.stderr.write(f'\r{self.done}/{self.total} spectra ' +
+                             f'({rate:.1f}/s, {self.failed} failed)')
+            sys.stderr.flush()
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        if not self.quiet:
+            sys.stderr.write(
+                f'\r{self.verb} {self.done} spectra in {elapsed:.1f} s ' +
+                f'({self.done / max(elapsed, 1e-9):.1f} spectra/s), ' +
+                f'{self.failed} failed\n')
+        return 1 if self.failed else 0
+
+
+def _files(patterns):
+    """ sorted files matching paths, directories and glob patterns """
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files += sorted(os.path.join(pattern, name)
+                            for name in os.listdir(pattern)
+                            if not name.startswith('.') and
+                            os.path.isfile(os.path.join(pattern, name)))
+        else:
+            files += sorted(glob.glob(pattern))
+    if not files:
+        raise SystemExit(f'impedance: no files match {" ".join(patterns)}')
+    return files
+
+
+def _read(filename, args):
+    """ reads and preprocesses a file as requested on the command line """
+    f, Z = readFile(filename, instrument=args.instrument)
+    if args.ignore_below_x:
+        f, Z = ignoreBelowX(f, Z)
+    if args.freq_min is not None or args.freq_max is not None:
+        f, Z = cropFrequencies(f, Z, freqmin=args.freq_min or 0,
+                               freqmax=args.freq_max)
+    return f, Z
+
+
+def _model(args):
+    """ the circuit given by --circuit and --guess or by --model """
+    if args.model is not None:
+        circuit = CustomCircuit()
+        try:
+            circuit.load(args.model, fitted_as_initial=True)
+        except (OSError, ValueError, KeyError) as error:
+            raise SystemExit(f'impedance: cannot load {args.model}: ' +
+                             f'{type(error).__name__}: {error}')
+        if not circuit._auto_guess():
+            circuit.initial_guess = list(circuit.initial_guess)
+        return circuit
+    if args.circuit is None or args.guess is None:
+        raise SystemExit('impedance: give either --model or both ' +
+                         '--circuit and --guess')
+    try:
+        constants = json.loads(args.constants) if args.constants else {}
+        return CustomCircuit(args.circuit, initial_guess=args.guess,
+                             constants=constants)
+    except (ValueError, TypeError) as error:
+        raise SystemExit(f'impedance: {error}')
+
+
+def _validate(filename, args):
+    """ row of the validate output for one file """
+    try:
+        f, Z = _read(filename, args)
+        with contextlib.redirect_stdout(io.StringIO()):
+            M, mu, _, res_real, res_imag = linKK(
+                f, Z, c=args.c, max_M=args.max_M, fit_type=args.fit_type,
+                add_cap=args.add_cap)
+    except Exception as error:
+        return [filename, '', '', '', '', f'{type(error).__name__}: {error}']
+    return [filename, M, mu, np.max(np.abs(res_real)),
+            np.max(np.abs(res_imag)), '']
+
+
+def validate(args):
+    files = _files(args.files)
+    progress = _Progress(len(files), 'validated', args.quiet)
+    output = open(args.output, 'w', newline='') if args.output \
+        else sys.stdout
+    try:
+        writer = csv.writer(output)
+        writer.writerow(['file', 'M', 'mu', 'max_res_real', 'max_res_imag',
+                         'error'])
+        with _executor(args.jobs) as executor:
+            for row in executor.map(_validate, files, [args] * len(files),
+                                    chunksize=4):
+                writer.writerow(row)
+                progress.update(failed=bool(row[-1]))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return progress.finish()
+
+
+def fit(args):
+    files = _files(args.files)
+    circuit = _model(args)
+    progress = _Progress(len(files), 'fit', args.quiet)
+
+    def spectra():
+        for filename in files:
+            try:
+                f, Z = _read(filename, args)
+            except Exception as error:
+                sys.stderr.write(f'\nimpedance: cannot read {filename}: ' +
+                                 f'{error}\n')
+                progress.update(failed=1)
+                continue
+            yield f, Z, filename
+
+    def callback(filename, result):
+        progress.update(failed=isinstance(result, Exception))
+
+    kwargs = {'weight_by_modulus': args.weight_by_modulus}
+    if args.global_opt:
+        kwargs.update(global_opt=True, seed=args.seed)
+    if args.manifest is not None:
+        return _fit_incremental(args, files, circuit, progress, callback,
+                                kwargs)
+    try:
+        resumable_fit(circuit, spectra(), args.output, n_jobs=args.jobs,
+                      callback=callback, overwrite=args.overwrite, **kwargs)
+    except FileExistsError:
+        raise SystemExit(f'impedance: {args.output} exists but was not ' +
+                         'written by an interrupted fit, pass --overwrite ' +
+                         'to replace it')
+    return progress.finish()
+
+
+def _fit_incremental(args, files, circuit, progress, callback, kwargs):
+    """ fit with --manifest: only new or changed files are read and fit,
+    and the output is rewritten with the results of all files """
+    results, counts = incremental_fit(
+        circuit, files, args.manifest, instrument=args.instrument,
+        freqmin=args.freq_min, freqmax=args.freq_max,
+        ignore_below_x=args.ignore_below_x, n_jobs=args.jobs,
+        callback=callback, **kwargs)
+    with open(args.output, 'w') as f:
+        for path in files:
+            f.write(json.dumps({'id': path, **results[path]}) + '\n')
+
+    progress.done = len(files)
+    progress.failed = sum('error' in result for result in results.values())
+    if not args.quiet:
+        sys.stderr.write(f'\r{counts["read"]} files read, ' +
+                         f'{counts["fit"]} fit, {counts["reused"]} ' +
+                         f'unchanged, {counts["removed"]} removed\n')
+    return progress.finish()
+
+
+def simulate(args):
+    circuit = _model(args)
+    progress = _Progress(args.n_spectra, 'simulated', args.quiet)
+
+    def chunks():
+        for chunk in simulate_spectra(circuit, args.n_spectra,
+                                      chunk_size=args.chunk_size,
+                                      spread=args.spread,
+                                      proportional=args.noise,
+                                      seed=args.seed):
+            yield chunk
+            progress.update(len(chunk[2]))
+
+    save_spectra(chunks(), args.output, fmt=args.format)
+    return progress.finish()
+
+
+def _executor(jobs):
+    """ a process pool, or a stand-in running in this process """
+    if jobs > 1:
+        return concurrent.futures.ProcessPoolExecutor(jobs)
+    return _Serial()
+
+
+class _Serial:
+    def map(self, function, *iterables, chunksize=1):
+        return map(function, *iterables)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog='impedance',
+        description='Validate, fit and simulate impedance spectra')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    data = argparse.ArgumentParser(add_help=False)
+    data.add_argument('files', nargs='+',
+                      help='files, directories or glob patterns')
+    data.add_argument('--instrument', choices=_INSTRUMENTS,
+                      help='type of the files (default: csv)')
+    data.add_argument('--ignore-below-x', action='store_true',
+                      help='drop points with positive imaginary impedance')
+    data.add_argument('--freq-min', type=float, help='lowest frequency')
+    data.add_argument('--freq-max', type=float, help='highest frequency')
+
+    model = argparse.ArgumentParser(add_help=False)
+    model.add_argument('-c', '--circuit', help="circuit string, e.g. " +
+                       "'R0-p(R1,C1)'")
+    model.add_argument('-g', '--guess', type=float, nargs='+',
+                       help='initial guess of the parameters')
+    model.add_argument('--constants', help='constants as JSON, e.g. ' +
+                       '\'{"R0": 0.01}\'')
+    model.add_argument('-m', '--model', help='model saved with ' +
+                       'BaseCircuit.save (its fitted parameters, if any, ' +
+                       'are the initial guess)')
+
+    quiet = argparse.ArgumentParser(add_help=False)
+    quiet.add_argument('-q', '--quiet', action='store_true',
+                       help='do not show progress')
+    common = argparse.ArgumentParser(add_help=False, parents=[quiet])
+    common.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes (default 1)')
+
+    command = subparsers.add_parser(
+        'validate', parents=[data, common],
+        help='run the Lin-KK test on each file')
+    command.add_argument('-o', '--output', help='CSV file of the results ' +
+                         '(default: stdout)')
+    command.add_argument('--cutoff', dest='c', type=float, default=.85,
+                         help='cutoff of mu (default 0.85)')
+    command.add_argument('--max-M', type=int, default=50,
+                         help='maximum number of RC elements (default 50)')
+    command.add_argument('--fit-type', default='real',
+                         choices=['real', 'imag', 'complex'])
+    command.add_argument('--add-cap', action='store_true',
+                         help='add a series capacitance')
+    command.set_defaults(run=validate)
+
+    command = subparsers.add_parser(
+        'fit', parents=[data, model, common],
+        help='fit a circuit to each file')
+    command.add_argument('-o', '--output', required=True,
+                         help='JSON lines file of the results (an ' +
+                         'interrupted run continues where it stopped)')
+    command.add_argument('--weight-by-modulus', action='store_true')
+    command.add_argument('--global-opt', action='store_true',
+                         help='use basinhopping')
+    command.add_argument('--seed', type=int, default=0,
+                         help='seed of --global-opt (default 0)')
+    command.add_argument('--manifest', help='directory of a manifest of ' +
+                         'previous runs: only new or changed files are ' +
+                         'read and fit, and the output is rewritten')
+    command.add_argument('--overwrite', action='store_true',
+                         help='start over instead of continuing an ' +
+                         'interrupted run or refusing to replace the output')
+    command.set_defaults(run=fit)
+
+    command = subparsers.add_parser(
+        'simulate', parents=[model, quiet],
+        help='write noisy synthetic spectra of a circuit')
+    command.add_argument('-n', '--n-spectra', type=int, required=True)
+    command.add_argument('-o', '--output', required=True,
+                         help='output directory')
+    command.add_argument('--format', choices=['npz', 'csv'], default='npz')
+    command.add_argument('--chunk-size', type=int, default=1000)
+    command.add_argument('--spread', type=float, default=1,
+                         help='decades around the initial guess (default 1)')
+    command.add_argument('--noise', type=float, default=.005,
+                         help='noise relative to |Z| (default 0.005)')
+    command.add_argument('--seed', type=int)
+    command.set_defaults(run=simulate)
+    return parser
+
+
+def main(argv=None):
+    """ Runs the ``impedance`` command
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments. Defaults to sys.argv[1:]
+
+    Returns
+    -------
+    status : int
+        0 on success, 1 if any spectrum failed
+    """
+    args = _parser().parse_args(argv)
+    return args.run(args)
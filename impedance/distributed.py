@@ -0,0 +1,617 @@
+"""
+Batch fitting across several processes or hosts
+
+A :class:`WorkQueue` splits spectra into shards stored in a directory.
+Workers started with :func:`work` claim shards, fit every spectrum of a
+shard with `circuit_fit` and write back the results; a
+:class:`Coordinator` puts the shards of workers that stopped sending
+heartbeats back in the queue and merges the results::
+
+    # on the coordinator
+    queue = WorkQueue.create('refit', circuit, load_spectra('archive'))
+    with Coordinator(queue, address=('0.0.0.0', 5800)) as coordinator:
+        results = coordinator.wait()
+
+    # on each worker host
+    python -c "from impedance.distributed import work; \\
+               work(('coordinator-host', 5800))"
+
+Workers that share the queue's filesystem (e.g. processes on the same
+machine, or hosts with a network filesystem) can instead pass the queue's
+directory to :func:`work`. Shards are claimed by renaming their files,
+which is atomic, so no locking is needed.
+
+The network protocol has no authentication; only run a coordinator on a
+trusted network.
+"""
+
+import io
+import json
+import os
+import re
+import socket
+import socketserver
+import threading
+import time
+
+import numpy as np
+
+from .models.circuits.fitting import circuit_fit
+from .server import _TCPServer, _encode, _recv, _send
+
+__all__ = ['WorkQueue', 'Coordinator', 'work', 'fit_shard']
+
+# pending/shard_00003.a0.npz, running/shard_00003.a0.<worker>.npz
+_SHARD = re.compile(r'shard_(\d+)\.a(\d+)(?:\.(.+))?\.npz$')
+
+
+class WorkQueue:
+    """ A queue of shards of spectra to fit, stored in a directory
+
+    The directory holds the description of the fit (job.json) and one
+    file per shard in pending/, running/, results/ or failed/. Shards
+    whose fit raises an exception or whose worker stops sending
+    heartbeats are retried up to `max_retries` times.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of a queue created with :meth:`WorkQueue.create`
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'job.json')) as f:
+            self.job = json.load(f)
+
+    @classmethod
+    def create(cls, directory, circuit, spectra, shard_size=100,
+               max_retries=2, **kwargs):
+        """ Creates a queue from spectra
+
+        Parameters
+        ----------
+        directory : str
+            New (or empty) directory for the queue
+        circuit : CustomCircuit
+            Circuit to fit, with its initial guess and constants. Only
+            elements of the default registry can be used
+        spectra : iterable or str
+            (frequencies, impedances) of each spectrum, or a directory
+            written by `impedance.models.circuits.simulation.save_spectra`
+        shard_size : int, optional
+            Number of spectra per shard. Defaults to 100
+        max_retries : int, optional
+            Number of times a shard is retried. Defaults to 2
+        kwargs :
+            Keyword arguments passed to `circuit_fit` (JSON serializable)
+
+        Returns
+        -------
+        queue : WorkQueue
+        """
+        if circuit.elements is not None:
+            raise ValueError('circuits with their own element registry ' +
+                             'cannot be fit in a work queue')
+        if circuit.jit:
+            kwargs.setdefault('jit', circuit.jit)
+        if isinstance(spectra, str):
+            spectra = _read_store(spectra)
+
+        for state in ['pending', 'running', 'results', 'failed']:
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+        job = {'circuit': circuit.circuit,
+               'initial_guess': circuit.initial_guess,
+               'constants': circuit.constants,
+               'kwargs': kwargs, 'max_retries': max_retries,
+               'n_spectra': 0, 'n_shards': 0}
+        job = json.loads(json.dumps(job, default=_encode))
+
+        shard = []
+        for index, (frequencies, impedances) in enumerate(spectra):
+            shard.append((index, frequencies, impedances))
+            if len(shard) == shard_size:
+                _write_shard(directory, job, shard)
+        if shard:
+            _write_shard(directory, job, shard)
+
+        # written last, so a queue without job.json is incomplete
+        _atomic_write(os.path.join(directory, 'job.json'),
+                      json.dumps(job).encode())
+        return cls(directory)
+
+    def _path(self, state, name):
+        return os.path.join(self.directory, state, name)
+
+    def claim(self, worker):
+        """ Claims a pending shard
+
+        Parameters
+        ----------
+        worker : str
+            Name of the worker, without '.' or path separators
+
+        Returns
+        -------
+        shard : (name, index, spectra) or None
+            None if no shard is pending. Otherwise, name identifies the
+            claim for `heartbeat`, `complete` and `fail`, index are the
+            indices of the spectra in the queue and spectra their
+            (frequencies, impedances)
+        """
+        for pending in sorted(os.listdir(self._path('pending', ''))):
+            if not _SHARD.match(pending):
+                continue
+            name = pending[:-len('.npz')] + f'.{worker}.npz'
+            try:
+                # touched first, so that the claim is never stale
+                os.utime(self._path('pending', pending))
+                os.rename(self._path('pending', pending),
+                          self._path('running', name))
+                return (name,) + _read_shard(self._path('running', name))
+            except FileNotFoundError:
+                continue  # claimed by another worker, or requeued
+        return None
+
+    def heartbeat(self, name):
+        """ Signals that the worker of a claimed shard is alive
+
+        Returns
+        -------
+        claimed : bool
+            False if the shard has been taken away from the worker
+        """
+        try:
+            os.utime(self._path('running', name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, name, results):
+        """ Stores the results of a claimed shard
+
+        Parameters
+        ----------
+        name : str
+            Name returned by `claim`
+        results : dict
+            Results of the spectra of the shard, as returned by
+            :func:`fit_shard`
+
+        Returns
+        -------
+        completed : bool
+            False if the shard has been taken away from the worker, in
+            which case the results are discarded
+        """
+        # the heartbeat also keeps the claim from going stale while the
+        # results are written
+        if not self.heartbeat(name):
+            return False
+        number = _SHARD.match(name).group(1)
+        path = self._path('results', f'shard_{number}.npz')
+        _atomic_write(path, _npz(results))
+        _remove(self._path('running', name))
+        return True
+
+    def fail(self, name, error):
+        """ Returns a claimed shard to the queue after an error (or marks
+        it as failed after max_retries retries)
+
+        Parameters
+        ----------
+        name : str
+            Name returned by `claim`
+        error : str
+            Description of the error
+        """
+        self._retry(name, error)
+
+    def _retry(self, name, error):
+        number, attempt, _ = _SHARD.match(name).groups()
+        attempt = int(attempt) + 1
+        if attempt > self.job['max_retries']:
+            target = self._path('failed', f'shard_{number}.npz')
+            _atomic_write(target[:-len('.npz')] + '.txt', error.encode())
+        else:
+            target = self._path('pending', f'shard_{number}.a{attempt}.npz')
+        try:
+            os.rename(self._path('running', name), target)
+        except FileNotFoundError:
+            pass  # completed or requeued in the meantime
+
+    def requeue_stale(self, timeout):
+        """ Returns shards whose worker has not sent a heartbeat for
+        `timeout` seconds to the queue
+
+        Returns
+        -------
+        names : list of str
+            Claims that were requeued
+        """
+        stale = []
+        now = time.time()
+        for name in os.listdir(self._path('running', '')):
+            try:
+                age = now - os.path.getmtime(self._path('running', name))
+            except FileNotFoundError:
+                continue
+            if age > timeout:
+                self._retry(name, f'no heartbeat for {age:.0f} s from ' +
+                            f'worker {_SHARD.match(name).group(3)}')
+                stale.append(name)
+        return stale
+
+    def status(self):
+        """ Number of shards in each state
+
+        Returns
+        -------
+        status : dict
+            Maps 'pending', 'running', 'results' and 'failed' to counts
+        """
+        return {state: len([name for name in os.listdir(
+                    self._path(state, '')) if name.endswith('.npz')])
+                for state in ['pending', 'running', 'results', 'failed']}
+
+    def done(self):
+        """ Whether every shard has results or has failed """
+        status = self.status()
+        return status['pending'] == 0 and status['running'] == 0
+
+    def results(self):
+        """ Merges the results of all shards
+
+        Spectra of failed shards have NaN parameters and the error of
+        their shard.
+
+        Returns
+        -------
+        results : dict of numpy arrays
+            'parameters' and 'conf' (n_spectra, n_params), 'cost',
+            'converged' and 'error' (n_spectra,), ordered like the
+            spectra. Spectra whose fit raised an exception have NaN
+            parameters and a non-empty 'error'
+        """
+        n_spectra = self.job['n_spectra']
+        n_params = len(self.job['initial_guess'])
+        merged = _empty_results(n_spectra, n_params)
+        for name in os.listdir(self._path('results', '')):
+            with np.load(self._path('results', name)) as data:
+                for key in merged:
+                    merged[key][data['index']] = data[key]
+        for name in os.listdir(self._path('failed', '')):
+            if name.endswith('.npz'):
+                index, _ = _read_shard(self._path('failed', name))
+                with open(self._path('failed', name[:-4] + '.txt')) as f:
+                    merged['error'][index] = f'shard failed: {f.read()}'
+        merged['error'] = merged['error'].astype(str)
+        return merged
+
+
+class Coordinator:
+    """ Supervises a WorkQueue, optionally serving it over TCP
+
+    Parameters
+    ----------
+    queue : WorkQueue
+        Queue to supervise
+    address : (str, int), optional
+        (host, port) to serve the queue on for workers that do not share
+        its filesystem. Port 0 picks a free port (see `address` after
+        construction). Defaults to None (no server)
+    timeout : float, optional
+        Seconds without a heartbeat after which a worker is considered
+        dead and its shard is requeued. Defaults to 60
+    """
+    def __init__(self, queue, address=None, timeout=60):
+        self.queue = queue
+        self.timeout = timeout
+        self.address = None
+        self._server = None
+        self._thread = None
+        if address is not None:
+            self._server = _TCPServer(address, _Handler)
+            self._server.queue = queue
+            self.address = self._server.server_address
+            self._thread = threading.Thread(
+                target=self._server.serve_forever, daemon=True)
+            self._thread.start()
+
+    def wait(self, poll=1, callback=None):
+        """ Requeues the shards of dead workers until all shards are done
+
+        Parameters
+        ----------
+        poll : float, optional
+            Seconds between checks. Defaults to 1
+        callback : callable, optional
+            Called as callback(status) after each check, with the output of
+            `WorkQueue.status`
+
+        Returns
+        -------
+        results : dict of numpy arrays
+            Merged results (see `WorkQueue.results`)
+        """
+        while True:
+            self.queue.requeue_stale(self.timeout)
+            if callback is not None:
+                callback(self.queue.status())
+            if self.queue.done():
+                return self.queue.results()
+            time.sleep(poll)
+
+    def shutdown(self):
+        """ Stops serving the queue """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """ answers the requests of one remote worker """
+    def handle(self):
+        queue = self.server.queue
+        while True:
+            message = _recv(self.request)
+            if message is None:
+                return
+            header, arrays = message
+            op = header['op']
+            reply, data = {}, []
+            try:
+                if op == 'job':
+                    reply = {'job': queue.job}
+                elif op == 'claim':
+                    shard = queue.claim(header['worker'])
+                    if shard is None:
+                        reply = {'name': None, 'done': queue.done()}
+                    else:
+                        name, index, spectra = shard
+                        reply = {'name': name}
+                        data = [index] + [a for s in spectra for a in s]
+                elif op == 'heartbeat':
+                    reply = {'claimed': queue.heartbeat(header['name'])}
+                elif op == 'complete':
+                    results = dict(zip(_RESULTS, arrays))
+                    results['error'] = np.array(header['error'])
+                    reply = {'completed': queue.complete(header['name'],
+                                                         results)}
+                elif op == 'fail':
+                    queue.fail(header['name'], header['error'])
+                else:
+                    raise ValueError(f'unknown operation {op!r}')
+            except Exception as error:
+                reply = {'error': f'{type(error).__name__}: {error}'}
+            _send(self.request, reply, data)
+
+
+class _RemoteQueue:
+    """ the WorkQueue interface used by workers, over TCP """
+    def __init__(self, address):
+        self._socket = socket.create_connection(tuple(address))
+        self._lock = threading.Lock()
+        self._done = False
+        self.job = self._request({'op': 'job'})[0]['job']
+
+    def _request(self, header, arrays=()):
+        with self._lock:
+            _send(self._socket, header, arrays)
+            reply = _recv(self._socket)
+        if reply is None:
+            raise ConnectionError('the coordinator closed the connection')
+        if 'error' in reply[0]:
+            raise RuntimeError(f'coordinator error: {reply[0]["error"]}')
+        return reply
+
+    def claim(self, worker):
+        reply, arrays = self._request({'op': 'claim', 'worker': worker})
+        if reply['name'] is None:
+            self._done = reply['done']
+            return None
+        spectra = list(zip(arrays[1::2], arrays[2::2]))
+        return reply['name'], arrays[0], spectra
+
+    def heartbeat(self, name):
+        return self._request({'op': 'heartbeat', 'name': name})[0]['claimed']
+
+    def complete(self, name, results):
+        reply, _ = self._request({'op': 'complete', 'name': name,
+                                  'error': [str(e) for e in
+                                            results['error']]},
+                                 [results[key] for key in _RESULTS])
+        return reply['completed']
+
+    def fail(self, name, error):
+        self._request({'op': 'fail', 'name': name, 'error': error})
+
+    def done(self):
+        return self._done
+
+    def close(self):
+        self._socket.close()
+
+
+def work(queue, worker=None, heartbeat=10, poll=1, wait=True):
+    """ Fits shards from a queue until all shards are done
+
+    Parameters
+    ----------
+    queue : WorkQueue, str or (str, int)
+        Queue, directory of a queue on a shared filesystem, or (host, port)
+        of a :class:`Coordinator` serving it
+    worker : str, optional
+        Name of the worker. Defaults to '<hostname>-<pid>'
+    heartbeat : float, optional
+        Seconds between heartbeats while fitting a shard (keep it well
+        below the coordinator's timeout). Defaults to 10
+    poll : float, optional
+        Seconds between checks for new shards when none are pending but
+        some are still running (and could be requeued). Defaults to 1
+    wait : bool, optional
+        Whether to keep waiting while shards are running elsewhere, or to
+        return as soon as no shard is pending. Defaults to True
+
+    Returns
+    -------
+    n_shards : int
+        Number of shards fitted by this worker
+    """
+    if isinstance(queue, str):
+        queue = WorkQueue(queue)
+    elif not isinstance(queue, WorkQueue):
+        queue = _RemoteQueue(queue)
+    if worker is None:
+        worker = f'{socket.gethostname()}-{os.getpid()}'
+    worker = re.sub(r'[./\\]', '_', worker)
+
+    n_shards = 0
+    try:
+        while True:
+            shard = queue.claim(worker)
+            if shard is None:
+                if not wait or queue.done():
+                    return n_shards
+                time.sleep(poll)
+                continue
+            name, index, spectra = shard
+
+            stop = threading.Event()
+            beat = threading.Thread(target=_beat,
+                                    args=(queue, name, heartbeat, stop),
+                                    daemon=True)
+            beat.start()
+            try:
+                results = fit_shard(queue.job, index, spectra)
+            except Exception as error:
+                queue.fail(name, f'{type(error).__name__}: {error}')
+                continue
+            finally:
+                stop.set()
+                beat.join()
+            if queue.complete(name, results):
+                n_shards += 1
+    finally:
+        if isinstance(queue, _RemoteQueue):
+            queue.close()
+
+
+def _beat(queue, name, interval, stop):
+    """ sends heartbeats for a shard until stop is set """
+    while not stop.wait(interval):
+        if not queue.heartbeat(name):
+            return
+
+
+def fit_shard(job, index, spectra):
+    """ Fits the spectra of a shard
+
+    Parameters
+    ----------
+    job : dict
+        Description of the fit ('circuit', 'initial_guess', 'constants'
+        and 'kwargs' of `circuit_fit`)
+    index : numpy array of int
+        Indices of the spectra in the queue
+    spectra : list of (frequencies, impedances)
+
+    Returns
+    -------
+    results : dict of numpy arrays
+        'index', and 'parameters', 'conf', 'cost', 'converged' and
+        'error' of each spectrum. A spectrum whose fit raises an
+        exception has NaN parameters and the exception in 'error'
+    """
+    results = _empty_results(len(index), len(job['initial_guess']))
+    results['index'] = np.asarray(index)
+    for i, (frequencies, impedances) in enumerate(spectra):
+        try:
+            popt, perror, info = circuit_fit(
+                frequencies, impedances, job['circuit'],
+                job['initial_guess'], constants=job['constants'],
+                full_output=True, **job['kwargs'])
+        except Exception as error:
+            results['error'][i] = f'{type(error).__name__}: {error}'
+            continue
+        results['parameters'][i] = popt
+        if perror is not None:
+            results['conf'][i] = perror
+        results['cost'][i] = info.cost
+        results['converged'][i] = info.converged
+    results['error'] = results['error'].astype(str)
+    return results
+
+
+_RESULTS = ['index', 'parameters', 'conf', 'cost', 'converged']
+
+
+def _empty_results(n_spectra, n_params):
+    return {'parameters': np.full((n_spectra, n_params), np.nan),
+            'conf': np.full((n_spectra, n_params), np.nan),
+            'cost': np.full(n_spectra, np.nan),
+            'converged': np.zeros(n_spectra, dtype=bool),
+            'error': np.full(n_spectra, '', dtype=object)}
+
+
+def _read_store(directory):
+    """ (frequencies, impedances) of each spectrum of a store written by
+    save_spectra """
+    from .models.circuits.simulation import load_spectra
+
+    for frequencies, _, impedances in load_spectra(directory):
+        for spectrum in impedances:
+            yield frequencies, spectrum
+
+
+def _write_shard(directory, job, shard):
+    """ writes a shard to pending/ and empties the list """
+    index = np.array([i for i, _, _ in shard])
+    arrays = {'index': index}
+    for k, (_, frequencies, impedances) in enumerate(shard):
+        arrays[f'frequencies_{k}'] = np.asarray(frequencies, dtype=float)
+        arrays[f'impedances_{k}'] = np.asarray(impedances, dtype=complex)
+    path = os.path.join(directory, 'pending',
+                        f'shard_{job["n_shards"]:05d}.a0.npz')
+    _atomic_write(path, _npz(arrays))
+    job['n_shards'] += 1
+    job['n_spectra'] += len(shard)
+    shard.clear()
+
+
+def _read_shard(path):
+    """ index and (frequencies, impedances) of the spectra of a shard """
+    with np.load(path) as data:
+        index = data['index']
+        spectra = [(data[f'frequencies_{k}'], data[f'impedances_{k}'])
+                   for k in range(len(index))]
+    return index, spectra
+
+
+def _npz(arrays):
+    """ contents of an .npz file of arrays """
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _atomic_write(path, data):
+    """ writes a file so that readers never see it partially written """
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
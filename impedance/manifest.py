@@ -0,0 +1,227 @@
+"""
+Incremental processing of data directories
+
+A :class:`Manifest` remembers, for each file processed, its size,
+modification time and content hash, the arrays parsed from it and the
+result of its fit. :func:`incremental_fit` uses it to only read files
+that are new or changed and to only fit spectra whose data, circuit or
+options changed, so re-processing a large, mostly unchanged directory
+takes little more than listing it::
+
+    manifest = Manifest('data/.manifest')
+    results, counts = incremental_fit(circuit, glob.glob('data/*.DTA'),
+                                      manifest, instrument='gamry',
+                                      n_jobs=8)
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .models.circuits.checkpoint import _fingerprint, _summary
+from .models.circuits.streaming import iter_fit
+from .pipeline import clean
+from .preprocessing import readFile
+
+__all__ = ['Manifest', 'incremental_fit']
+
+
+class Manifest:
+    """ Records of processed files, stored in a directory
+
+    The directory holds manifest.json, which maps each path to its
+    'size', 'mtime_ns', 'sha256', the 'instrument' it was read as, any
+    'read_error', and the 'fit_key' and 'result' of its last fit, and a
+    cache/ of the parsed arrays of each distinct file content.
+
+    A file whose size and modification time are unchanged is assumed to
+    be unchanged. Otherwise its hash is compared, so files that are only
+    touched or copied are not read again.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the manifest, created if needed
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'cache'), exist_ok=True)
+        path = os.path.join(directory, 'manifest.json')
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def _cache(self, sha256):
+        return os.path.join(self.directory, 'cache', f'{sha256}.npz')
+
+    def read(self, path, instrument=None):
+        """ Reads a file, or its cached arrays if it has not changed
+
+        Parameters
+        ----------
+        path : str
+            File to read with `readFile`
+        instrument : str, optional
+            Passed to `readFile`
+
+        Returns
+        -------
+        entry : dict
+            Entry of the file in the manifest. If the file changed, its
+            fit 'result' is reset to None
+        arrays : (frequencies, impedances) or None
+            None if the file could not be read (see entry['read_error'])
+        changed : bool
+            Whether the file was read (new, changed or read with another
+            instrument) rather than taken from the cache
+        """
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        same_reader = entry is not None and \
+            entry['instrument'] == instrument
+        if same_reader and entry['size'] == stat.st_size and \
+                entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry, self._load(entry), False
+
+        sha256 = _hash(path)
+        if same_reader and entry['sha256'] == sha256:
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            return entry, self._load(entry), False
+
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                 'sha256': sha256, 'instrument': instrument,
+                 'read_error': None, 'fit_key': None, 'result': None}
+        self.entries[path] = entry
+        try:
+            f, Z = readFile(path, instrument=instrument)
+        except Exception as error:
+            entry['read_error'] = f'{type(error).__name__}: {error}'
+            return entry, None, True
+        f, Z = np.asarray(f, dtype=float), np.asarray(Z, dtype=complex)
+        np.savez(self._cache(sha256), frequencies=f, impedances=Z)
+        return entry, (f, Z), True
+
+    def _load(self, entry):
+        if entry['read_error'] is not None:
+            return None
+        with np.load(self._cache(entry['sha256'])) as data:
+            return data['frequencies'], data['impedances']
+
+    def forget(self, keep):
+        """ Removes the entries of files not in `keep`
+
+        Returns
+        -------
+        removed : list of str
+            Paths removed from the manifest
+        """
+        keep = set(keep)
+        removed = [path for path in self.entries if path not in keep]
+        for path in removed:
+            del self.entries[path]
+        return removed
+
+    def save(self):
+        """ Writes the manifest and deletes cached arrays that no entry
+        refers to """
+        path = os.path.join(self.directory, 'manifest.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(path + '.tmp', path)
+
+        used = {entry['sha256'] + '.npz' for entry in self.entries.values()}
+        cache = os.path.join(self.directory, 'cache')
+        for name in os.listdir(cache):
+            if name not in used:
+                os.remove(os.path.join(cache, name))
+
+
+def _hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def incremental_fit(circuit, files, manifest, instrument=None, freqmin=None,
+                    freqmax=None, ignore_below_x=False, n_jobs=1,
+                    callback=None, **kwargs):
+    """ Fits the files that are new or changed since the last run
+
+    A spectrum is fit again if its file changed or if the circuit, initial
+    guess, constants, cleaning options or fit options differ from its last
+    fit; otherwise its last result is reused. Files that are no longer in
+    `files` are removed from the manifest, which is saved at the end (also
+    if the run is interrupted).
+
+    Parameters
+    ----------
+    circuit : CustomCircuit
+        Circuit to fit, with its initial guess and constants
+    files : list of str
+        Files to process
+    manifest : Manifest or str
+        Manifest, or the directory of one
+    instrument : str, optional
+        Passed to `readFile`
+    freqmin, freqmax, ignore_below_x : optional
+        Cropping of the spectra before fitting (see `pipeline.clean`)
+    n_jobs : int, optional
+        Number of worker processes for fitting (see `iter_fit`)
+    callback : callable, optional
+        Called as callback(path, result) after each new fit, with the
+        FitResult or the exception raised by the fit
+    kwargs :
+        Keyword arguments passed to `circuit_fit`
+
+    Returns
+    -------
+    results : dict
+        Maps each path to a summary of its fit: 'parameters', 'conf',
+        'cost', 'converged' and 'message', or 'error'
+    counts : dict
+        Number of files 'read' (new or changed), 'fit', 'reused' (neither
+        read nor fit) and 'removed' from the manifest
+    """
+    if isinstance(manifest, str):
+        manifest = Manifest(manifest)
+    files = list(files)
+    options = {'freqmin': freqmin, 'freqmax': freqmax,
+               'ignore_below_x': ignore_below_x}
+    fit_key = hashlib.sha256(json.dumps(
+        [_fingerprint(circuit, kwargs), options],
+        sort_keys=True).encode()).hexdigest()
+    counts = {'read': 0, 'fit': 0, 'reused': 0,
+              'removed': len(manifest.forget(files))}
+
+    def todo():
+        for path in files:
+            entry, arrays, changed = manifest.read(path, instrument)
+            counts['read'] += changed
+            if entry['read_error'] is not None:
+                entry['result'] = {'error': entry['read_error']}
+                continue
+            if entry['fit_key'] == fit_key and entry['result'] is not None:
+                counts['reused'] += 1
+                continue
+            record = clean({'frequencies': arrays[0],
+                            'impedances': arrays[1]}, **options)
+            yield record['frequencies'], record['impedances'], path
+
+    try:
+        for path, result in iter_fit(circuit, todo(), n_jobs=n_jobs,
+                                     errors='yield', **kwargs):
+            entry = manifest.entries[path]
+            entry.update(fit_key=fit_key, result=_summary(result))
+            counts['fit'] += 1
+            if callback is not None:
+                callback(path, result)
+    finally:
+        manifest.save()
+
+    results = {path: manifest.entries[path]['result'] for path in files}
+    return results, counts
@@ -0,0 +1,407 @@
+"""
+Methods for fitting many impedance spectra at once
+"""
+
+import warnings
+
+import numpy as np
+from scipy.optimize import least_squares
+from scipy.sparse import lil_matrix
+
+from .compiler import CompiledCircuit
+from .fitting import set_default_bounds
+
+EPS = np.finfo(float).eps
+
+
+def batch_circuit_fit(frequencies, impedances, circuit, initial_guess,
+                      constants={}, bounds=None, weight_by_modulus=False,
+                      sigma=None, maxiter=500, ftol=1e-13, xtol=1e-8,
+                      jac='2-point', elements=None):
+    """ Fits one equivalent circuit to many spectra simultaneously
+
+    All spectra share the circuit and the frequency grid. Instead of
+    running one `scipy.optimize.curve_fit` per spectrum, a bounded
+    Levenberg-Marquardt iteration is run in lock-step on an
+    (n_spectra, n_params) state: residuals and Jacobians for every spectrum
+    are evaluated in one vectorized call and the small normal equations are
+    solved with a batched `numpy.linalg.solve`. Each spectrum is frozen as
+    soon as it converges so the remaining work shrinks with the batch.
+
+    Parameters
+    -----------------
+    frequencies : numpy array, shape (n_freq,)
+        Frequencies shared by all spectra
+
+    impedances : numpy array of dtype 'complex128', shape (n_spectra, n_freq)
+        Impedances, one spectrum per row
+
+    circuit : string
+        String defining the equivalent circuit to be fit
+
+    initial_guess : array_like, shape (n_params,) or (n_spectra, n_params)
+        Initial guesses for the fit parameters, either shared by all spectra
+        or given per spectrum
+
+    constants : dictionary, optional
+        Parameters and their values to hold constant during fitting
+        (e.g. {"RO": 0.1}). Defaults to {}
+
+    bounds : 2-tuple of array_like, optional
+        Lower and upper bounds on parameters. Defaults to bounds on all
+        parameters of 0 and np.inf, except the CPE alpha
+        which has an upper bound of 1
+
+    weight_by_modulus : bool, optional
+        Uses the modulus of each data (|Z|) as the weighting factor.
+
+    sigma : array_like, shape (2 * n_freq,) or (n_spectra, 2 * n_freq)
+        Uncertainty of the stacked (real, imaginary) data, as in
+        `scipy.optimize.curve_fit`. Ignored if weight_by_modulus is True
+
+    maxiter : int, optional
+        Maximum number of iterations. Defaults to 500
+
+    ftol : float, optional
+        Tolerance on the relative change of the cost. Defaults to 1e-13
+
+    xtol : float, optional
+        Tolerance on the relative size of the step. Defaults to 1e-8
+
+    jac : {'2-point', 'dual'}, optional
+        How Jacobians are computed: by forward differences ('2-point') or
+        exactly with dual numbers ('dual'), which needs one circuit
+        evaluation per iteration instead of n_params + 1. Falls back to
+        '2-point' with a warning if an element does not support dual
+        numbers. Defaults to '2-point'
+
+    elements : ElementRegistry, optional
+        Registry to look up the circuit's elements in. Defaults to the
+        default registry
+
+    Returns
+    ------------
+    p_values : numpy array, shape (n_spectra, n_params)
+        best fit parameters for each spectrum
+
+    p_errors : numpy array, shape (n_spectra, n_params)
+        one standard deviation error estimates for fit parameters
+
+    converged : numpy array of bool, shape (n_spectra,)
+        whether each spectrum met a convergence criterion within maxiter.
+        Spectra whose iteration stalls (a rejected step too small to
+        continue, or a damping factor above 1e16) are not converged
+    """
+    f = np.array(frequencies, dtype=float)
+    Z = np.atleast_2d(np.array(impedances, dtype=complex))
+    n_spectra, n_freq = Z.shape
+    if f.shape != (n_freq,):
+        raise ValueError('length of frequencies and impedances do not match')
+    if not np.isfinite(f).all():
+        raise ValueError('frequencies contain non-finite values')
+    bad = np.flatnonzero(~np.isfinite(Z).all(axis=1))
+    if bad.size:
+        raise ValueError('impedances contain non-finite values in spectra ' +
+                         f'{bad.tolist()}')
+
+    model = CompiledCircuit(circuit, constants, elements=elements)
+    n_params = model.num_params
+    x = np.array(np.broadcast_to(np.array(initial_guess, dtype=float),
+                                 (n_spectra, n_params)))
+
+    if bounds is None:
+        bounds = set_default_bounds(circuit, constants=constants,
+                                    elements=elements)
+    lb = np.broadcast_to(np.array(bounds[0], dtype=float), (n_params,))
+    ub = np.broadcast_to(np.array(bounds[1], dtype=float), (n_params,))
+    if np.any((x < lb) | (x > ub)):
+        raise ValueError('initial_guess is outside of the bounds')
+
+    data = np.hstack([Z.real, Z.imag])
+    if weight_by_modulus:
+        weights = 1 / np.hstack([np.abs(Z), np.abs(Z)])
+    elif sigma is not None:
+        weights = 1 / np.broadcast_to(np.array(sigma, dtype=float),
+                                      data.shape)
+    else:
+        weights = np.ones_like(data)
+
+    def residuals(x, rows):
+        Z_fit = model(f, x)
+        return (np.hstack([Z_fit.real, Z_fit.imag]) - data[rows]) * \
+            weights[rows]
+
+    def jacobian(x, r, rows):
+        if jac == 'dual':
+            _, J = model.jacobian(f, x)
+            return np.concatenate([J.real, J.imag], axis=1) * \
+                weights[rows, :, None]
+        return _jacobian(residuals, x, r, rows, lb, ub)
+
+    if jac not in ['2-point', 'dual']:
+        raise ValueError("jac must be one of '2-point' or 'dual' " +
+                         f"(received {jac})")
+    if jac == 'dual':
+        try:
+            model.jacobian(f, x)
+        except TypeError as error:
+            warnings.warn(f'{error}, using finite differences instead')
+            jac = '2-point'
+
+    rows = np.arange(n_spectra)
+    r = residuals(x, rows)
+    cost = 0.5 * np.sum(r**2, axis=1)
+    lam = np.full(n_spectra, 1e-3)
+    converged = np.zeros(n_spectra, dtype=bool)
+
+    # only spectra in `active` take part in an iteration; the Jacobian is
+    # recomputed only for those whose parameters moved in the last step
+    active = np.arange(n_spectra)
+    J = np.empty((n_spectra, 2 * n_freq, n_params))
+    stale = np.ones(n_spectra, dtype=bool)
+
+    with np.errstate(all='ignore'):
+        for _ in range(maxiter):
+            if active.size == 0:
+                break
+
+            update = active[stale[active]]
+            if update.size:
+                J[update] = jacobian(x[update], r[update], update)
+                stale[update] = False
+
+            Ja, ra, xa = J[active], r[active], x[active]
+            JTJ = np.einsum('nmk,nml->nkl', Ja, Ja)
+            g = np.einsum('nmk,nm->nk', Ja, ra)
+            diag = np.diagonal(JTJ, axis1=1, axis2=2)
+            diag = np.where(diag > 0, diag, 1)
+            A = JTJ + lam[active, None, None] * \
+                (diag[:, :, None] * np.eye(n_params))
+            step = _solve(A, -g)
+
+            trial = _project(xa, xa + step, lb, ub)
+            r_trial = residuals(trial, active)
+            cost_trial = 0.5 * np.sum(r_trial**2, axis=1)
+
+            accepted = cost_trial < cost[active]
+            # as in MINPACK, the cost has converged once neither the actual
+            # nor the reduction predicted by the linear model exceed ftol
+            predicted = -np.einsum('nk,nk->n', g, step) - 0.5 * \
+                np.einsum('nk,nkl,nl->n', step, JTJ, step)
+            small_cost = (np.abs(cost[active] - cost_trial) <=
+                          ftol * cost[active]) & \
+                (predicted <= ftol * cost[active])
+            dx = np.linalg.norm(trial - xa, axis=1)
+            small_step = dx < xtol * (xtol + np.linalg.norm(xa, axis=1))
+
+            moved = active[accepted]
+            x[moved] = trial[accepted]
+            r[moved] = r_trial[accepted]
+            cost[moved] = cost_trial[accepted]
+            stale[moved] = True
+            lam[moved] = np.maximum(lam[moved] / 10, 1e-12)
+            rejected = active[~accepted]
+            lam[rejected] = lam[rejected] * 10
+
+            # an exploding damping factor or a rejected small step that
+            # does not meet the cost criterion means the spectrum stalled,
+            # which ends its iteration unconverged
+            stalled = lam[active] > 1e16
+            success = ~stalled & (small_cost | (accepted & small_step) |
+                                  (cost[active] == 0))
+            stalled |= ~accepted & small_step
+            converged[active[success]] = True
+            active = active[~(success | stalled)]
+
+        # covariance from the Jacobian at the solution, scaled by the
+        # residual variance as in scipy.optimize.curve_fit
+        update = np.arange(n_spectra)[stale]
+        if update.size:
+            J[update] = jacobian(x[update], r[update], update)
+        JTJ = np.einsum('nmk,nml->nkl', J, J)
+        dof = max(2 * n_freq - n_params, 1)
+        pcov = np.linalg.pinv(JTJ) * (2 * cost / dof)[:, None, None]
+        perror = np.sqrt(np.diagonal(pcov, axis1=1, axis2=2))
+
+    if not converged.all():
+        warnings.warn(f'{np.sum(~converged)} of {n_spectra} spectra did ' +
+                      f'not converge (they stalled or reached {maxiter} ' +
+                      'iterations)')
+
+    return x, perror, converged
+
+
+def joint_circuit_fit(frequencies, impedances, circuit, initial_guess,
+                      shared=[], constants={}, bounds=None,
+                      weight_by_modulus=False, elements=None, **kwargs):
+    """ Fits one equivalent circuit to a series of spectra with some
+    parameters shared by all spectra
+
+    Useful for temperature or state-of-charge series where, for example,
+    the ohmic resistance or a CPE exponent is physically the same in every
+    spectrum. All spectra are fit in a single
+    `scipy.optimize.least_squares` problem whose Jacobian is block sparse:
+    residuals of spectrum i depend only on the shared parameters and on
+    the parameters of spectrum i. The sparsity pattern is passed as
+    `jac_sparsity`, keeping fits of hundreds of spectra tractable.
+
+    Parameters
+    -----------------
+    frequencies : numpy array or list of numpy arrays
+        Frequencies shared by all spectra, or one array per spectrum
+
+    impedances : list of numpy arrays of dtype 'complex128'
+        Impedances of each spectrum (or a 2D array with one spectrum per row)
+
+    circuit : string
+        String defining the equivalent circuit to be fit
+
+    initial_guess : array_like, shape (n_params,) or (n_spectra, n_params)
+        Initial guesses for the fit parameters, either shared by all spectra
+        or given per spectrum (shared parameters start from their mean)
+
+    shared : list of str, optional
+        Names of the parameters shared by all spectra, as returned by
+        `get_param_names` (e.g. ['R0', 'CPE1_1']). Defaults to []
+
+    constants : dictionary, optional
+        Parameters and their values to hold constant during fitting
+        (e.g. {"RO": 0.1}). Defaults to {}
+
+    bounds : 2-tuple of array_like, optional
+        Lower and upper bounds on the circuit parameters. Defaults to bounds
+        on all parameters of 0 and np.inf, except the CPE alpha
+        which has an upper bound of 1
+
+    weight_by_modulus : bool, optional
+        Uses the modulus of each data (|Z|) as the weighting factor.
+
+    elements : ElementRegistry, optional
+        Registry to look up the circuit's elements in. Defaults to the
+        default registry
+
+    kwargs :
+        Keyword arguments passed to scipy.optimize.least_squares
+
+    Returns
+    ------------
+    p_values : numpy array, shape (n_spectra, n_params)
+        best fit parameters for each spectrum (shared parameters are
+        repeated in every row)
+
+    p_errors : numpy array, shape (n_spectra, n_params)
+        one standard deviation error estimates for fit parameters
+    """
+    Z = [np.array(Z_i, dtype=complex) for Z_i in impedances]
+    n_spectra = len(Z)
+    if np.ndim(frequencies[0]) == 0:
+        f = [np.array(frequencies, dtype=float)] * n_spectra
+    else:
+        f = [np.array(f_i, dtype=float) for f_i in frequencies]
+    if len(f) != n_spectra or \
+            any(len(f_i) != len(Z_i) for f_i, Z_i in zip(f, Z)):
+        raise ValueError('length of frequencies and impedances do not match')
+
+    model = CompiledCircuit(circuit, constants, elements=elements)
+    n_params = model.num_params
+    for name in shared:
+        if name not in model.param_names:
+            raise ValueError(f'shared parameter {name} is not a fit ' +
+                             f'parameter of {circuit}')
+    is_shared = np.array([name in shared for name in model.param_names],
+                         dtype=bool)
+    n_shared, n_local = is_shared.sum(), (~is_shared).sum()
+
+    guess = np.broadcast_to(np.array(initial_guess, dtype=float),
+                            (n_spectra, n_params))
+    x0 = np.hstack([guess[:, is_shared].mean(axis=0),
+                    guess[:, ~is_shared].ravel()])
+
+    if bounds is None:
+        bounds = set_default_bounds(circuit, constants=constants,
+                                    elements=elements)
+    lb = np.broadcast_to(np.array(bounds[0], dtype=float), (n_params,))
+    ub = np.broadcast_to(np.array(bounds[1], dtype=float), (n_params,))
+    lb = np.hstack([lb[is_shared], np.tile(lb[~is_shared], n_spectra)])
+    ub = np.hstack([ub[is_shared], np.tile(ub[~is_shared], n_spectra)])
+
+    data = [np.hstack([Z_i.real, Z_i.imag]) for Z_i in Z]
+    if weight_by_modulus:
+        weights = [1 / np.hstack([np.abs(Z_i), np.abs(Z_i)]) for Z_i in Z]
+    else:
+        weights = [np.ones_like(d) for d in data]
+    same_grid = all(f_i is f[0] for f_i in f)
+
+    def unpack(x):
+        params = np.empty((n_spectra, n_params))
+        params[:, is_shared] = x[:n_shared]
+        params[:, ~is_shared] = x[n_shared:].reshape(n_spectra, n_local)
+        return params
+
+    def residuals(x):
+        params = unpack(x)
+        if same_grid:
+            Z_fit = model(f[0], params)
+        else:
+            Z_fit = [model(f_i, p_i) for f_i, p_i in zip(f, params)]
+        return np.hstack([(np.hstack([Z_i.real, Z_i.imag]) - d) * w
+                          for Z_i, d, w in zip(Z_fit, data, weights)])
+
+    # residuals of spectrum i depend on the shared parameters and on the
+    # i-th block of local parameters only
+    n_rows = [len(d) for d in data]
+    sparsity = lil_matrix((sum(n_rows), len(x0)), dtype=int)
+    start = 0
+    for i, n in enumerate(n_rows):
+        sparsity[start:start + n, :n_shared] = 1
+        columns = slice(n_shared + i * n_local, n_shared + (i + 1) * n_local)
+        sparsity[start:start + n, columns] = 1
+        start += n
+
+    if 'ftol' not in kwargs:
+        kwargs['ftol'] = 1e-13
+    result = least_squares(residuals, x0, jac_sparsity=sparsity,
+                           bounds=(lb, ub), method='trf', **kwargs)
+    if not result.success:
+        warnings.warn(f'joint fit did not converge: {result.message}')
+
+    # covariance as in scipy.optimize.curve_fit, from the sparse Jacobian
+    J = result.jac
+    JTJ = (J.T @ J).toarray() if hasattr(J, 'toarray') else J.T @ J
+    dof = max(len(result.fun) - len(x0), 1)
+    pcov = np.linalg.pinv(JTJ) * (2 * result.cost / dof)
+    perror = np.sqrt(np.abs(np.diag(pcov)))
+
+    return unpack(result.x), unpack(perror)
+
+
+def _jacobian(residuals, x, r0, rows, lb, ub):
+    """ Forward-difference Jacobian of the residuals of a batch
+
+    Uses the same relative step as `scipy.optimize.least_squares` and steps
+    backwards when a forward step would leave the bounds.
+    """
+    h = EPS**0.5 * np.maximum(1.0, np.abs(x))
+    h = np.where(x + h > ub, -h, h)
+    J = np.empty(r0.shape + (x.shape[1],))
+    for j in range(x.shape[1]):
+        x_h = x.copy()
+        x_h[:, j] += h[:, j]
+        J[:, :, j] = (residuals(x_h, rows) - r0) / h[:, j, None]
+    return J
+
+
+def _solve(A, b):
+    """ Solves a stack of small linear systems """
+    try:
+        return np.linalg.solve(A, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        return np.einsum('nkl,nl->nk', np.linalg.pinv(A), b)
+
+
+def _project(x, trial, lb, ub):
+    """ Keeps trial points strictly feasible by moving any coordinate that
+    crosses a bound halfway from its current value to that bound """
+    trial = np.where(trial < lb, lb + 0.5 * (x - lb), trial)
+    trial = np.where(trial > ub, ub - 0.5 * (ub - x), trial)
+    return trial
@@ -0,0 +1,185 @@
+"""
+Batch fits that survive being interrupted
+
+:func:`resumable_fit` appends the result of each spectrum to a JSON lines
+file and periodically records a checkpoint. If the process dies, running
+the same call again skips the spectra whose results were checkpointed and
+continues, producing the same file as an uninterrupted run.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .streaming import iter_fit
+
+
+def resumable_fit(circuit, spectra, output, checkpoint_every=1000,
+                  n_jobs=1, callback=None, overwrite=False, **kwargs):
+    """ Fits spectra, appending results to a file with checkpoints
+
+    Each line of `output` is a JSON object with the 'id' of a spectrum and
+    the 'parameters', 'conf', 'cost', 'converged' and 'message' of its fit
+    (or its 'error'). Every `checkpoint_every` spectra, the file is flushed
+    to disk and its length is recorded in `output` + '.checkpoint'. On a
+    restart, anything after the checkpoint is discarded and spectra whose
+    id is already in the file are skipped. A non-empty `output` without a
+    checkpoint is not overwritten unless `overwrite` is True.
+
+    Floats are written with their shortest exact representation and each
+    fit only depends on its own spectrum, so a resumed run writes the same
+    bytes as an uninterrupted one (with global_opt=True, pass a fixed
+    `seed` for this to hold).
+
+    Parameters
+    ----------
+    circuit : CustomCircuit
+        Circuit to fit, with its initial guess and constants
+    spectra : iterable of (frequencies, impedances[, id])
+        Spectra in the same order on every run. ids must be JSON
+        serializable (e.g. str or int) and default to the index of the
+        spectrum
+    output : str
+        Path of the results file
+    checkpoint_every : int, optional
+        Number of results between checkpoints. Defaults to 1000
+    n_jobs : int, optional
+        Number of worker processes (see `iter_fit`). Defaults to 1
+    callback : callable, optional
+        Called as callback(id, result) after each result is written, with
+        the FitResult or the exception raised by the fit
+    overwrite : bool, optional
+        Discard an existing `output` (and its checkpoint) and start over.
+        Defaults to False
+    kwargs :
+        Keyword arguments passed to `iter_fit` and `circuit_fit`
+
+    Returns
+    -------
+    n_fit : int
+        Number of spectra fit in this call (not skipped)
+
+    Examples
+    --------
+    >>> resumable_fit(circuit, measurements(), 'refit.jsonl', n_jobs=8)
+    >>> results = read_results('refit.jsonl')
+    """
+    checkpoint = output + '.checkpoint'
+    job = _fingerprint(circuit, kwargs)
+
+    offset = 0
+    if overwrite:
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+    elif os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            state = json.load(f)
+        if state['job'] != job:
+            raise ValueError(f'{output} holds the results of a different ' +
+                             'fit, remove it (and its checkpoint), choose ' +
+                             'another output or pass overwrite=True')
+        offset = state['offset']
+    elif os.path.exists(output) and os.path.getsize(output) > 0:
+        raise FileExistsError(f'{output} exists but has no checkpoint, ' +
+                              'remove it, choose another output or pass ' +
+                              'overwrite=True')
+
+    with open(output, 'ab+') as f:
+        f.truncate(offset)
+        f.seek(0)
+        done = {json.loads(line)['id'] for line in f}
+
+        def todo():
+            for index, item in enumerate(spectra):
+                if len(item) == 2:
+                    item = (item[0], item[1], index)
+                if item[2] not in done:
+                    yield item
+
+        n_fit = 0
+        for spectrum_id, result in iter_fit(circuit, todo(), n_jobs=n_jobs,
+                                            ordered=True, errors='yield',
+                                            **kwargs):
+            f.write(_record(spectrum_id, result).encode() + b'\n')
+            n_fit += 1
+            if callback is not None:
+                callback(spectrum_id, result)
+            if n_fit % checkpoint_every == 0:
+                _checkpoint(f, checkpoint, job)
+        _checkpoint(f, checkpoint, job)
+    return n_fit
+
+
+def read_results(output):
+    """ Reads a file written by :func:`resumable_fit`
+
+    Parameters
+    ----------
+    output : str
+        Path of the results file
+
+    Returns
+    -------
+    results : dict
+        'id' (list), and numpy arrays of 'parameters' and 'conf'
+        (n_spectra, n_params), 'cost' and 'converged' (n_spectra,), and
+        'error' (list, None for successful fits), in the order of the
+        file. Failed fits have NaN parameters
+    """
+    with open(output) as f:
+        records = [json.loads(line) for line in f]
+    n_params = max([len(r['parameters']) for r in records
+                    if r.get('error') is None] + [0])
+    nan = [np.nan] * n_params
+
+    return {'id': [r['id'] for r in records],
+            'parameters': np.array([r.get('parameters', nan)
+                                    for r in records]).reshape(-1, n_params),
+            'conf': np.array([r.get('conf') or nan for r in records],
+                             dtype=float).reshape(-1, n_params),
+            'cost': np.array([r.get('cost', np.nan) for r in records]),
+            'converged': np.array([r.get('converged', False)
+                                   for r in records]),
+            'error': [r.get('error') for r in records]}
+
+
+def _record(spectrum_id, result):
+    """ line of the results file for one fit """
+    return json.dumps({'id': spectrum_id, **_summary(result)})
+
+
+def _summary(result):
+    """ JSON serializable summary of a FitResult or of the exception
+    raised by a fit """
+    if isinstance(result, Exception):
+        return {'error': f'{type(result).__name__}: {result}'}
+    conf = result.perror
+    return {'parameters': np.asarray(result.parameters).tolist(),
+            'conf': None if conf is None else np.asarray(conf).tolist(),
+            'cost': float(result.cost),
+            'converged': bool(result.converged),
+            'message': str(result.message)}
+
+
+def _checkpoint(f, path, job):
+    """ flushes the results to disk, then records their length """
+    f.flush()
+    os.fsync(f.fileno())
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as checkpoint:
+        json.dump({'job': job, 'offset': f.tell()}, checkpoint)
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+    os.replace(temporary, path)
+
+
+def _fingerprint(circuit, kwargs):
+    """ description of a fit, to check that a resumed run matches """
+    return json.loads(json.dumps(
+        {'circuit': circuit.circuit,
+         'initial_guess': np.asarray(circuit.initial_guess).tolist(),
+         'constants': circuit.constants,
+         'kwargs': {key: repr(value) for key, value in kwargs.items()
+                    if key not in ['window', 'executor']}},
+        default=repr, sort_keys=True))
@@ -1,23 +1,61 @@
-from .fitting import circuit_fit, buildCircuit
+from .compiler import CompiledCircuit  # noqa: F401
+from .fitting import circuit_fit, buildCircuit  # noqa: F401
+from .fitting import _compile
 from .fitting import calculateCircuitLength, check_and_eval
 from impedance.visualization import plot_altair, plot_bode, plot_nyquist
-from .elements import circuit_elements, get_element_from_name
+from .elements import circuit_elements, get_element_from_name  # noqa: F401
+from .elements import ElementRegistry  # noqa: F401
+from .initialization import estimate_initial_guess
+from .jit import JITCircuit  # noqa: F401
 
+from collections.abc import Sequence
 import json
 import matplotlib.pyplot as plt
 import numpy as np
 import warnings
 
 
+def _param_names(circuit, constants, elements=None):
+    """ names and units of the free parameters of a circuit string """
+
+    # parse the element names from the circuit string
+    names = circuit.replace('p', '').replace('(', '').replace(')', '')
+    names = names.replace(',', '-').replace(' ', '').split('-')
+
+    full_names, all_units = [], []
+    for name in names:
+        elem = get_element_from_name(name)
+        num_params = check_and_eval(elem, elements).num_params
+        units = check_and_eval(elem, elements).units
+        if num_params > 1:
+            for j in range(num_params):
+                full_name = '{}_{}'.format(name, j)
+                if full_name not in constants.keys():
+                    full_names.append(full_name)
+                    all_units.append(units[j])
+        else:
+            if name not in constants.keys():
+                full_names.append(name)
+                all_units.append(units[0])
+
+    return full_names, all_units
+
+
 class BaseCircuit:
     """ Base class for equivalent circuit models """
-    def __init__(self, initial_guess=[], constants=None, name=None):
+    # diagnostics of the last fit, which are not saved and not compared
+    _diagnostics = ['converged_', 'fit_result_']
+
+    def __init__(self, initial_guess=[], constants=None, name=None,
+                 jit=False, elements=None):
         """ Base constructor for any equivalent circuit model
 
         Parameters
         ----------
-        initial_guess: numpy array
-            Initial guess of the circuit values
+        initial_guess: numpy array or 'auto'
+            Initial guess of the circuit values. If 'auto', the guess is
+            estimated from the data each time the model is fit (see
+            :func:`~impedance.models.circuits.initialization.estimate_initial_guess`)
 
         constants : dict, optional
             Parameters and values to hold constant during fitting
@@ -25,13 +63,30 @@ class BaseCircuit:
 
         name : str, optional
             Name for the circuit
+
+        jit : bool, optional
+            Evaluate the circuit with numba-compiled code when fitting and
+            predicting (see :mod:`impedance.models.circuits.jit`).
+            Requires numba, otherwise falls back to NumPy with a warning.
+            Defaults to False
+
+        elements : ElementRegistry, optional
+            Registry to look up the circuit's elements in (see
+            :class:`~impedance.models.circuits.elements.ElementRegistry`).
+            Defaults to the default registry
         """
 
         # if supplied, check that initial_guess is valid and store
-        initial_guess = [x for x in initial_guess if x is not None]
-        for i in initial_guess:
-            if not isinstance(i, (float, int, np.int32, np.float64)):
-                raise TypeError(f'value {i} in initial_guess is not a number')
+        if isinstance(initial_guess, str):
+            if initial_guess != 'auto':
+                raise ValueError("initial_guess must be a list of numbers " +
+                                 f"or 'auto' (received {initial_guess})")
+        else:
+            initial_guess = [x for x in initial_guess if x is not None]
+            for i in initial_guess:
+                if not isinstance(i, (float, int, np.int32, np.float64)):
+                    raise TypeError(f'value {i} in initial_guess ' +
+                                    'is not a number')
 
         # initalize class attributes
         self.initial_guess = initial_guess
@@ -40,15 +95,21 @@ class BaseCircuit:
         else:
             self.constants = {}
         self.name = name
+        self.jit = jit
+        self.elements = elements
 
         # initialize fit parameters and confidence intervals
         self.parameters_ = None
         self.conf_ = None
+        self.converged_ = None
+        self.fit_result_ = None
 
     def __eq__(self, other):
         if self.__class__ == other.__class__:
             matches = []
             for key, value in self.__dict__.items():
+                if key in self._diagnostics:
+                    continue
                 if isinstance(value, np.ndarray):
                     matches.append((value == other.__dict__[key]).all())
                 else:
@@ -58,7 +119,7 @@ class BaseCircuit:
             raise TypeError('Comparing object is not of the same type.')
 
     def fit(self, frequencies, impedance, bounds=None,
-            weight_by_modulus=False, **kwargs):
+            weight_by_modulus=False, warm_start=None, **kwargs):
         """ Fit the circuit model
 
         Parameters
@@ -79,16 +140,33 @@ class BaseCircuit:
             Standard weighting scheme when experimental variances are
             unavailable. Only applicable when global_opt = False
 
+        warm_start : WarmStartStore, optional
+            If supplied, the fit starts from the parameters of the most
+            similar spectrum previously fitted with this circuit (falling
+            back to initial_guess if there is none) and the result is
+            added to the store
+
         kwargs :
             Keyword arguments passed to
-            impedance.models.circuits.fitting.circuit_fit,
-            and subsequently to scipy.optimize.curve_fit
+            impedance.models.circuits.fitting.circuit_fit (e.g.
+            time_budget or iteration_callback to bound the time spent on
+            the fit), and subsequently to scipy.optimize.curve_fit
             or scipy.optimize.basinhopping
 
         Returns
         -------
         self: returns an instance of self
 
+        Notes
+        -----
+        If the fit is stopped early (see `time_budget` and
+        `iteration_callback` in circuit_fit) or does not converge, the best
+        parameters found are kept, `converged_` is set to False and a
+        warning is raised.
+        Evaluation counts, timings and the final cost of the last fit are
+        kept in `fit_result_` (see
+        :class:`~impedance.models.circuits.fitting.FitResult`).
+
         """
         frequencies = np.array(frequencies, dtype=float)
         impedance = np.array(impedance, dtype=complex)
@@ -96,21 +174,53 @@ class BaseCircuit:
         if len(frequencies) != len(impedance):
             raise TypeError('length of frequencies and impedance do not match')
 
-        if self.initial_guess != []:
-            parameters, conf = circuit_fit(frequencies, impedance,
-                                           self.circuit, self.initial_guess,
-                                           constants=self.constants,
-                                           bounds=bounds,
-                                           weight_by_modulus=weight_by_modulus,
-                                           **kwargs)
-            self.parameters_ = parameters
-            if conf is not None:
-                self.conf_ = conf
+        if self._auto_guess():
+            initial_guess = estimate_initial_guess(
+                frequencies, impedance, self.circuit, self.constants,
+                elements=self.elements)
+            if bounds is not None:
+                initial_guess = np.clip(initial_guess, bounds[0], bounds[1])
+            initial_guess = list(initial_guess)
+        elif self.initial_guess != []:
+            initial_guess = self.initial_guess
         else:
             raise ValueError('No initial guess supplied')
 
+        if warm_start is not None:
+            match = warm_start.query(frequencies, impedance,
+                                     self.circuit, self.constants)
+            if match is not None:
+                if bounds is not None:
+                    match = np.clip(match, bounds[0], bounds[1])
+                initial_guess = list(match)
+
+        kwargs.setdefault('jit', self.jit)
+        kwargs.setdefault('elements', self.elements)
+        parameters, conf, info = circuit_fit(
+            frequencies, impedance, self.circuit, initial_guess,
+            constants=self.constants, bounds=bounds,
+            weight_by_modulus=weight_by_modulus, full_output=True,
+            **kwargs)
+        self.parameters_ = parameters
+        if conf is not None:
+            self.conf_ = conf
+        self.converged_ = info.converged
+        self.fit_result_ = info
+
+        if not info.converged:
+            reason = 'stopped early' if info.stopped else 'did not converge'
+            warnings.warn(f'fit {reason} ({info.message}), ' +
+                          'keeping the best parameters found')
+        elif warm_start is not None:
+            warm_start.add(frequencies, impedance, self.circuit,
+                           parameters, self.constants)
+
         return self
 
+    def _auto_guess(self):
+        """ check if the initial guess is estimated when fitting """
+        return isinstance(self.initial_guess, str)
+
     def _is_fit(self):
         """ check if model has been fit (parameters_ is not None) """
         if self.parameters_ is not None:
@@ -136,43 +246,21 @@ class BaseCircuit:
         frequencies = np.array(frequencies, dtype=float)
 
         if self._is_fit() and not use_initial:
-            return eval(buildCircuit(self.circuit, frequencies,
-                                     *self.parameters_,
-                                     constants=self.constants, eval_string='',
-                                     index=0)[0],
-                        circuit_elements)
+            parameters = self.parameters_
         else:
+            if self._auto_guess():
+                raise ValueError("initial_guess is 'auto', " +
+                                 'fit the model before predicting')
             warnings.warn("Simulating circuit based on initial parameters")
-            return eval(buildCircuit(self.circuit, frequencies,
-                                     *self.initial_guess,
-                                     constants=self.constants, eval_string='',
-                                     index=0)[0],
-                        circuit_elements)
+            parameters = self.initial_guess
+
+        model = _compile(self.circuit, self.constants, self.jit,
+                         self.elements)
+        return model(frequencies, parameters)
 
     def get_param_names(self):
         """ Converts circuit string to names and units """
-
-        # parse the element names from the circuit string
-        names = self.circuit.replace('p', '').replace('(', '').replace(')', '')
-        names = names.replace(',', '-').replace(' ', '').split('-')
-
-        full_names, all_units = [], []
-        for name in names:
-            elem = get_element_from_name(name)
-            num_params = check_and_eval(elem).num_params
-            units = check_and_eval(elem).units
-            if num_params > 1:
-                for j in range(num_params):
-                    full_name = '{}_{}'.format(name, j)
-                    if full_name not in self.constants.keys():
-                        full_names.append(full_name)
-                        all_units.append(units[j])
-            else:
-                if name not in self.constants.keys():
-                    full_names.append(name)
-                    all_units.append(units[0])
-
-        return full_names, all_units
+        return _param_names(self.circuit, self.constants, self.elements)
 
     def __str__(self):
         """ Defines the pretty printing of the circuit"""
@@ -187,7 +275,7 @@ class BaseCircuit:
             to_print += '\nConstants:\n'
             for name, value in self.constants.items():
                 elem = get_element_from_name(name)
-                units = check_and_eval(elem).units
+                units = check_and_eval(elem, self.elements).units
                 if '_' in name and len(units) > 1:
                     unit = units[int(name.split('_')[-1])]
                 else:
@@ -196,8 +284,12 @@ class BaseCircuit:
 
         names, units = self.get_param_names()
         to_print += '\nInitial guesses:\n'
-        for name, unit, param in zip(names, units, self.initial_guess):
-            to_print += '  {:>5} = {:.2e} [{}]\n'.format(name, param, unit)
+        if self._auto_guess():
+            to_print += '  auto (estimated from the data when fitting)\n'
+        else:
+            for name, unit, param in zip(names, units, self.initial_guess):
+                to_print += '  {:>5} = {:.2e} [{}]\n'.format(
+                    name, param, unit)
         if self._is_fit():
             params, confs = self.parameters_, self.conf_
             to_print += '\nFit parameters:\n'
@@ -307,6 +399,11 @@ class BaseCircuit:
             Destination for exporting model object
         """
 
+        with open(filepath, 'w') as f:
+            json.dump(self._to_dict(), f)
+
+    def _to_dict(self):
+        """ JSON serializable description of the model (see `save`) """
         model_string = self.circuit
         model_name = self.name
 
@@ -330,9 +427,7 @@ class BaseCircuit:
                          "Initial Guess": initial_guess,
                          "Constants": self.constants,
                          "Fit": False}
-
-        with open(filepath, 'w') as f:
-            json.dump(data_dict, f)
+        return data_dict
 
     def load(self, filepath, fitted_as_initial=False):
         """ Imports a model from JSON
@@ -350,9 +445,12 @@ class BaseCircuit:
             fitted parameters as a completed model
         """
 
-        json_data_file = open(filepath, 'r')
-        json_data = json.load(json_data_file)
+        with open(filepath, 'r') as f:
+            json_data = json.load(f)
+        self._from_dict(json_data, fitted_as_initial)
 
+    def _from_dict(self, json_data, fitted_as_initial=False):
+        """ sets the model from a description written by `_to_dict` """
         model_name = json_data["Name"]
         model_string = json_data["Circuit String"]
         model_initial_guess = json_data["Initial Guess"]
@@ -360,7 +458,6 @@ class BaseCircuit:
 
         self.initial_guess = model_initial_guess
         self.circuit = model_string
-        print(self.circuit)
         self.constants = model_constants
         self.name = model_name
 
@@ -379,8 +476,9 @@ class Randles(BaseCircuit):
 
         Parameters
         ----------
-        initial_guess: numpy array
-            Initial guess of the circuit values
+        initial_guess: numpy array or 'auto'
+            Initial guess of the circuit values, or 'auto' to estimate it
+            from the data when fitting
 
         CPE: boolean
             Use a constant phase element instead of a capacitor
@@ -394,9 +492,11 @@ class Randles(BaseCircuit):
             self.name = 'Randles'
             self.circuit = 'R0-p(R1-Wo1,C1)'
 
-        circuit_len = calculateCircuitLength(self.circuit)
+        circuit_len = calculateCircuitLength(self.circuit, self.elements)
 
-        if len(self.initial_guess) + len(self.constants) != circuit_len:
+        if self._auto_guess():
+            pass
+        elif len(self.initial_guess) + len(self.constants) != circuit_len:
             raise ValueError('The number of initial guesses ' +
                              f'({len(self.initial_guess)}) + ' +
                              'the number of constants ' +
@@ -411,8 +511,9 @@ class CustomCircuit(BaseCircuit):
 
         Parameters
         ----------
-        initial_guess: numpy array
-            Initial guess of the circuit values
+        initial_guess: numpy array or 'auto'
+            Initial guess of the circuit values, or 'auto' to estimate it
+            from the data when fitting
 
         circuit: string
             A string that should be interpreted as an equivalent circuit
@@ -433,12 +534,369 @@ class CustomCircuit(BaseCircuit):
         super().__init__(**kwargs)
         self.circuit = circuit.replace(" ", "")
 
-        circuit_len = calculateCircuitLength(self.circuit)
+        circuit_len = calculateCircuitLength(self.circuit, self.elements)
 
-        if len(self.initial_guess) + len(self.constants) != circuit_len:
+        if self._auto_guess():
+            pass
+        elif len(self.initial_guess) + len(self.constants) != circuit_len:
             raise ValueError('The number of initial guesses ' +
                              f'({len(self.initial_guess)}) + ' +
                              'the number of constants ' +
                              f'({len(self.constants)})' +
                              ' must be equal to ' +
                              f'the circuit length ({circuit_len})')
+
+
+class CircuitFamily:
+    """ Many parameter sets of one circuit, sharing its structure
+
+    Instead of one CustomCircuit per spectrum, a family stores the circuit
+    string, constants, parameter names and compiled circuit once and the
+    initial guesses, fitted parameters and errors of its members as 2-D
+    arrays. Indexing a family returns a lightweight :class:`FamilyMember`
+    that can be printed, predicted and plotted like a CustomCircuit, and
+    :meth:`predict` evaluates all members at once.
+
+    Parameters
+    ----------
+    circuit : str
+        Circuit string, as for CustomCircuit
+    initial_guess : array-like, shape (n_params,) or (n_members, n_params)
+        Initial guess of every member, or one shared by all members (stored
+        once)
+    parameters : array-like, shape (n_members, n_params), optional
+        Fitted parameters of the members
+    conf : array-like, shape (n_members, n_params), optional
+        Errors of the fitted parameters
+    constants : dict, optional
+        Constants shared by all members
+    ids : list, optional
+        Names of the members (e.g. the spectra they were fit to)
+    jit, elements : optional
+        As for BaseCircuit
+
+    Examples
+    --------
+    >>> popt, perror, _ = batch_circuit_fit(f, Z, 'R0-p(R1,C1)', guess)
+    >>> family = CircuitFamily('R0-p(R1,C1)', guess, popt, perror)
+    >>> print(family[10])
+    >>> Z_fit = family.predict(f)  # shape (n_members, n_freq)
+    >>> family.column('R1')
+    """
+    def __init__(self, circuit, initial_guess, parameters=None, conf=None,
+                 constants=None, ids=None, jit=False, elements=None):
+        self.circuit = circuit.replace(" ", "")
+        self.constants = constants if constants is not None else {}
+        self.jit = jit
+        self.elements = elements
+        self.ids = ids
+        self._names = _param_names(self.circuit, self.constants, elements)
+
+        self._model = _compile(self.circuit, self.constants, jit, elements)
+
+        n_params = len(self._names[0])
+        parameters = None if parameters is None else \
+            np.array(parameters, dtype=float).reshape(-1, n_params)
+        initial_guess = np.array(initial_guess, dtype=float)
+        if initial_guess.shape[-1:] != (n_params,):
+            raise ValueError('The number of initial guesses ' +
+                             f'({initial_guess.shape[-1]}) + ' +
+                             'the number of constants ' +
+                             f'({len(self.constants)})' +
+                             ' must be equal to ' +
+                             'the circuit length ' +
+                             f'({n_params + len(self.constants)})')
+        if initial_guess.ndim == 1:
+            n_members = 1 if parameters is None else len(parameters)
+            initial_guess = np.broadcast_to(initial_guess,
+                                            (n_members, n_params))
+        self.initial_guess = initial_guess
+        self.parameters_ = parameters
+        self.conf_ = None if conf is None else \
+            np.array(conf, dtype=float).reshape(-1, n_params)
+
+        for array in [self.parameters_, self.conf_]:
+            if array is not None and len(array) != len(initial_guess):
+                raise ValueError('initial_guess, parameters and conf must ' +
+                                 'have one row per member')
+        if ids is not None and len(ids) != len(initial_guess):
+            raise ValueError('ids must have one entry per member')
+
+    @classmethod
+    def from_models(cls, models, ids=None):
+        """ Creates a family from circuits with the same circuit string and
+        constants
+
+        Parameters
+        ----------
+        models : list of BaseCircuit
+            Fitted or unfitted models (either all fitted or none)
+        ids : list, optional
+            Names of the members. Defaults to the names of the models
+
+        Returns
+        -------
+        family : CircuitFamily
+        """
+        first = models[0]
+        for model in models:
+            if model.circuit != first.circuit or \
+                    model.constants != first.constants:
+                raise ValueError('all models of a family must have the ' +
+                                 'same circuit string and constants')
+        fitted = [model._is_fit() for model in models]
+        if any(fitted) and not all(fitted):
+            raise ValueError('either all or none of the models must be fit')
+        if ids is None and any(model.name is not None for model in models):
+            ids = [model.name for model in models]
+        parameters, conf = None, None
+        if all(fitted):
+            parameters = [model.parameters_ for model in models]
+            if all(model.conf_ is not None for model in models):
+                conf = [model.conf_ for model in models]
+        return cls(first.circuit, [model.initial_guess for model in models],
+                   parameters, conf, constants=dict(first.constants),
+                   ids=ids, jit=first.jit, elements=first.elements)
+
+    def __len__(self):
+        return len(self.initial_guess)
+
+    def __getitem__(self, index):
+        """ A member (for an int) or a family of the selected members (for
+        a slice, boolean mask or array of indices) """
+        if isinstance(index, (int, np.integer)):
+            if not -len(self) <= index < len(self):
+                raise IndexError(f'member {index} of a family of ' +
+                                 f'{len(self)}')
+            return FamilyMember(self, index % len(self))
+        ids = None if self.ids is None else \
+            list(np.asarray(self.ids, dtype=object)[index])
+        return CircuitFamily(
+            self.circuit, self.initial_guess[index],
+            None if self.parameters_ is None else self.parameters_[index],
+            None if self.conf_ is None else self.conf_[index],
+            constants=self.constants, ids=ids, jit=self.jit,
+            elements=self.elements)
+
+    def __iter__(self):
+        return (FamilyMember(self, i) for i in range(len(self)))
+
+    def _is_fit(self):
+        return self.parameters_ is not None
+
+    def get_param_names(self):
+        """ Names and units of the parameters (computed once) """
+        return self._names
+
+    def column(self, name, conf=False):
+        """ One parameter (or its error) of every member
+
+        Parameters
+        ----------
+        name : str
+            Parameter name, e.g. 'R1' or 'CPE1_0'
+        conf : bool, optional
+            Return the errors instead of the parameters. Defaults to False
+
+        Returns
+        -------
+        values : numpy array, shape (n_members,)
+        """
+        names, _ = self._names
+        if name not in names:
+            raise KeyError(f'{name!r} is not a parameter of {self.circuit} ' +
+                           f'({names})')
+        values = self.conf_ if conf else self.parameters_
+        if values is None:
+            raise ValueError('the family has not been fit')
+        return values[:, names.index(name)]
+
+    def predict(self, frequencies, use_initial=False):
+        """ Predicts the impedance of every member
+
+        Parameters
+        ----------
+        frequencies : array-like of numeric type
+        use_initial : bool, optional
+            Use the initial guesses instead of the fitted parameters
+
+        Returns
+        -------
+        impedance : ndarray of dtype 'complex128', shape (n_members, n_freq)
+        """
+        frequencies = np.array(frequencies, dtype=float)
+        if self._is_fit() and not use_initial:
+            parameters = self.parameters_
+        else:
+            warnings.warn("Simulating circuit based on initial parameters")
+            parameters = self.initial_guess
+        return np.atleast_2d(self._model(frequencies, parameters))
+
+    def __repr__(self):
+        fit = 'fit' if self._is_fit() else 'not fit'
+        return f'CircuitFamily({self.circuit!r}, {len(self)} members, {fit})'
+
+
+class FamilyMember(BaseCircuit):
+    """ A view of one member of a :class:`CircuitFamily`
+
+    Behaves like a CustomCircuit for printing, `predict`, `plot` and
+    `save`, reading its parameters from the family without copying them.
+    Members are read-only: to fit one, fit a copy made with `to_circuit`.
+    """
+    def __init__(self, family, index):
+        self._family = family
+        self._index = index
+
+    circuit = property(lambda self: self._family.circuit)
+    constants = property(lambda self: self._family.constants)
+    elements = property(lambda self: self._family.elements)
+    jit = property(lambda self: self._family.jit)
+    converged_ = None
+    fit_result_ = None
+
+    @property
+    def name(self):
+        ids = self._family.ids
+        return None if ids is None else ids[self._index]
+
+    @property
+    def initial_guess(self):
+        return list(self._family.initial_guess[self._index])
+
+    @property
+    def parameters_(self):
+        if self._family.parameters_ is None:
+            return None
+        return self._family.parameters_[self._index]
+
+    @property
+    def conf_(self):
+        if self._family.conf_ is None:
+            return None
+        return self._family.conf_[self._index]
+
+    def get_param_names(self):
+        return self._family.get_param_names()
+
+    def predict(self, frequencies, use_initial=False):
+        frequencies = np.array(frequencies, dtype=float)
+        if self._is_fit() and not use_initial:
+            parameters = self.parameters_
+        else:
+            warnings.warn("Simulating circuit based on initial parameters")
+            parameters = self.initial_guess
+        return self._family._model(frequencies, parameters)
+
+    def fit(self, *args, **kwargs):
+        raise TypeError('members of a CircuitFamily are read-only, fit ' +
+                        'member.to_circuit() instead')
+
+    def to_circuit(self):
+        """ An independent CustomCircuit with this member's parameters
+
+        Returns
+        -------
+        circuit : CustomCircuit
+        """
+        circuit = CustomCircuit(self.circuit,
+                                initial_guess=self.initial_guess,
+                                constants=dict(self.constants),
+                                name=self.name, jit=self.jit,
+                                elements=self.elements)
+        if self._is_fit():
+            circuit.parameters_ = np.array(self.parameters_)
+            circuit.conf_ = None if self.conf_ is None else \
+                np.array(self.conf_)
+        return circuit
+
+    def __repr__(self):
+        return f'<member {self._index} of {self._family!r}>'
+
+
+def save_models(models, filepath):
+    """ Exports many models to a JSON Lines file
+
+    Each line holds one model, in the format written by
+    :meth:`BaseCircuit.save`, so the file is written in a single pass and
+    can be appended to.
+
+    Parameters
+    ----------
+    models : iterable of BaseCircuit
+        Models to export
+    filepath : str
+        Destination of the models
+    """
+    with open(filepath, 'w') as f:
+        for model in models:
+            f.write(json.dumps(model._to_dict()) + '\n')
+
+
+def load_models(filepath, fitted_as_initial=False):
+    """ Imports models exported with `save_models`
+
+    The file is read once and closed, but each model is only created when
+    it is first accessed, so opening a file of many models is fast and
+    cheap. Models with the same circuit string and constants share one
+    compiled circuit when predicting.
+
+    Parameters
+    ----------
+    filepath : str
+        Source of the models
+    fitted_as_initial : bool
+        If true, the fitted parameters of fitted models are loaded as
+        their initial guess (see :meth:`BaseCircuit.load`)
+
+    Returns
+    -------
+    models : ModelCollection
+        Sequence of CustomCircuits
+    """
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    return ModelCollection(data, fitted_as_initial)
+
+
+class ModelCollection(Sequence):
+    """ Models of a JSON Lines file (see `load_models`), created when they
+    are first accessed
+
+    Parameters
+    ----------
+    data : bytes
+        Contents of the file, one model per line
+    fitted_as_initial : bool, optional
+        See `load_models`
+    """
+    def __init__(self, data, fitted_as_initial=False):
+        self._data = data
+        self.fitted_as_initial = fitted_as_initial
+        ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) ==
+                              ord('\n'))
+        if data and not data.endswith(b'\n'):
+            ends = np.append(ends, len(data))
+        starts = np.concatenate([[0], ends[:-1] + 1])
+        # skip blank lines, e.g. a trailing one
+        lines = ends > starts
+        self._starts, self._ends = starts[lines], ends[lines]
+        self._models = [None] * len(self._starts)
+
+    def __len__(self):
+        return len(self._models)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        model = self._models[index]
+        if model is None:
+            line = self._data[self._starts[index]:self._ends[index]]
+            model = CustomCircuit()
+            model._from_dict(json.loads(line), self.fitted_as_initial)
+            self._models[index] = model
+        return model
+
+    def __repr__(self):
+        loaded = sum(model is not None for model in self._models)
+        return f'<ModelCollection of {len(self)} models ({loaded} loaded)>'
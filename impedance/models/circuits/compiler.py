@@ -0,0 +1,344 @@
+"""
+Compiled representations of equivalent circuit strings
+
+A circuit string is parsed once into a tree of series, parallel, and element
+nodes which can then be evaluated for many frequency grids and parameter
+sets without regenerating and evaluating Python source code. The tree is
+simplified before evaluation (see :func:`simplify_tree`).
+"""
+
+import numpy as np
+
+from .dual import DualArray, seed, _tangent
+from .elements import get_element_from_name, get_registry, s, p
+
+
+def split_circuit(circuit, special):
+    """ Splits a circuit string by a separator outside of any parentheses
+
+    Parameters
+    ----------
+    circuit : str
+        Circuit string (without spaces)
+    special : str
+        Separator to split on: '-' (series) or ',' (parallel)
+
+    Returns
+    -------
+    branches : list of str
+        Sub-circuit strings
+    """
+    branches, depth, start = [], 0, 0
+    for i, char in enumerate(circuit):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == special and depth == 0:
+            branches.append(circuit[start:i])
+            start = i + 1
+    branches.append(circuit[start:])
+    return branches
+
+
+class Series:
+    """ Series combination of sub-circuits """
+    def __init__(self, children):
+        self.children = children
+
+    def evaluate(self, frequencies, parameters):
+        return s([child.evaluate(frequencies, parameters)
+                  for child in self.children])
+
+    def __repr__(self):
+        return 's({})'.format(', '.join(repr(c) for c in self.children))
+
+
+class Parallel:
+    """ Parallel combination of sub-circuits """
+    def __init__(self, children):
+        self.children = children
+
+    def evaluate(self, frequencies, parameters):
+        return p([child.evaluate(frequencies, parameters)
+                  for child in self.children])
+
+    def __repr__(self):
+        return 'p({})'.format(', '.join(repr(c) for c in self.children))
+
+
+class Element:
+    """ A single circuit element with its parameter slots
+
+    Each entry of `slots` is either an int (index into the fitted parameter
+    vector) or a float (a value held constant).
+    """
+    def __init__(self, name, kernel, slots):
+        self.name = name
+        self.kernel = kernel
+        self.slots = slots
+        self.vectorized = _supports_batch(kernel, len(slots))
+
+    def evaluate(self, frequencies, parameters):
+        batch_shape = np.shape(parameters)[:-1]
+        if batch_shape and not self.vectorized:
+            # kernels written for scalar parameters are evaluated row by row
+            rows = np.reshape(parameters, (-1, np.shape(parameters)[-1]))
+            Z = np.array([self.kernel(self._select(row), frequencies)
+                          for row in rows])
+            return Z.reshape(batch_shape + Z.shape[-1:])
+
+        return self.kernel(self._select(parameters), frequencies)
+
+    def _select(self, parameters):
+        """ picks out this element's parameters as a list, with a trailing
+        axis on batched parameters so they broadcast against frequency """
+        if np.ndim(parameters) == 1:
+            return [parameters[i] if isinstance(i, int) else i
+                    for i in self.slots]
+        return [parameters[..., i, None] if isinstance(i, int) else i
+                for i in self.slots]
+
+    def __repr__(self):
+        return self.name
+
+
+class Constant:
+    """ A sub-circuit without free parameters, evaluated once per frequency
+    grid """
+    def __init__(self, node):
+        self.node = node
+        # (frequencies, Z), replaced as a whole so that compiled circuits
+        # can be shared between threads
+        self._cache = None
+
+    def evaluate(self, frequencies, parameters):
+        cache = self._cache
+        if cache is None or not np.array_equal(frequencies, cache[0]):
+            Z = self.node.evaluate(frequencies, np.empty(0))
+            Z = np.array(np.broadcast_to(Z, np.shape(frequencies)),
+                         dtype=complex)
+            Z.flags.writeable = False
+            cache = (np.array(frequencies), Z)
+            self._cache = cache
+        return cache[1]
+
+    def __repr__(self):
+        return 'const({!r})'.format(self.node)
+
+
+def simplify_tree(node):
+    """ Canonical form of a circuit tree
+
+    Series inside series and parallel inside parallel are flattened, groups
+    with a single branch are replaced by that branch, and sub-circuits (or
+    sets of branches of a series or parallel group) without free
+    parameters are folded into one :class:`Constant`. The parameter slots
+    of the elements are untouched, so parameters keep their order.
+
+    Parameters
+    ----------
+    node : Series, Parallel, Element or Constant
+        Root of a parsed circuit
+
+    Returns
+    -------
+    node : Series, Parallel, Element or Constant
+        Root of an equivalent, simplified circuit
+    """
+    if isinstance(node, Constant):
+        return node
+    if isinstance(node, Element):
+        if all(not isinstance(slot, int) for slot in node.slots):
+            return Constant(node)
+        return node
+
+    kind = type(node)
+    children = []
+    for child in map(simplify_tree, node.children):
+        if type(child) is kind:
+            children.extend(child.children)
+        else:
+            children.append(child)
+
+    constant = [child for child in children if isinstance(child, Constant)]
+    if len(constant) > 1:
+        folded = Constant(kind([child.node for child in constant]))
+        first = children.index(constant[0])
+        children = [child for child in children
+                    if not isinstance(child, Constant)]
+        children.insert(first, folded)
+
+    if len(children) == 1:
+        return children[0]
+    return kind(children)
+
+
+_batch_support = {}
+
+
+def _supports_batch(kernel, num_params):
+    """ Checks (once per kernel) whether an element broadcasts a batch of
+    parameter columns of shape (n, 1) against frequencies of shape (m,) """
+    if kernel not in _batch_support:
+        parameters = [np.array([[0.5], [0.25]]) for _ in range(num_params)]
+        try:
+            with np.errstate(all='ignore'):
+                Z = kernel(parameters, np.array([1.0, 10.0, 100.0]))
+            _batch_support[kernel] = np.shape(Z) == (2, 3)
+        except Exception:
+            _batch_support[kernel] = False
+    return _batch_support[kernel]
+
+
+class CompiledCircuit:
+    """ An equivalent circuit parsed once for repeated evaluation
+
+    Parameters
+    ----------
+    circuit : str
+        String defining the equivalent circuit
+    constants : dict, optional
+        Parameters and their values to hold constant
+        (e.g. {"R0": 0.1}). Defaults to {}
+    simplify : bool, optional
+        Whether to simplify the parsed circuit (see :func:`simplify_tree`).
+        Defaults to True
+    elements : ElementRegistry, optional
+        Registry to look up elements in. Defaults to the default registry
+
+    Attributes
+    ----------
+    num_params : int
+        Number of parameters that are not held constant
+    param_names : list of str
+        Names of those parameters (e.g. 'R0', 'CPE1_1')
+
+    Notes
+    -----
+    Parameters are numbered in the same order as in
+    :func:`impedance.models.circuits.fitting.buildCircuit`, so the vectors
+    used for `circuit_fit` can be passed directly.
+    """
+    def __init__(self, circuit, constants=None, simplify=True,
+                 elements=None):
+        self.circuit = circuit.replace(' ', '')
+        self.constants = dict(constants) if constants else {}
+        self.elements = get_registry(elements)
+        self.num_params = 0
+        self.param_names = []
+        self.tree = self._parse(self.circuit)
+        if simplify:
+            self.tree = simplify_tree(self.tree)
+
+    def _parse(self, circuit):
+        series = split_circuit(circuit, '-')
+        if len(series) > 1:
+            return Series([self._parse(branch) for branch in series])
+
+        if circuit.startswith('p(') and circuit.endswith(')'):
+            parallel = split_circuit(circuit[2:-1], ',')
+            return Parallel([self._parse(branch) for branch in parallel])
+
+        raw_element = get_element_from_name(circuit)
+        if raw_element not in self.elements or raw_element in ['s', 'p']:
+            raise ValueError(f'{raw_element} not in allowed elements ' +
+                             f'({self.elements.keys()})')
+        wrapper = self.elements[raw_element]
+        kernel = getattr(wrapper, '__wrapped__', wrapper)
+
+        slots = []
+        for j in range(wrapper.num_params):
+            if wrapper.num_params > 1:
+                name = '{}_{}'.format(circuit, j)
+            else:
+                name = circuit
+
+            if name in self.constants:
+                slots.append(float(self.constants[name]))
+            else:
+                slots.append(self.num_params)
+                self.param_names.append(name)
+                self.num_params += 1
+        return Element(circuit, kernel, slots)
+
+    def __call__(self, frequencies, parameters):
+        """ Evaluates the circuit impedance
+
+        Parameters
+        ----------
+        frequencies : array_like of floats, shape (n_freq,)
+            Frequencies
+        parameters : array_like of floats, shape (..., n_params)
+            Circuit parameters. Leading dimensions are treated as a batch
+            of independent parameter sets.
+
+        Returns
+        -------
+        impedance : np.ndarray of complex, shape (..., n_freq)
+            Impedance of each parameter set at each frequency
+        """
+        frequencies = np.asarray(frequencies, dtype=float)
+        parameters = np.asarray(parameters, dtype=float)
+        if np.shape(parameters)[-1:] != (self.num_params,):
+            raise ValueError(f'expected {self.num_params} parameters for ' +
+                             f'{self.circuit}, got {np.shape(parameters)}')
+
+        Z = self.tree.evaluate(frequencies, parameters)
+        shape = parameters.shape[:-1] + frequencies.shape
+        if np.shape(Z) != shape:
+            Z = np.broadcast_to(Z, shape)
+        return np.array(Z, dtype=complex)
+
+    def jacobian(self, frequencies, parameters):
+        """ Evaluates the circuit impedance and its exact derivatives with
+        respect to the parameters using forward-mode automatic
+        differentiation (see :mod:`impedance.models.circuits.dual`)
+
+        Parameters
+        ----------
+        frequencies : array_like of floats, shape (n_freq,)
+            Frequencies
+        parameters : array_like of floats, shape (..., n_params)
+            Circuit parameters
+
+        Returns
+        -------
+        impedance : np.ndarray of complex, shape (..., n_freq)
+            Impedance of each parameter set at each frequency
+        jacobian : np.ndarray of complex, shape (..., n_freq, n_params)
+            Derivatives of the impedance with respect to each parameter
+
+        Raises
+        ------
+        TypeError
+            If an element kernel fails on dual numbers or uses operations
+            that they do not support
+        """
+        frequencies = np.asarray(frequencies, dtype=float)
+        parameters = np.asarray(parameters, dtype=float)
+        if np.shape(parameters)[-1:] != (self.num_params,):
+            raise ValueError(f'expected {self.num_params} parameters for ' +
+                             f'{self.circuit}, got {np.shape(parameters)}')
+
+        try:
+            Z = self.tree.evaluate(frequencies, seed(parameters))
+        except (TypeError, ValueError, AttributeError, IndexError) as error:
+            # kernels written for floats fail in many ways on dual numbers,
+            # e.g. math functions, missing array methods or scipy.special
+            raise TypeError(f'{self.circuit} cannot be evaluated on dual ' +
+                            f'numbers: {error}') from error
+        if not isinstance(Z, DualArray) or Z.value.dtype == object:
+            raise TypeError(f'{self.circuit} cannot be evaluated on dual ' +
+                            'numbers: an element kernel does not propagate ' +
+                            'derivatives')
+
+        shape = parameters.shape[:-1] + frequencies.shape
+        value = np.broadcast_to(Z.value, shape)
+        tangent = np.broadcast_to(_tangent(Z, len(shape)),
+                                  (self.num_params,) + shape)
+        return (np.array(value, dtype=complex),
+                np.moveaxis(np.array(tangent, dtype=complex), 0, -1))
+
+    def __repr__(self):
+        return 'CompiledCircuit({!r})'.format(self.circuit)
@@ -0,0 +1,232 @@
+"""
+Forward-mode automatic differentiation of circuit elements
+
+Element kernels written with plain NumPy arithmetic and ufuncs can be
+evaluated on a :class:`DualArray`, which carries the derivatives of every
+value with respect to a set of parameters alongside the values themselves.
+Evaluating a circuit once on dual parameters gives its exact Jacobian.
+"""
+
+import numpy as np
+
+
+def _derivatives(x):
+    """ derivatives of supported single argument ufuncs at x """
+    return {
+        np.negative: lambda: -np.ones_like(x),
+        np.positive: lambda: np.ones_like(x),
+        np.reciprocal: lambda: -1 / x**2,
+        np.sqrt: lambda: 0.5 / np.sqrt(x),
+        np.square: lambda: 2 * x,
+        np.exp: lambda: np.exp(x),
+        np.log: lambda: 1 / x,
+        np.log10: lambda: 1 / (x * np.log(10)),
+        np.sin: lambda: np.cos(x),
+        np.cos: lambda: -np.sin(x),
+        np.tan: lambda: 1 + np.tan(x)**2,
+        np.sinh: lambda: np.cosh(x),
+        np.cosh: lambda: np.sinh(x),
+        np.tanh: lambda: 1 - np.tanh(x)**2,
+        np.arctan: lambda: 1 / (1 + x**2),
+    }
+
+
+_unary = list(_derivatives(0).keys())
+_comparisons = [np.less, np.less_equal, np.greater, np.greater_equal,
+                np.equal, np.not_equal, np.isfinite, np.isnan]
+
+
+class DualArray:
+    """ An array of values with derivatives along several directions
+
+    Parameters
+    ----------
+    value : array_like
+        Values, of any shape S
+    tangent : array_like
+        Derivatives of the values, of shape (n_directions,) + S
+
+    Notes
+    -----
+    Supports the arithmetic operators, comparisons, `.real` and `.imag`,
+    indexing, `numpy.where`, and the ufuncs `negative`, `reciprocal`,
+    `sqrt`, `square`, `exp`, `log`, `log10`, `sin`, `cos`, `tan`, `sinh`,
+    `cosh`, `tanh`, `arctan`, `absolute` and `conjugate`. Derivatives of
+    complex values are taken with respect to real parameters.
+    """
+    __array_priority__ = 100
+
+    def __init__(self, value, tangent):
+        self.value = np.asarray(value)
+        self.tangent = np.asarray(tangent)
+
+    @property
+    def shape(self):
+        return self.value.shape
+
+    @property
+    def ndim(self):
+        return self.value.ndim
+
+    @property
+    def real(self):
+        return DualArray(self.value.real, self.tangent.real)
+
+    @property
+    def imag(self):
+        return DualArray(self.value.imag, self.tangent.imag)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        if Ellipsis not in index:
+            index = index + (Ellipsis,)
+        return DualArray(self.value[index],
+                         self.tangent[(slice(None),) + index])
+
+    def __repr__(self):
+        return 'DualArray({!r}, {!r})'.format(self.value, self.tangent)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or kwargs:
+            return NotImplemented
+
+        values = [_value(x) for x in inputs]
+        if ufunc in _comparisons:
+            return ufunc(*values)
+
+        if ufunc in _unary:
+            x, = inputs
+            return DualArray(ufunc(x.value),
+                             _derivatives(x.value)[ufunc]() * _tangent(x))
+        elif ufunc is np.absolute:
+            x, = inputs
+            scale = np.conj(x.value) / np.abs(x.value) \
+                if np.iscomplexobj(x.value) else np.sign(x.value)
+            return DualArray(np.abs(x.value), (scale * _tangent(x)).real)
+        elif ufunc is np.conjugate:
+            x, = inputs
+            return DualArray(np.conj(x.value), np.conj(x.tangent))
+
+        a, b = inputs
+        va, vb = values
+        shape = np.broadcast(va, vb).shape
+        ta, tb = _tangent(a, len(shape)), _tangent(b, len(shape))
+        if ufunc is np.add:
+            return DualArray(va + vb, ta + tb)
+        elif ufunc is np.subtract:
+            return DualArray(va - vb, ta - tb)
+        elif ufunc is np.multiply:
+            return DualArray(va * vb, ta * vb + va * tb)
+        elif ufunc in [np.true_divide, np.divide]:
+            return DualArray(va / vb, (ta * vb - va * tb) / vb**2)
+        elif ufunc is np.power:
+            value = va**vb
+            tangent = vb * va**(vb - 1) * ta
+            if isinstance(b, DualArray):
+                tangent = tangent + value * np.log(va) * tb
+            return DualArray(value, tangent)
+        return NotImplemented
+
+    def __array_function__(self, func, types, args, kwargs):
+        if func is np.where and not kwargs:
+            condition, x, y = args
+            shape = np.broadcast(condition, _value(x), _value(y)).shape
+            return DualArray(np.where(condition, _value(x), _value(y)),
+                             np.where(condition, _tangent(x, len(shape)),
+                                      _tangent(y, len(shape))))
+        elif func in [np.shape, np.ndim, np.iscomplexobj]:
+            return func(self.value)
+        return NotImplemented
+
+    def __add__(self, other):
+        return np.add(self, other)
+
+    def __radd__(self, other):
+        return np.add(other, self)
+
+    def __sub__(self, other):
+        return np.subtract(self, other)
+
+    def __rsub__(self, other):
+        return np.subtract(other, self)
+
+    def __mul__(self, other):
+        return np.multiply(self, other)
+
+    def __rmul__(self, other):
+        return np.multiply(other, self)
+
+    def __truediv__(self, other):
+        return np.true_divide(self, other)
+
+    def __rtruediv__(self, other):
+        return np.true_divide(other, self)
+
+    def __pow__(self, other):
+        return np.power(self, other)
+
+    def __rpow__(self, other):
+        return np.power(other, self)
+
+    def __neg__(self):
+        return np.negative(self)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return np.absolute(self)
+
+    def __lt__(self, other):
+        return np.less(self, other)
+
+    def __le__(self, other):
+        return np.less_equal(self, other)
+
+    def __gt__(self, other):
+        return np.greater(self, other)
+
+    def __ge__(self, other):
+        return np.greater_equal(self, other)
+
+
+def _value(x):
+    return x.value if isinstance(x, DualArray) else x
+
+
+def _tangent(x, ndim=None):
+    """ tangent of x, with axes inserted after the direction axis so that
+    it broadcasts against a result with `ndim` dimensions """
+    if not isinstance(x, DualArray):
+        return 0
+    if ndim is None or ndim == x.value.ndim:
+        return x.tangent
+    padding = (1,) * (ndim - x.value.ndim)
+    return x.tangent.reshape(x.tangent.shape[:1] + padding + x.value.shape)
+
+
+def seed(parameters):
+    """ Dual parameters whose tangents are the unit vectors
+
+    Parameters
+    ----------
+    parameters : array_like, shape (..., n_params)
+        Parameter values
+
+    Returns
+    -------
+    dual : DualArray
+        Parameters with tangent shape (n_params, ..., n_params), so that the
+        tangent of any result is its derivative with respect to each
+        parameter
+    """
+    parameters = np.asarray(parameters, dtype=float)
+    n_params = parameters.shape[-1]
+    tangent = np.zeros((n_params,) + parameters.shape)
+    for j in range(n_params):
+        tangent[j, ..., j] = 1
+    return DualArray(parameters, tangent)
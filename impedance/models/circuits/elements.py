@@ -1,3 +1,7 @@
+import functools
+import threading
+from collections.abc import Mapping
+
 import numpy as np
 
 
@@ -12,6 +16,10 @@ class OverwriteError(ElementError):
 def element(num_params, units, overwrite=False):
     """decorator to store metadata for a circuit element
 
+    Registers the element in the default registry (and in
+    `circuit_elements`), which is shared by every circuit that does not
+    bind an `ElementRegistry` of its own.
+
     Parameters
     ----------
     num_params : int
@@ -24,27 +32,9 @@ def element(num_params, units, overwrite=False):
     """
 
     def decorator(func):
-        def wrapper(p, f):
-            typeChecker(p, f, func.__name__, num_params)
-            return func(p, f)
-
-        wrapper.num_params = num_params
-        wrapper.units = units
-        wrapper.__name__ = func.__name__
-        wrapper.__doc__ = func.__doc__
-
-        global circuit_elements
-        if func.__name__ in ["s", "p"]:
-            raise ElementError("cannot redefine elements 's' (series)" +
-                               "or 'p' (parallel)")
-        elif func.__name__ in circuit_elements and not overwrite:
-            raise OverwriteError(
-                f"element {func.__name__} already exists. " +
-                "If you want to overwrite the existing element," +
-                "use `overwrite=True`."
-            )
-        else:
-            circuit_elements[func.__name__] = wrapper
+        wrapper = default_registry.add(_wrap(func, num_params, units),
+                                       overwrite=overwrite)
+        circuit_elements[func.__name__] = wrapper
         # Adding numpy to circuit_elements for proper evaluation with
         # numpy>=2.0.0 because the scalar representation was changed.
         # "Scalars are now printed as np.float64(3.0) rather than just 3.0."
@@ -57,6 +47,137 @@ def element(num_params, units, overwrite=False):
     return decorator
 
 
+def _wrap(func, num_params, units):
+    """ element function with type checking and metadata """
+    def wrapper(p, f):
+        typeChecker(p, f, func.__name__, num_params)
+        return func(p, f)
+
+    # takes the name, module and docstring of the kernel, so that elements
+    # defined at module level are pickled as references to their module
+    # attribute (e.g. to fit with a derived registry in worker processes),
+    # and keeps a handle on the undecorated kernel (__wrapped__) so that
+    # compiled circuits can evaluate it on arrays of parameters without
+    # type checking
+    functools.update_wrapper(wrapper, func)
+    wrapper.num_params = num_params
+    wrapper.units = units
+    return wrapper
+
+
+class ElementRegistry(Mapping):
+    """ A set of circuit elements, mapping names (e.g. 'CPE') to element
+    functions
+
+    Circuits look up their elements in the registry they are bound to
+    (see the `elements` argument of the circuit classes, `circuit_fit`
+    and `CompiledCircuit`), or in the default registry of the built-in
+    elements and those added with the `element` decorator. A registry
+    derived from another starts with its elements; elements added to it
+    afterwards are only visible to circuits bound to it, so for example
+    each customer of a service can have its own elements and fit in its
+    own thread.
+
+    Adding an element replaces the registry's dictionary with an updated
+    copy, so lookups never see a partial update and need no lock.
+
+    Registries can be pickled, e.g. to fit in worker processes, as long as
+    their elements are defined at module level.
+
+    Parameters
+    ----------
+    elements : dict, optional
+        Elements to start with. Defaults to only series and parallel
+
+    Attributes
+    ----------
+    version : int
+        Number of elements added so far, which caches of compiled circuits
+        use to notice redefined elements
+
+    Examples
+    --------
+    >>> registry = ElementRegistry.default().derive()
+    >>> @registry.element(num_params=1, units=['Ohm'])
+    ... def Rx(p, f):
+    ...     return p[0] * np.ones_like(f)
+    >>> circuit = CustomCircuit('R0-Rx1', initial_guess=[1, 2],
+    ...                         elements=registry)
+    """
+    def __init__(self, elements=None):
+        self._elements = {"s": s, "p": p}
+        if elements is not None:
+            self._elements.update(elements)
+        self._lock = threading.Lock()
+        self.version = 0
+
+    @staticmethod
+    def default():
+        """ The registry used by circuits without one of their own """
+        return default_registry
+
+    def derive(self):
+        """ A new registry with the current elements of this one """
+        return ElementRegistry(self._elements)
+
+    def element(self, num_params, units, overwrite=False):
+        """ decorator adding an element to this registry only (see the
+        `element` decorator for the parameters) """
+        def decorator(func):
+            return self.add(_wrap(func, num_params, units), overwrite)
+        return decorator
+
+    def add(self, function, overwrite=False):
+        """ Adds an element function (decorated with `element`, e.g. from
+        another registry) to this registry
+
+        Raises
+        ------
+        ElementError
+            If the element is named 's' or 'p'
+        OverwriteError
+            If an element of the same name exists and overwrite is False
+        """
+        name = function.__name__
+        if name in ["s", "p"]:
+            raise ElementError("cannot redefine elements 's' (series)" +
+                               "or 'p' (parallel)")
+        with self._lock:
+            if name in self._elements and not overwrite:
+                raise OverwriteError(
+                    f"element {name} already exists. " +
+                    "If you want to overwrite the existing element," +
+                    "use `overwrite=True`."
+                )
+            elements = dict(self._elements)
+            elements[name] = function
+            self._elements = elements
+            self.version += 1
+        return function
+
+    def __getitem__(self, name):
+        return self._elements[name]
+
+    def __iter__(self):
+        return iter(self._elements)
+
+    def __len__(self):
+        return len(self._elements)
+
+    def __reduce__(self):
+        if self is default_registry:
+            return ElementRegistry.default, ()
+        return ElementRegistry, (self._elements,)
+
+    def __repr__(self):
+        return 'ElementRegistry({})'.format(', '.join(self._elements))
+
+
+def get_registry(elements=None):
+    """ the registry `elements`, or the default registry if it is None """
+    return default_registry if elements is None else elements
+
+
 def s(series):
     """sums elements in series
 
@@ -66,9 +187,9 @@ def s(series):
         Z = Z_1 + Z_2 + ... + Z_n
 
     """
-    z = len(series[0]) * [0 + 0 * 1j]
+    z = 0 + 0 * 1j
     for elem in series:
-        z += elem
+        z = z + elem
     return z
 
 
@@ -82,9 +203,9 @@ def p(parallel):
         Z = \\frac{1}{\\frac{1}{Z_1} + \\frac{1}{Z_2} + ... + \\frac{1}{Z_n}}
 
     """
-    z = len(parallel[0]) * [0 + 0 * 1j]
+    z = 0 + 0 * 1j
     for elem in parallel:
-        z += 1 / elem
+        z = z + 1 / elem
     return 1 / z
 
 
@@ -93,6 +214,7 @@ def p(parallel):
 # this maps ex. 'R' to the function R to always give us a list of
 # active elements in any context
 circuit_elements = {"s": s, "p": p}
+default_registry = ElementRegistry()
 
 
 @element(num_params=1, units=["Ohm"])
@@ -107,7 +229,7 @@ def R(p, f):
 
     """
     R = p[0]
-    Z = np.array(len(f) * [R])
+    Z = R * np.ones(len(f))
     return Z
 
 
@@ -395,14 +517,11 @@ def T(p, f):
     A, B, a, b = p[0], p[1], p[2], p[3]
     beta = (a + 1j * omega * b) ** (1 / 2)
 
-    sinh = []
-    for x in beta:
-        if x < 100:
-            sinh.append(np.sinh(x))
-        else:
-            sinh.append(1e10)
+    # cap sinh(beta) at large beta to avoid overflow at high frequencies
+    small = beta.real < 100
+    sinh = np.where(small, np.sinh(np.where(small, beta, 0)), 1e10)
 
-    Z = A / (beta * np.tanh(beta)) + B / (beta * np.array(sinh))
+    Z = A / (beta * np.tanh(beta)) + B / (beta * sinh)
     return Z
 
 
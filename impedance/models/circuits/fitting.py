@@ -1,10 +1,14 @@
+import time
 import warnings
+from functools import lru_cache
 
 import numpy as np
-from scipy.linalg import inv
-from scipy.optimize import curve_fit, basinhopping
+from scipy.linalg import cholesky, inv, solve_triangular
+from scipy.optimize import OptimizeResult, curve_fit, basinhopping
 
-from .elements import circuit_elements, get_element_from_name
+from .compiler import CompiledCircuit
+from .elements import ElementRegistry, get_element_from_name, get_registry
+from .jit import JITCircuit
 
 ints = '0123456789'
 
@@ -25,7 +29,7 @@ def rmse(a, b):
     return np.linalg.norm(a - b) / np.sqrt(n)
 
 
-def set_default_bounds(circuit, constants={}):
+def set_default_bounds(circuit, constants={}, elements=None):
     """ This function sets default bounds for optimization.
 
     set_default_bounds sets bounds of 0 and np.inf for all parameters,
@@ -40,6 +44,9 @@ def set_default_bounds(circuit, constants={}):
         Parameters and their values to hold constant during fitting
         (e.g. {"RO": 0.1}). Defaults to {}
 
+    elements : ElementRegistry, optional
+        Registry to look up elements in. Defaults to the default registry
+
     Returns
     ------------
     bounds : 2-tuple of array_like
@@ -53,7 +60,7 @@ def set_default_bounds(circuit, constants={}):
     lower_bounds, upper_bounds = [], []
     for elem in extracted_elements:
         raw_element = get_element_from_name(elem)
-        for i in range(check_and_eval(raw_element).num_params):
+        for i in range(check_and_eval(raw_element, elements).num_params):
             if elem in constants or elem + f'_{i}' in constants:
                 continue
             if raw_element in ['CPE', 'La'] and i == 1:
@@ -66,9 +73,53 @@ def set_default_bounds(circuit, constants={}):
     return bounds
 
 
+def decimate_frequencies(frequencies, n_points):
+    """ Selects a subset of frequencies spaced evenly in log frequency
+
+    Parameters
+    ----------
+    frequencies : numpy array
+        Frequencies
+    n_points : int
+        Number of frequencies to select
+
+    Returns
+    -------
+    indices : numpy array of ints
+        Sorted indices of the selected frequencies (all indices if
+        n_points >= len(frequencies))
+    """
+    f = np.array(frequencies, dtype=float)
+    if n_points >= len(f):
+        return np.arange(len(f))
+
+    order = np.argsort(f)
+    log_f = np.log10(f[order])
+    targets = np.linspace(log_f[0], log_f[-1], n_points)
+    nearest = np.searchsorted(log_f, targets).clip(1, len(f) - 1)
+    closer_below = targets - log_f[nearest - 1] < log_f[nearest] - targets
+    nearest = np.where(closer_below, nearest - 1, nearest)
+    return np.sort(order[np.unique(nearest)])
+
+
+def _coarse_schedule(n_data, coarse_to_fine):
+    """ Grid sizes of the coarse stages in a coarse-to-fine fit """
+    if coarse_to_fine is True:
+        sizes = [40]
+        while 4 * sizes[-1] < n_data:
+            sizes.append(4 * sizes[-1])
+    elif isinstance(coarse_to_fine, (int, np.integer)):
+        sizes = [int(coarse_to_fine)]
+    else:
+        sizes = sorted(coarse_to_fine)
+    return [n for n in sizes if n < n_data]
+
+
 def circuit_fit(frequencies, impedances, circuit, initial_guess, constants={},
                 bounds=None, weight_by_modulus=False, global_opt=False,
-                **kwargs):
+                coarse_to_fine=False, jit=False, time_budget=None,
+                iteration_callback=None, full_output=False,
+                record_history=False, elements=None, stop=None, **kwargs):
 
     """ Main function for fitting an equivalent circuit to data.
 
@@ -113,9 +164,58 @@ def circuit_fit(frequencies, impedances, circuit, initial_guess, constants={},
         If global optimization should be used (uses the basinhopping
         algorithm). Defaults to False
 
+    coarse_to_fine : bool, int, or list of ints, optional
+        Fits log-spaced subsets of the frequencies first, seeding each
+        stage with the previous result, before the final fit on all data.
+        True uses grids of 40, 160, 640, ... points; an int or list of ints
+        sets the grid sizes. Intermediate stages use ftol=1e-8 unless ftol
+        is given. Speeds up fits of densely sampled spectra. Only the fit
+        on all data is passed to `iteration_callback` and recorded in the
+        cost history. Only applicable when global_opt = False. Defaults to
+        False
+
+    jit : bool, optional
+        Evaluates the circuit with a numba-compiled
+        :class:`~impedance.models.circuits.jit.JITCircuit` (falls back to
+        NumPy with a warning if numba is not installed). Defaults to False
+
+    time_budget : float, optional
+        Maximum wall-clock time for the fit in seconds. The budget is
+        checked after every evaluation of the circuit; once it is spent the
+        fit stops and the best parameters evaluated so far are returned,
+        flagged as not converged, with one standard deviation errors of
+        NaN. Defaults to None (no limit)
+
+    iteration_callback : callable, optional
+        Called as ``iteration_callback(parameters, cost)`` whenever the fit
+        evaluates parameters with a lower cost than any before, where cost
+        is half the (weighted) sum of squared residuals. Returning True
+        stops the fit as if the time budget was spent. Defaults to None
+
+    full_output : bool, optional
+        Also return a :class:`FitResult` describing the fit. Defaults to
+        False
+
+    record_history : bool, optional
+        Record the cost of every circuit evaluation in the
+        `cost_history` of the :class:`FitResult`. Defaults to False
+
+    elements : ElementRegistry, optional
+        Registry to look up the circuit's elements in. Defaults to the
+        default registry
+
+    stop : callable, optional
+        Called without arguments after every evaluation of the circuit
+        and of its Jacobian. Returning True stops the fit as if the time
+        budget was spent, e.g. ``stop=event.is_set`` to stop a fit from
+        another thread. Defaults to None
+
     kwargs :
         Keyword arguments passed to scipy.optimize.curve_fit or
-        scipy.optimize.basinhopping
+        scipy.optimize.basinhopping. For local fits, jac='dual' computes
+        the exact Jacobian with dual numbers (see `wrapCircuitJacobian`)
+        instead of finite differences, falling back to finite differences
+        with a warning if an element does not support dual numbers
 
     Returns
     ------------
@@ -125,20 +225,70 @@ def circuit_fit(frequencies, impedances, circuit, initial_guess, constants={},
     p_errors : list of floats
         one standard deviation error estimates for fit parameters
 
+    info : FitResult
+        Only returned if full_output is True. Whether or not it is
+        returned, it is passed to every hook added with
+        :func:`register_fit_hook`. If full_output is False, stopping early
+        raises a warning
+
     Notes
     ---------
     Need to do a better job of handling errors in fitting.
     Currently, an error of -1 is returned.
 
     """
+    start = time.perf_counter()
+    popt, perror, info = _circuit_fit(frequencies, impedances, circuit,
+                                      initial_guess, constants, bounds,
+                                      weight_by_modulus, global_opt,
+                                      coarse_to_fine, jit, time_budget,
+                                      iteration_callback, record_history,
+                                      elements, stop, kwargs)
+    info.timings['total'] = time.perf_counter() - start
+
+    for hook in list(_fit_hooks):
+        try:
+            hook(info)
+        except Exception as error:
+            warnings.warn(f'fit hook {hook!r} failed: {error!r}')
+
+    if not info.converged and not full_output:
+        reason = 'stopped early' if info.stopped else 'did not converge'
+        warnings.warn(f'fit {reason} ({info.message}), returning the ' +
+                      'best parameters found')
+
+    if full_output:
+        return popt, perror, info
+    return popt, perror
+
+
+def _circuit_fit(frequencies, impedances, circuit, initial_guess, constants,
+                 bounds, weight_by_modulus, global_opt, coarse_to_fine, jit,
+                 time_budget, iteration_callback, record_history, elements,
+                 stop, kwargs):
+    """ circuit_fit without hooks or warnings about stopping early, which
+    is also used for the stages of coarse-to-fine fits """
+    start = time.perf_counter()
     f = np.array(frequencies, dtype=float)
     Z = np.array(impedances, dtype=complex)
+    data = np.hstack([Z.real, Z.imag])
+    deadline = None
+    if time_budget is not None:
+        deadline = start + time_budget
 
     # set upper and lower bounds on a per-element basis
     if bounds is None:
-        bounds = set_default_bounds(circuit, constants=constants)
+        bounds = set_default_bounds(circuit, constants=constants,
+                                    elements=elements)
+
+    model = wrapCircuit(circuit, constants, jit, elements)
+    stopped, nfev = None, 0
+    success, message, status, failures = True, 'converged', None, None
 
     if not global_opt:
+        stage_kwargs = dict(kwargs)
+        stage_kwargs.setdefault('ftol', 1e-8)
+
         if 'maxfev' not in kwargs:
             kwargs['maxfev'] = 1e5
         if 'ftol' not in kwargs:
@@ -149,19 +299,86 @@ def circuit_fit(frequencies, impedances, circuit, initial_guess, constants={},
             abs_Z = np.abs(Z)
             kwargs['sigma'] = np.hstack([abs_Z, abs_Z])
 
-        popt, pcov = curve_fit(wrapCircuit(circuit, constants), f,
-                               np.hstack([Z.real, Z.imag]),
-                               p0=initial_guess, bounds=bounds, **kwargs)
+        if isinstance(kwargs.get('jac'), str) and kwargs['jac'] == 'dual':
+            kwargs['jac'] = wrapCircuitJacobian(circuit, constants,
+                                                elements)
+            try:
+                kwargs['jac'](f, *initial_guess)
+            except TypeError as error:
+                warnings.warn(f'{error}, using finite differences instead')
+                del kwargs['jac']
+
+        weights = 1
+        if kwargs.get('sigma') is not None:
+            sigma = np.asarray(kwargs['sigma'], dtype=float)
+            if sigma.ndim == 1:
+                weights = 1 / sigma
+            else:
+                # residuals are whitened with the Cholesky factor of the
+                # covariance, as in scipy.optimize.curve_fit
+                weights = cholesky(sigma, lower=True)
+        monitor = _FitMonitor(model, data, weights, deadline,
+                              iteration_callback, record_history, stop)
+        if callable(kwargs.get('jac')):
+            kwargs['jac'] = monitor.wrap(kwargs['jac'])
+        optimize = time.perf_counter()
+
+        if coarse_to_fine:
+            for n_points in _coarse_schedule(len(f), coarse_to_fine):
+                subset = decimate_frequencies(f, n_points)
+                if kwargs.get('sigma') is not None and not weight_by_modulus:
+                    rows = np.hstack([subset, len(f) + subset])
+                    stage_kwargs['sigma'] = sigma[np.ix_(rows, rows)] \
+                        if sigma.ndim == 2 else sigma[rows]
+                # costs on a subset are not comparable to those on all of
+                # the data, so stages are not passed to iteration_callback
+                # or recorded in the history
+                initial_guess, _, stage = _circuit_fit(
+                    f[subset], Z[subset], circuit, initial_guess, constants,
+                    bounds, weight_by_modulus, False, False, jit,
+                    _remaining(deadline), None, False, elements, stop,
+                    dict(stage_kwargs))
+                nfev += stage.nfev
+                if stage.stopped:
+                    # finish with a single evaluation on all of the data
+                    monitor.deadline = time.perf_counter()
+                    stopped = stage.message
+                    break
 
-        # Calculate one standard deviation error estimates for fit parameters,
-        # defined as the square root of the diagonal of the covariance matrix.
-        # https://stackoverflow.com/a/52275674/5144795
-        perror = np.sqrt(np.diag(pcov))
+        try:
+            popt, pcov, _, message, status = curve_fit(
+                monitor, f, data, p0=initial_guess, bounds=bounds,
+                full_output=True, **kwargs)
+            covariance = time.perf_counter()
+
+            # Calculate one standard deviation error estimates for fit
+            # parameters, defined as the square root of the diagonal of the
+            # covariance matrix. https://stackoverflow.com/a/52275674/5144795
+            perror = np.sqrt(np.diag(pcov))
+        except _StopFit as stop:
+            covariance = time.perf_counter()
+            stopped = stopped or str(stop)
+            popt = monitor.best_parameters
+            perror = np.full(len(popt), np.nan)
+        except RuntimeError as error:
+            # curve_fit raises instead of returning when the optimizer
+            # fails, e.g. when it runs out of function evaluations
+            if not str(error).startswith('Optimal parameters not found'):
+                raise
+            covariance = time.perf_counter()
+            success, message = False, str(error)
+            popt = monitor.best_parameters
+            perror = np.full(len(popt), np.nan)
+        method, nit = 'curve_fit', monitor.njev or None
 
     else:
         if 'seed' not in kwargs:
             kwargs['seed'] = 0
 
+        weights = 1
+        monitor = _FitMonitor(model, data, weights, deadline,
+                              iteration_callback, record_history, stop)
+
         def opt_function(x):
             """ Short function for basinhopping to optimize over.
             We want to minimize the RMSE between the fit and the data.
@@ -176,8 +393,7 @@ def circuit_fit(frequencies, impedances, circuit, initial_guess, constants={},
             function
                 Returns a function (RMSE as a function of parameters).
             """
-            return rmse(wrapCircuit(circuit, constants)(f, *x),
-                        np.hstack([Z.real, Z.imag]))
+            return rmse(monitor(f, *x), data)
 
         class BasinhoppingBounds(object):
             """ Adapted from the basinhopping documetation
@@ -196,28 +412,257 @@ def circuit_fit(frequencies, impedances, circuit, initial_guess, constants={},
 
         basinhopping_bounds = BasinhoppingBounds(xmin=bounds[0],
                                                  xmax=bounds[1])
-        results = basinhopping(opt_function, x0=initial_guess,
-                               accept_test=basinhopping_bounds, **kwargs)
-        popt = results.x
-
-        # Calculate perror
-        jac = results.lowest_optimization_result['jac'][np.newaxis]
+        optimize = time.perf_counter()
         try:
-            # jacobian -> covariance
-            # https://stats.stackexchange.com/q/231868
-            pcov = inv(np.dot(jac.T, jac)) * opt_function(popt) ** 2
-            # covariance -> perror (one standard deviation
-            # error estimates for fit parameters)
-            perror = np.sqrt(np.diag(pcov))
-        except (ValueError, np.linalg.LinAlgError):
-            warnings.warn('Failed to compute perror')
-            perror = None
+            results = basinhopping(opt_function, x0=initial_guess,
+                                   accept_test=basinhopping_bounds, **kwargs)
+        except _StopFit as stop:
+            covariance = time.perf_counter()
+            stopped = str(stop)
+            popt = monitor.best_parameters
+            perror = np.full(len(popt), np.nan)
+            nit = None
+        else:
+            covariance = time.perf_counter()
+            popt, nit = results.x, results.nit
+            lowest = results.lowest_optimization_result
+            success, message = lowest.success, lowest.message
+            status = lowest.get('status')
+            failures = results.minimization_failures
+
+            # Calculate perror
+            jac = results.lowest_optimization_result['jac'][np.newaxis]
+            try:
+                # jacobian -> covariance
+                # https://stats.stackexchange.com/q/231868
+                pcov = inv(np.dot(jac.T, jac)) * \
+                    rmse(model(f, *popt), data) ** 2
+                # covariance -> perror (one standard deviation
+                # error estimates for fit parameters)
+                perror = np.sqrt(np.diag(pcov))
+            except (ValueError, np.linalg.LinAlgError):
+                warnings.warn('Failed to compute perror')
+                perror = None
+        method = 'basinhopping'
+
+    end = time.perf_counter()
+    cost = _cost(model(f, *popt) - data, weights)
+    info = FitResult(
+        circuit=circuit, method=method, parameters=popt, perror=perror,
+        cost=cost, converged=stopped is None and bool(success),
+        stopped=stopped is not None, message=stopped or message,
+        status=status, minimization_failures=failures,
+        nfev=nfev + monitor.nfev,
+        njev=monitor.njev, nit=nit, n_data=len(data),
+        timings={'setup': optimize - start,
+                 'optimize': covariance - optimize,
+                 'covariance': end - covariance},
+        cost_history=np.array(monitor.history) if record_history else None)
+    return popt, perror, info
+
+
+class FitResult(OptimizeResult):
+    """ Summary of a call to :func:`circuit_fit`
+
+    A dictionary whose items are also accessible as attributes.
+
+    Attributes
+    ----------
+    circuit : str
+        The circuit that was fit
+    method : {'curve_fit', 'basinhopping'}
+        Optimizer used
+    parameters : numpy array
+        Best fit parameters
+    perror : numpy array or None
+        One standard deviation error estimates of the parameters
+    cost : float
+        Half the (weighted) sum of squared residuals at the parameters
+    converged : bool
+        False if the fit was stopped early or the optimizer did not
+        succeed, e.g. because it ran out of function evaluations
+    stopped : bool
+        True if the fit was stopped early by its time budget, callback or
+        `stop`
+    message : str
+        Why the fit ended: the optimizer's message, or why it was stopped
+    status : int or None
+        Status of the optimizer (`ier` of scipy.optimize.curve_fit, or the
+        status of the lowest minimization of basinhopping), where known
+    minimization_failures : int or None
+        Number of failed local minimizations of basinhopping
+    nfev : int
+        Number of circuit evaluations, including those for finite
+        difference Jacobians and coarse-to-fine stages
+    njev : int
+        Number of evaluations of an exact Jacobian (jac='dual')
+    nit : int or None
+        Number of iterations where known: basinhopping steps, or Jacobian
+        evaluations for local fits with an exact Jacobian
+    n_data : int
+        Number of residuals (twice the number of frequencies)
+    timings : dict
+        Wall-clock seconds spent on 'setup' (parsing, bounds), 'optimize'
+        (including the covariance scipy.optimize.curve_fit computes),
+        'covariance' (parameter errors) and the 'total'
+    cost_history : numpy array or None
+        Cost of every circuit evaluation on all of the data (not those of
+        coarse-to-fine stages), if record_history was True
+    """
 
-    return popt, perror
+
+_fit_hooks = []
+
+
+def register_fit_hook(hook):
+    """ Calls a function with the :class:`FitResult` of every subsequent
+    :func:`circuit_fit` (and so every `fit` of a circuit model)
+
+    Parameters
+    ----------
+    hook : callable
+        Called as ``hook(result)``. Exceptions raised by the hook are
+        turned into warnings so they cannot break a fit.
+
+    Returns
+    -------
+    hook : callable
+        The hook, so that this can be used as a decorator
+
+    Examples
+    --------
+    >>> @register_fit_hook
+    ... def log_fit(result):
+    ...     metrics.send(result.circuit, result.nfev,
+    ...                  result.timings['total'])
+    """
+    _fit_hooks.append(hook)
+    return hook
+
+
+def unregister_fit_hook(hook):
+    """ Stops calling a hook added with :func:`register_fit_hook`
+
+    Parameters
+    ----------
+    hook : callable
+        A registered hook
+    """
+    _fit_hooks.remove(hook)
 
 
-def wrapCircuit(circuit, constants):
-    """ wraps function so we can pass the circuit string """
+def _cost(residuals, weights):
+    """ half the sum of squared weighted residuals, where weights are
+    1 / sigma or the lower Cholesky factor of a covariance matrix sigma """
+    if np.ndim(weights) == 2:
+        residuals = solve_triangular(weights, residuals, lower=True)
+    else:
+        residuals = residuals * weights
+    return 0.5 * np.sum(residuals**2)
+
+
+class _StopFit(Exception):
+    """ raised from within an optimizer to end a fit early """
+
+
+class _FitMonitor:
+    """ Wraps the circuit function passed to an optimizer, counting
+    evaluations and keeping the best parameters evaluated so far. Ends the
+    fit by raising _StopFit after an evaluation that exceeds the deadline
+    or for which the iteration callback or `stop` returns True. """
+    def __init__(self, function, data, weights, deadline, callback,
+                 record_history=False, stop=None):
+        self.function = function
+        self.data = data
+        self.weights = weights
+        self.deadline = deadline
+        self.callback = callback
+        self.record_history = record_history
+        self.stop = stop
+        self.nfev = 0
+        self.njev = 0
+        self.history = []
+        self.best_cost = np.inf
+        self.best_parameters = None
+
+    def __call__(self, frequencies, *parameters):
+        y = self.function(frequencies, *parameters)
+        self.nfev += 1
+
+        cost = _cost(y - self.data, self.weights)
+        if self.record_history:
+            self.history.append(cost)
+        if cost < self.best_cost or self.best_parameters is None:
+            self.best_cost = cost
+            self.best_parameters = np.array(parameters, dtype=float)
+            if self.callback is not None and \
+                    self.callback(self.best_parameters.copy(), cost):
+                raise _StopFit('stopped by iteration_callback')
+        self.check()
+        return y
+
+    def check(self):
+        if self.stop is not None and self.stop():
+            raise _StopFit('stopped')
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise _StopFit('time_budget exceeded')
+
+    def wrap(self, jacobian):
+        """ checks the deadline and `stop` after each evaluation of a
+        Jacobian """
+        def wrapped(frequencies, *parameters):
+            J = jacobian(frequencies, *parameters)
+            self.njev += 1
+            self.check()
+            return J
+        return wrapped
+
+
+def _remaining(deadline):
+    """ seconds left until a deadline (or None if there is none) """
+    if deadline is None:
+        return None
+    return max(deadline - time.perf_counter(), 0)
+
+
+def _compile(circuit, constants, jit=False, elements=None):
+    """ compiled circuit, shared between models and fits with the same
+    circuit string and constants (compiled circuits are not modified by
+    evaluating them) """
+    compiled = JITCircuit if jit else CompiledCircuit
+    if elements is not None:
+        # only circuits of the default registry are cached
+        return compiled(circuit, constants, elements=elements)
+    key = tuple(sorted(constants.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return compiled(circuit, constants)
+    # keyed on the registry's version, so redefined elements take effect
+    return _compile_cached(circuit, key, bool(jit),
+                           ElementRegistry.default().version)
+
+
+@lru_cache(maxsize=256)
+def _compile_cached(circuit, constants, jit, version):
+    if jit:
+        return JITCircuit(circuit, dict(constants))
+    return CompiledCircuit(circuit, dict(constants))
+
+
+def wrapCircuit(circuit, constants, jit=False, elements=None):
+    """ wraps function so we can pass the circuit string
+
+    The circuit is parsed and simplified once into a
+    :class:`~impedance.models.circuits.compiler.CompiledCircuit`, or
+    compiled with numba into a
+    :class:`~impedance.models.circuits.jit.JITCircuit` if jit is True,
+    looking up elements in the registry `elements` (default registry if
+    None). Circuits of the default registry are compiled once and shared
+    between fits
+    """
+    model = _compile(circuit, constants, jit, elements)
+
     def wrappedCircuit(frequencies, *parameters):
         """ returns a stacked array of real and imaginary impedance
         components
@@ -234,11 +679,7 @@ def wrapCircuit(circuit, constants):
         array of floats
 
         """
-
-        x = eval(buildCircuit(circuit, frequencies, *parameters,
-                              constants=constants, eval_string='',
-                              index=0)[0],
-                 circuit_elements)
+        x = model(frequencies, parameters)
         y_real = np.real(x)
         y_imag = np.imag(x)
 
@@ -246,6 +687,34 @@ def wrapCircuit(circuit, constants):
     return wrappedCircuit
 
 
+def wrapCircuitJacobian(circuit, constants, elements=None):
+    """ wraps the exact Jacobian of a circuit in the form expected by the
+    `jac` argument of scipy.optimize.curve_fit """
+    model = _compile(circuit, constants, elements=elements)
+
+    def wrappedJacobian(frequencies, *parameters):
+        """ returns the derivatives of the stacked real and imaginary
+        impedance components with respect to each parameter
+
+        Parameters
+        ----------
+        frequencies : list of floats
+        parameters : list of floats
+
+        Returns
+        -------
+        array of floats, shape (2 * n_freq, n_params)
+
+        Raises
+        ------
+        TypeError
+            If an element of the circuit does not support dual numbers
+        """
+        _, J = model.jacobian(frequencies, parameters)
+        return np.vstack([J.real, J.imag])
+    return wrappedJacobian
+
+
 def buildCircuit(circuit, frequencies, *parameters,
                  constants=None, eval_string='', index=0):
     """ recursive function that transforms a circuit, parameters, and
@@ -395,13 +864,15 @@ def extract_circuit_elements(circuit):
     return extracted_elements
 
 
-def calculateCircuitLength(circuit):
+def calculateCircuitLength(circuit, elements=None):
     """ Calculates the number of elements in the circuit.
 
     Parameters
     ----------
     circuit : str
         Circuit string.
+    elements : ElementRegistry, optional
+        Registry to look up elements in. Defaults to the default registry
 
     Returns
     -------
@@ -414,18 +885,21 @@ def calculateCircuitLength(circuit):
         extracted_elements = extract_circuit_elements(circuit)
         for elem in extracted_elements:
             raw_element = get_element_from_name(elem)
-            num_params = check_and_eval(raw_element).num_params
+            num_params = check_and_eval(raw_element, elements).num_params
             length += num_params
     return length
 
 
-def check_and_eval(element):
+def check_and_eval(element, elements=None):
     """ Checks if an element is valid, then evaluates it.
 
     Parameters
     ----------
     element : str
         Circuit element.
+    elements : ElementRegistry, optional
+        Registry to look up the element in. Defaults to the default
+        registry
 
     Raises
     ------
@@ -437,9 +911,9 @@ def check_and_eval(element):
     Evaluated element.
 
     """
-    allowed_elements = circuit_elements.keys()
+    allowed_elements = get_registry(elements).keys()
     if element not in allowed_elements:
         raise ValueError(f'{element} not in ' +
                          f'allowed elements ({allowed_elements})')
     else:
-        return eval(element, circuit_elements)
+        return get_registry(elements)[element]
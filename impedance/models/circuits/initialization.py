@@ -0,0 +1,248 @@
+"""
+Heuristic initial guesses for equivalent circuit fitting
+"""
+
+import numpy as np
+
+from .compiler import CompiledCircuit, Constant, Element, Parallel, Series
+from .elements import get_element_from_name
+from .fitting import set_default_bounds
+from impedance.validation import fit_linKK, get_tc_distribution
+
+# default exponent for constant phase and distributed elements
+ALPHA = 0.9
+
+# parameters of each element for a characteristic resistance R (Ohm),
+# angular frequency w (rad/s) and exponent a (for power-law elements)
+_element_rules = {
+    'R': lambda R, w, a: [R],
+    'C': lambda R, w, a: [1 / (w * R)],
+    'L': lambda R, w, a: [R / w],
+    'W': lambda R, w, a: [R * np.sqrt(w)],
+    'Wo': lambda R, w, a: [R, 1 / w],
+    'Ws': lambda R, w, a: [R, 1 / w],
+    'CPE': lambda R, w, a: [1 / (R * w**a), a],
+    'La': lambda R, w, a: [R**(1 / a) / w, a],
+    'G': lambda R, w, a: [R, 1 / w],
+    'Gs': lambda R, w, a: [R, 1 / w, np.ones_like(R)],
+    'K': lambda R, w, a: [R, 1 / w],
+    'Zarc': lambda R, w, a: [R, 1 / w, a],
+    'TLMQ': lambda R, w, a: [R, 1 / (R * w**a), a],
+    'T': lambda R, w, a: [R, R, np.ones_like(R), 1 / w],
+}
+
+
+def estimate_initial_guess(frequencies, impedances, circuit, constants={},
+                           method='peaks', elements=None):
+    """ Estimates a starting point for fitting a circuit from cheap features
+    of the data
+
+    The high-frequency real intercept sets series resistances, peaks of
+    -Im(Z) set the resistance and characteristic frequency of each
+    parallel group (assigned from high to low frequency in the order they
+    appear in the circuit), and the low-frequency real part and slope of
+    Im(Z) set blocking and diffusion elements in series.
+
+    Parameters
+    -----------------
+    frequencies : numpy array, shape (n_freq,)
+        Frequencies
+
+    impedances : numpy array of dtype 'complex128'
+        Impedances of one spectrum, shape (n_freq,), or of a batch of
+        spectra sharing the frequencies, shape (n_spectra, n_freq)
+
+    circuit : string
+        String defining the equivalent circuit to be fit
+
+    constants : dictionary, optional
+        Parameters and their values to hold constant during fitting
+        (e.g. {"RO": 0.1}). Defaults to {}
+
+    method : {'peaks', 'linKK'}, optional
+        How arcs are located: from local maxima of -Im(Z) ('peaks') or
+        from the distribution of resistances in a lin-KK fit ('linKK'),
+        which is slower but more robust to overlapping arcs.
+        Defaults to 'peaks'
+
+    elements : ElementRegistry, optional
+        Registry to look up the circuit's elements in. Defaults to the
+        default registry
+
+    Returns
+    ------------
+    initial_guess : numpy array, shape (n_params,) or (n_spectra, n_params)
+        Initial guesses within the default bounds of the circuit
+
+    Notes
+    -----
+    Elements added with the `element` decorator that are not known to the
+    heuristics are started at 1 for every parameter.
+    """
+    f = np.array(frequencies, dtype=float)
+    Z = np.array(impedances, dtype=complex)
+    single = Z.ndim == 1
+    Z = np.atleast_2d(Z)
+    if Z.shape[1] != f.size:
+        raise ValueError('length of frequencies and impedances do not match')
+
+    # work from high to low frequency
+    order = np.argsort(f)[::-1]
+    f, Z = f[order], Z[:, order]
+    w = 2 * np.pi * f
+
+    model = CompiledCircuit(circuit, constants, elements=elements)
+    top = model.tree.children if isinstance(model.tree, Series) \
+        else [model.tree]
+    n_arcs = sum(isinstance(node, Parallel) for node in top)
+
+    scale = np.abs(Z).max(axis=1)
+    tiny = 1e-6 * scale
+    r_hf = np.maximum(Z.real[:, 0], tiny)
+    r_lf = np.maximum(Z.real[:, -1], r_hf + tiny)
+    x_hf = np.maximum(Z.imag[:, 0], tiny)
+    x_lf = np.maximum(-Z.imag[:, -1], tiny)
+    alpha_lf = _low_frequency_exponent(w, Z)
+
+    if method == 'peaks':
+        R_arcs, w_arcs = _arcs_from_peaks(w, Z, r_hf, r_lf, n_arcs)
+    elif method == 'linKK':
+        # series elements other than resistors and inductors show up as a
+        # low-frequency tail in the distribution rather than as an arc
+        tail = any(isinstance(node, Element) and
+                   get_element_from_name(node.name) not in ['R', 'L', 'La']
+                   for node in top)
+        R_arcs, w_arcs, r_hf = _arcs_from_linKK(f, Z, r_hf, r_lf, n_arcs,
+                                                tail)
+    else:
+        raise ValueError("method must be one of 'peaks' or 'linKK' " +
+                         f"(received {method})")
+    r_rest = np.maximum(r_lf - r_hf - R_arcs.sum(axis=1), 0.1 * (r_lf - r_hf))
+
+    n_series_R = sum(isinstance(node, Element) and
+                     get_element_from_name(node.name) == 'R' for node in top)
+    ones = np.ones(len(Z))
+    guess = np.ones((len(Z), model.num_params))
+
+    arc = 0
+    for node in top:
+        if isinstance(node, Constant):
+            continue
+        elif isinstance(node, Parallel):
+            context = (R_arcs[:, arc], w_arcs[:, arc], ALPHA * ones)
+            arc += 1
+        elif get_element_from_name(node.name) == 'R':
+            context = (r_hf / n_series_R, w[0] * ones, ALPHA * ones)
+        elif get_element_from_name(node.name) in ['L', 'La']:
+            context = (x_hf, w[0] * ones, ALPHA * ones)
+        elif get_element_from_name(node.name) in ['C', 'CPE', 'W']:
+            context = (x_lf, w[-1] * ones, alpha_lf)
+        else:
+            context = (r_rest, w[-1] * ones, ALPHA * ones)
+        _assign(node, context, guess)
+
+    lb, ub = set_default_bounds(circuit, constants=constants,
+                                elements=elements)
+    guess[~np.isfinite(guess)] = 1
+    guess = np.clip(guess, lb, ub)
+
+    if single:
+        return guess[0]
+    return guess
+
+
+def _assign(node, context, guess):
+    """ fills in the guesses for every element under a node """
+    if isinstance(node, Element):
+        rule = _element_rules.get(get_element_from_name(node.name))
+        if rule is None:
+            return
+        with np.errstate(all='ignore'):
+            values = rule(*context)
+        for slot, value in zip(node.slots, values):
+            if isinstance(slot, int):
+                guess[:, slot] = value
+    else:
+        for child in node.children:
+            _assign(child, context, guess)
+
+
+def _low_frequency_exponent(w, Z):
+    """ power-law exponent of -Im(Z) over the lowest frequencies """
+    n = min(4, w.size)
+    if n < 2:
+        return ALPHA * np.ones(len(Z))
+    with np.errstate(all='ignore'):
+        slope = -np.diff(np.log(np.abs(Z.imag[:, -n:])), axis=1) / \
+            np.diff(np.log(w[-n:]))
+    alpha = np.nanmedian(np.where(np.isfinite(slope), slope, np.nan), axis=1)
+    return np.clip(np.nan_to_num(alpha, nan=ALPHA), 0.3, 1)
+
+
+def _arcs_from_peaks(w, Z, r_hf, r_lf, n_arcs):
+    """ resistance and angular frequency of the n_arcs largest local maxima
+    of -Im(Z), ordered from high to low frequency. Spectra with fewer
+    maxima fall back to arcs evenly spaced in log frequency. """
+    n = len(Z)
+    R_arcs, w_arcs = _even_arcs(w, r_hf, r_lf, n, n_arcs)
+    if n_arcs == 0 or w.size < 3:
+        return R_arcs, w_arcs
+
+    y = -Z.imag
+    peaks = np.zeros_like(y, dtype=bool)
+    peaks[:, 1:-1] = (y[:, 1:-1] > y[:, :-2]) & (y[:, 1:-1] >= y[:, 2:])
+    peaks &= y > 0.05 * y.max(axis=1, keepdims=True)
+
+    heights = np.where(peaks, y, -np.inf)
+    idx = np.sort(np.argsort(-heights, axis=1)[:, :n_arcs], axis=1)
+    found = np.isfinite(np.take_along_axis(heights, idx, axis=1)).all(axis=1)
+
+    R_arcs[found] = 2 * np.take_along_axis(y, idx, axis=1)[found]
+    w_arcs[found] = w[idx][found]
+    return R_arcs, w_arcs
+
+
+def _arcs_from_linKK(f, Z, r_hf, r_lf, n_arcs, tail=False):
+    """ arcs from contiguous runs of positive resistances in a lin-KK fit,
+    i.e. a coarse distribution of relaxation times """
+    n = len(Z)
+    R_arcs, w_arcs = _even_arcs(2 * np.pi * f, r_hf, r_lf, n, n_arcs)
+    r_hf = r_hf.copy()
+
+    decades = np.log10(f.max() / f.min()) if f.size > 1 else 1
+    M = int(np.clip(2 * decades, 3, max(3, f.size - 2)))
+    ts = get_tc_distribution(f, M)
+    for i in range(n):
+        elements, _ = fit_linKK(f, ts, M, Z[i], fit_type='complex')
+        r_hf[i] = max(elements[0], r_hf[i] * 1e-3)
+        Rk = elements[1:M + 1]
+
+        runs, current = [], []
+        for k in range(M):
+            if Rk[k] > 0:
+                current.append(k)
+            elif current:
+                runs.append(current)
+                current = []
+        if current and not tail:
+            runs.append(current)
+
+        if len(runs) < n_arcs or n_arcs == 0:
+            continue
+        runs = sorted(runs, key=lambda run: -Rk[run].sum())[:n_arcs]
+        runs = sorted(runs, key=lambda run: run[0])
+        for j, run in enumerate(runs):
+            R = Rk[run].sum()
+            tau = np.exp(np.sum(Rk[run] * np.log(ts[run])) / R)
+            R_arcs[i, j], w_arcs[i, j] = R, 1 / tau
+    return R_arcs, w_arcs, r_hf
+
+
+def _even_arcs(w, r_hf, r_lf, n, n_arcs):
+    """ splits the polarization resistance evenly between arcs spaced
+    evenly in log frequency """
+    position = (np.arange(n_arcs) + 0.5) / max(n_arcs, 1)
+    w_even = w.max()**(1 - position) * w.min()**position
+    R_arcs = np.tile(((r_lf - r_hf) / max(n_arcs, 1))[:, None], n_arcs)
+    w_arcs = np.tile(w_even, (n, 1))
+    return R_arcs, w_arcs
@@ -0,0 +1,301 @@
+"""
+Optional JIT compilation of equivalent circuits
+
+If `numba <https://numba.pydata.org>`_ is installed, :class:`JITCircuit`
+compiles a whole circuit into a single loop over parameter sets and
+frequencies, in which every element is evaluated on scalars. This avoids
+the overhead of one NumPy call (and one temporary array) per operation,
+which dominates the cost of evaluating a circuit on a few hundred
+frequencies. Without numba, :class:`JITCircuit` evaluates exactly like
+:class:`~impedance.models.circuits.compiler.CompiledCircuit`.
+"""
+
+import importlib.util
+import threading
+import warnings
+
+import numpy as np
+
+from .compiler import CompiledCircuit, Constant, Element, Parallel
+from .elements import circuit_elements, get_element_from_name
+
+# numba takes a noticeable time to import, so it is only imported (and the
+# scalar kernels below compiled) when the first JITCircuit is created
+HAS_NUMBA = importlib.util.find_spec('numba') is not None
+numba = None
+_import_lock = threading.Lock()
+
+
+def _tanh(z):
+    # complex tanh overflows for large real parts, where it is +/-1
+    if abs(z.real) > 20:
+        return np.sign(z.real) + 0j
+    return np.tanh(z)
+
+
+def _jpow(x, a):
+    # (j x)**a for real x, as a real power and a rotation when x > 0
+    if x > 0:
+        return x**a * (np.cos(np.pi / 2 * a) + 1j * np.sin(np.pi / 2 * a))
+    return (1j * x)**a
+
+
+# scalar versions of the built-in elements at angular frequency w
+
+def _R(w, R):
+    return R + 0j
+
+
+def _C(w, C):
+    return 1.0 / (C * 1j * w)
+
+
+def _L(w, L):
+    return L * 1j * w
+
+
+def _W(w, Aw):
+    return Aw * (1 - 1j) / np.sqrt(w)
+
+
+def _Wo(w, Z0, tau):
+    x = np.sqrt(1j * w * tau)
+    return Z0 / (x * _tanh(x))
+
+
+def _Ws(w, Z0, tau):
+    x = np.sqrt(1j * w * tau)
+    return Z0 * _tanh(x) / x
+
+
+def _CPE(w, Q, alpha):
+    return 1.0 / (Q * _jpow(w, alpha))
+
+
+def _La(w, L, alpha):
+    return _jpow(L * w, alpha)
+
+
+def _G(w, R_G, t_G):
+    return R_G / np.sqrt(1 + 1j * w * t_G)
+
+
+def _Gs(w, R_G, t_G, phi):
+    x = np.sqrt(1 + 1j * w * t_G)
+    return R_G / (x * _tanh(phi * x))
+
+
+def _K(w, R, tau_k):
+    return R / (1 + 1j * w * tau_k)
+
+
+def _Zarc(w, R, tau_k, gamma):
+    return R / (1 + _jpow(w * tau_k, gamma))
+
+
+def _TLMQ(w, Rion, Qs, gamma):
+    Zs = 1 / (Qs * _jpow(w, gamma))
+    return np.sqrt(Rion * Zs) / _tanh(np.sqrt(Rion / Zs))
+
+
+def _T(w, A, B, a, b):
+    beta = np.sqrt(a + 1j * w * b)
+    # cap sinh(beta) at large beta to avoid overflow at high frequencies
+    if beta.real < 100:
+        sinh = np.sinh(beta)
+    else:
+        sinh = 1e10 + 0j
+    return A / (beta * _tanh(beta)) + B / (beta * sinh)
+
+
+_scalar_kernels = {'R': _R, 'C': _C, 'L': _L, 'W': _W, 'Wo': _Wo,
+                   'Ws': _Ws, 'CPE': _CPE, 'La': _La, 'G': _G, 'Gs': _Gs,
+                   'K': _K, 'Zarc': _Zarc, 'TLMQ': _TLMQ, 'T': _T}
+
+# the scalar versions only stand in for the original elements, not for
+# elements redefined with @element(..., overwrite=True)
+_builtin_kernels = {name: circuit_elements[name].__wrapped__
+                    for name in _scalar_kernels}
+
+
+def _import_numba():
+    """ imports numba and replaces the scalar kernels by their njit-compiled
+    versions (which compile lazily, on their first call) """
+    global numba
+    with _import_lock:
+        if numba is None:
+            import numba as module
+            namespace = globals()
+            for name in ['tanh', 'jpow'] + list(_scalar_kernels):
+                namespace[f'_{name}'] = module.njit(namespace[f'_{name}'])
+            for name in _scalar_kernels:
+                _scalar_kernels[name] = namespace[f'_{name}']
+            numba = module
+    return numba
+
+
+_compiled_kernels = {}
+_compiled_circuits = {}
+
+
+def _compile_kernel(kernel, num_params):
+    """ njit-compiled version of an element kernel, or None if numba
+    cannot compile it (compiled once per kernel) """
+    if kernel not in _compiled_kernels:
+        try:
+            compiled = numba.njit(kernel)
+            compiled(np.ones(num_params), np.ones(2))
+        except Exception:
+            compiled = None
+        _compiled_kernels[kernel] = compiled
+    return _compiled_kernels[kernel]
+
+
+def _kernels(node):
+    """ element kernels of a circuit tree, in order """
+    if isinstance(node, Constant):
+        yield from _kernels(node.node)
+    elif isinstance(node, Element):
+        yield node.kernel
+    else:
+        for child in node.children:
+            yield from _kernels(child)
+
+
+class JITCircuit(CompiledCircuit):
+    """ An equivalent circuit compiled with numba into a single loop
+
+    Takes the same arguments and evaluates to the same impedance as
+    :class:`~impedance.models.circuits.compiler.CompiledCircuit`.
+    Built-in elements are inlined as scalar functions. Elements added with
+    the `element` decorator are compiled with `numba.njit` and evaluated
+    once per parameter set inside the loop, or, if numba cannot compile
+    them (e.g. because they call `np.array` on the frequencies), evaluated
+    with NumPy before the loop, as are sub-circuits without free
+    parameters. Compiled circuits are cached, so the (slow)
+    compilation happens once per circuit and session.
+
+    If numba is not installed, a warning is raised and the whole circuit
+    is evaluated with NumPy.
+
+    Parameters
+    ----------
+    circuit : str
+        String defining the equivalent circuit
+    constants : dict, optional
+        Parameters and their values to hold constant
+        (e.g. {"R0": 0.1}). Defaults to {}
+    elements : ElementRegistry, optional
+        Registry to look up elements in. Defaults to the default registry
+
+    Attributes
+    ----------
+    compiled : bool
+        Whether the circuit is evaluated by the compiled loop
+    """
+    def __init__(self, circuit, constants=None, elements=None):
+        super().__init__(circuit, constants, elements=elements)
+        self._constant_values = []
+        self._in_loop = []
+        self._before_loop = []
+        self._function = None
+
+        if not HAS_NUMBA:
+            warnings.warn('numba is not installed, evaluating ' +
+                          f'{self.circuit} with numpy instead')
+            return
+
+        _import_numba()
+        expression = self._generate(self.tree)
+        key = (self.circuit, tuple(sorted(self.constants)),
+               tuple(_kernels(self.tree)))
+        if key not in _compiled_circuits:
+            _compiled_circuits[key] = self._compile(expression)
+        self._function = _compiled_circuits[key]
+
+    @property
+    def compiled(self):
+        return self._function is not None
+
+    def _generate(self, node):
+        """ source of an expression for the impedance of a node at the
+        angular frequency `w` of row `i` and frequency index `j`, recording
+        the constants and the user elements it uses """
+        if isinstance(node, Constant):
+            k = len(self._before_loop)
+            self._before_loop.append(node)
+            return f'Z_before[i, {k}, j]'
+
+        if isinstance(node, Element):
+            arguments = []
+            for slot in node.slots:
+                if isinstance(slot, int):
+                    arguments.append(f'p[{slot}]')
+                else:
+                    arguments.append(f'c[{len(self._constant_values)}]')
+                    self._constant_values.append(slot)
+
+            name = get_element_from_name(node.name)
+            if _builtin_kernels.get(name) is node.kernel:
+                return f'_{name}(w, {", ".join(arguments)})'
+
+            kernel = _compile_kernel(node.kernel, len(node.slots))
+            if kernel is not None:
+                k = len(self._in_loop)
+                self._in_loop.append((', '.join(arguments), kernel))
+                return f'z_{k}[j]'
+
+            k = len(self._before_loop)
+            self._before_loop.append(node)
+            return f'Z_before[i, {k}, j]'
+
+        children = [self._generate(child) for child in node.children]
+        if isinstance(node, Parallel):
+            return '1 / (' + ' + '.join(f'1 / {z}' for z in children) + ')'
+        return '(' + ' + '.join(children) + ')'
+
+    def _compile(self, expression):
+        namespace = {'np': np}
+        namespace.update({f'_{name}': function
+                          for name, function in _scalar_kernels.items()})
+        per_row = []
+        for k, (arguments, kernel) in enumerate(self._in_loop):
+            namespace[f'kernel_{k}'] = kernel
+            per_row.append(f'z_{k} = kernel_{k}(np.array([{arguments}]), f)')
+
+        source = '\n'.join(
+            ['def evaluate(f, P, c, Z_before, out):',
+             '    for i in range(P.shape[0]):',
+             '        p = P[i]'] +
+            ['        ' + statement for statement in per_row] +
+            ['        for j in range(f.shape[0]):',
+             '            w = 2 * np.pi * f[j]',
+             f'            out[i, j] = {expression}'])
+        exec(source, namespace)
+        return numba.njit(namespace['evaluate'])
+
+    def __call__(self, frequencies, parameters):
+        if not self.compiled:
+            return super().__call__(frequencies, parameters)
+
+        frequencies = np.ascontiguousarray(frequencies, dtype=float)
+        parameters = np.asarray(parameters, dtype=float)
+        if np.shape(parameters)[-1:] != (self.num_params,):
+            raise ValueError(f'expected {self.num_params} parameters for ' +
+                             f'{self.circuit}, got {np.shape(parameters)}')
+
+        f = frequencies.ravel()
+        batch_shape = parameters.shape[:-1]
+        P = np.ascontiguousarray(parameters.reshape(-1, self.num_params))
+        Z_before = np.empty((len(P), len(self._before_loop), f.size),
+                            dtype=complex)
+        for k, node in enumerate(self._before_loop):
+            Z_before[:, k] = node.evaluate(f, P)
+
+        out = np.empty((len(P), f.size), dtype=complex)
+        self._function(f, P, np.array(self._constant_values + [0.0]),
+                       Z_before, out)
+        return out.reshape(batch_shape + frequencies.shape)
+
+    def __repr__(self):
+        return 'JITCircuit({!r})'.format(self.circuit)
@@ -0,0 +1,215 @@
+"""
+Synthetic impedance spectra for load and scale testing
+
+Parameter sets are sampled around a circuit's initial guess within the
+default fitting bounds, evaluated in batches, and perturbed by a noise
+model. :func:`simulate_spectra` yields the spectra in chunks of bounded
+size, so arbitrarily many spectra can be written with
+:func:`save_spectra` without holding them in memory.
+"""
+
+import os
+
+import numpy as np
+
+from .compiler import CompiledCircuit
+from .fitting import set_default_bounds
+from impedance.preprocessing import saveCSV
+
+
+def sample_parameters(circuit, n_spectra, spread=1, distribution='log',
+                      rng=None):
+    """ Samples parameter sets of a circuit within its default bounds
+
+    Each parameter is drawn between its initial guess divided and
+    multiplied by 10**spread, limited to the bounds of
+    `set_default_bounds` (e.g. CPE exponents stay below 1).
+
+    Parameters
+    ----------
+    circuit : CustomCircuit
+        Circuit with an initial guess (and optionally constants)
+    n_spectra : int
+        Number of parameter sets
+    spread : float, optional
+        Range of each parameter in decades around its initial guess.
+        Defaults to 1
+    distribution : {'log', 'uniform'}, optional
+        Sample uniformly in log10 of the parameters or in the parameters.
+        Defaults to 'log'
+    rng : numpy.random.Generator, optional
+        Random number generator. Defaults to np.random.default_rng()
+
+    Returns
+    -------
+    parameters : numpy array, shape (n_spectra, n_params)
+    """
+    rng = np.random.default_rng(rng)
+    guess = np.array(circuit.initial_guess, dtype=float)
+    if guess.size == 0 or np.any(guess <= 0):
+        raise ValueError('sampling parameters requires a positive ' +
+                         'initial guess for every parameter')
+    if distribution not in ['log', 'uniform']:
+        raise ValueError(f'unknown distribution {distribution!r}, use ' +
+                         "'log' or 'uniform'")
+
+    lower, upper = set_default_bounds(circuit.circuit, circuit.constants,
+                                      circuit.elements)
+    low = np.maximum(guess / 10**spread, lower)
+    high = np.minimum(guess * 10**spread, upper)
+
+    if distribution == 'log':
+        return 10**rng.uniform(np.log10(low), np.log10(high),
+                               (n_spectra, len(guess)))
+    return rng.uniform(low, high, (n_spectra, len(guess)))
+
+
+def add_noise(impedances, proportional=0, additive=0, drift=0, rng=None):
+    """ Adds measurement noise to impedance spectra
+
+    Parameters
+    ----------
+    impedances : numpy array of dtype 'complex128', shape (..., n_freq)
+        Impedances, in the order in which they are measured
+    proportional : float, optional
+        Standard deviation of the real and imaginary noise relative to
+        |Z| at each frequency. Defaults to 0
+    additive : float, optional
+        Standard deviation of the real and imaginary noise in Ohms.
+        Defaults to 0
+    drift : float, optional
+        Relative change of the impedance from the first to the last
+        frequency (e.g. from a cell that slowly changes during the sweep).
+        Defaults to 0
+    rng : numpy.random.Generator, optional
+        Random number generator. Defaults to np.random.default_rng()
+
+    Returns
+    -------
+    impedances : numpy array of dtype 'complex128', shape (..., n_freq)
+    """
+    rng = np.random.default_rng(rng)
+    Z = np.array(impedances, dtype=complex)
+    if drift:
+        Z *= 1 + drift * np.linspace(0, 1, Z.shape[-1])
+    if proportional:
+        Z += proportional * np.abs(Z) * _complex_normal(rng, Z.shape)
+    if additive:
+        Z += additive * _complex_normal(rng, Z.shape)
+    return Z
+
+
+def _complex_normal(rng, shape):
+    return rng.standard_normal(shape) + 1j * rng.standard_normal(shape)
+
+
+def simulate_spectra(circuit, n_spectra, frequencies=None, chunk_size=1000,
+                     spread=1, distribution='log', proportional=0.005,
+                     additive=0, drift=0, seed=None):
+    """ Yields noisy synthetic spectra of a circuit in chunks
+
+    Parameters
+    ----------
+    circuit : CustomCircuit
+        Circuit with an initial guess (and optionally constants)
+    n_spectra : int
+        Total number of spectra
+    frequencies : numpy array, optional
+        Frequencies shared by all spectra, in the order in which they are
+        measured. Defaults to 10 points per decade from 100 kHz to 10 mHz
+    chunk_size : int, optional
+        Maximum number of spectra per chunk, which bounds the memory used.
+        Defaults to 1000
+    spread, distribution :
+        Passed to :func:`sample_parameters`
+    proportional, additive, drift :
+        Passed to :func:`add_noise`. Default to 0.5% proportional noise
+    seed : int, optional
+        Seed for reproducible spectra. Defaults to None
+
+    Yields
+    ------
+    frequencies : numpy array, shape (n_freq,)
+    parameters : numpy array, shape (n_chunk, n_params)
+        True parameters of each spectrum
+    impedances : numpy array of dtype 'complex128', shape (n_chunk, n_freq)
+
+    Examples
+    --------
+    >>> circuit = CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, .1, 1])
+    >>> for f, parameters, Z in simulate_spectra(circuit, 10**6):
+    ...     batch_circuit_fit(f, Z, circuit.circuit, circuit.initial_guess)
+    """
+    if frequencies is None:
+        frequencies = np.logspace(5, -2, 71)
+    frequencies = np.array(frequencies, dtype=float)
+    rng = np.random.default_rng(seed)
+    model = CompiledCircuit(circuit.circuit, circuit.constants,
+                            elements=circuit.elements)
+
+    for start in range(0, n_spectra, chunk_size):
+        n_chunk = min(chunk_size, n_spectra - start)
+        parameters = sample_parameters(circuit, n_chunk, spread,
+                                       distribution, rng)
+        Z = add_noise(model(frequencies, parameters), proportional,
+                      additive, drift, rng)
+        yield frequencies, parameters, Z
+
+
+def save_spectra(chunks, directory, fmt='npz'):
+    """ Writes chunks of spectra to a directory as they are produced
+
+    Parameters
+    ----------
+    chunks : iterable of (frequencies, parameters, impedances)
+        E.g. from :func:`simulate_spectra`
+    directory : str
+        Output directory, created if it does not exist
+    fmt : {'npz', 'csv'}, optional
+        'npz' writes one compressed file per chunk (chunk_00000.npz, ...)
+        with the arrays 'frequencies', 'parameters' and 'impedances'.
+        'csv' writes one file per spectrum with `saveCSV`
+        (spectrum_0000000.csv, ...). Defaults to 'npz'
+
+    Returns
+    -------
+    n_spectra : int
+        Number of spectra written
+    """
+    if fmt not in ['npz', 'csv']:
+        raise ValueError(f"unknown format {fmt!r}, use 'npz' or 'csv'")
+    os.makedirs(directory, exist_ok=True)
+
+    n_spectra = 0
+    for k, (frequencies, parameters, Z) in enumerate(chunks):
+        if fmt == 'npz':
+            np.savez_compressed(os.path.join(directory,
+                                             f'chunk_{k:05d}.npz'),
+                                frequencies=frequencies,
+                                parameters=parameters, impedances=Z)
+        else:
+            for i, spectrum in enumerate(Z, start=n_spectra):
+                saveCSV(os.path.join(directory, f'spectrum_{i:07d}.csv'),
+                        frequencies, spectrum)
+        n_spectra += len(Z)
+    return n_spectra
+
+
+def load_spectra(directory):
+    """ Reads chunks written by :func:`save_spectra` with fmt='npz'
+
+    Parameters
+    ----------
+    directory : str
+        Directory with chunk_*.npz files
+
+    Yields
+    ------
+    frequencies, parameters, impedances :
+        One chunk at a time, in the order they were written
+    """
+    for filename in sorted(os.listdir(directory)):
+        if filename.startswith('chunk_') and filename.endswith('.npz'):
+            with np.load(os.path.join(directory, filename)) as data:
+                yield (data['frequencies'], data['parameters'],
+                       data['impedances'])
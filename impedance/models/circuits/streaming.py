@@ -0,0 +1,138 @@
+"""
+Fitting unbounded streams of spectra with bounded memory
+"""
+
+import collections
+import concurrent.futures
+
+from .fitting import circuit_fit
+
+
+def iter_fit(circuit, spectra, n_jobs=1, window=None, ordered=True,
+             executor=None, errors='raise', **kwargs):
+    """ Fits spectra from an iterable as they arrive
+
+    Spectra are consumed lazily: at most `window` of them are read ahead
+    of the results yielded so far, so a generator over a long-running
+    measurement (or many files) can be fit with a small, fixed amount of
+    memory.
+
+    Parameters
+    ----------
+    circuit : CustomCircuit
+        Circuit to fit, with its initial guess and constants
+    spectra : iterable of (frequencies, impedances[, metadata])
+        Spectra to fit. metadata is passed through to the results and
+        defaults to the index of the spectrum in the iterable
+    n_jobs : int, optional
+        Number of worker processes. With 1 (the default), spectra are fit
+        one by one in this process
+    window : int, optional
+        Maximum number of spectra read but not yet yielded. Defaults to
+        2 * n_jobs
+    ordered : bool, optional
+        Yield results in the order of the spectra (True) or as soon as
+        each fit completes (False). Defaults to True
+    executor : concurrent.futures.Executor, optional
+        Executor to submit fits to instead of a new process pool with
+        n_jobs workers (e.g. a ThreadPoolExecutor). It is not shut down
+    errors : {'raise', 'yield'}, optional
+        Whether an exception raised by a fit stops the iteration or is
+        yielded in place of its result. Defaults to 'raise'
+    kwargs :
+        Keyword arguments passed to `circuit_fit`
+
+    Yields
+    ------
+    metadata :
+        metadata of the spectrum
+    result : FitResult or Exception
+        Result of the fit (see `circuit_fit` with full_output=True)
+
+    Examples
+    --------
+    >>> def measurements():
+    ...     for filename in sorted(glob.glob('data/*.csv')):
+    ...         f, Z = preprocessing.readCSV(filename)
+    ...         yield f, Z, filename
+    >>> for filename, result in iter_fit(circuit, measurements(), n_jobs=4):
+    ...     print(filename, result.parameters)
+    """
+    if errors not in ['raise', 'yield']:
+        raise ValueError(f"errors must be 'raise' or 'yield', not {errors!r}")
+    if circuit.elements is not None:
+        kwargs.setdefault('elements', circuit.elements)
+    if circuit.jit:
+        kwargs.setdefault('jit', circuit.jit)
+    fit = (circuit.circuit, circuit.initial_guess, circuit.constants, kwargs)
+
+    if executor is None and n_jobs == 1:
+        for index, item in enumerate(spectra):
+            frequencies, impedances, metadata = _unpack(item, index)
+            try:
+                result = _fit(*fit, frequencies, impedances)
+            except Exception as error:
+                if errors == 'raise':
+                    raise
+                result = error
+            yield metadata, result
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ProcessPoolExecutor(n_jobs)
+    if window is None:
+        window = 2 * n_jobs
+    window = max(window, 1)
+
+    pending = collections.OrderedDict()
+    try:
+        for index, item in enumerate(spectra):
+            frequencies, impedances, metadata = _unpack(item, index)
+            future = executor.submit(_fit, *fit, frequencies, impedances)
+            pending[future] = metadata
+            while len(pending) >= window:
+                yield _next(pending, ordered, errors)
+        while pending:
+            yield _next(pending, ordered, errors)
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+
+
+def _unpack(item, index):
+    """ (frequencies, impedances, metadata) of an item of the stream """
+    if len(item) == 2:
+        return item[0], item[1], index
+    frequencies, impedances, metadata = item
+    return frequencies, impedances, metadata
+
+
+def _fit(circuit, initial_guess, constants, kwargs, frequencies,
+         impedances):
+    """ fits a single spectrum (at module level so it can be pickled) """
+    _, _, result = circuit_fit(frequencies, impedances, circuit,
+                               initial_guess, constants=constants,
+                               full_output=True, **kwargs)
+    return result
+
+
+def _next(pending, ordered, errors):
+    """ removes and returns (metadata, result) of the oldest fit if
+    ordered, otherwise of the first fit to complete """
+    if ordered:
+        future = next(iter(pending))
+    else:
+        done, _ = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        future = next(f for f in pending if f in done)
+    metadata = pending.pop(future)
+
+    error = future.exception()
+    if error is not None:
+        if errors == 'raise':
+            raise error
+        return metadata, error
+    return metadata, future.result()
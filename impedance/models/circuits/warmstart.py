@@ -0,0 +1,239 @@
+"""
+Warm starts for fitting from previously fitted, similar spectra
+"""
+
+import json
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class WarmStartStore:
+    """ A nearest-neighbor index of fitted spectra
+
+    Each spectrum is reduced to a fingerprint (log-modulus and phase
+    interpolated onto a fixed number of log-spaced points across its
+    frequency range) and stored with its fitted parameters under its
+    circuit string. Querying a new spectrum returns the parameters of the
+    most similar stored spectrum, which are typically a much better
+    starting point than a fixed initial guess.
+
+    Parameters
+    ----------
+    n_points : int, optional
+        Number of frequencies in each fingerprint. Defaults to 16
+
+    max_entries : int, optional
+        Maximum number of spectra kept per circuit, oldest are dropped
+        first. Defaults to None (no limit)
+
+    Examples
+    --------
+    >>> store = WarmStartStore()
+    >>> for f, Z in spectra:
+    ...     circuit.fit(f, Z, warm_start=store)
+    >>> store.save('warm_start.npz')
+    """
+    def __init__(self, n_points=16, max_entries=None):
+        self.n_points = n_points
+        self.max_entries = max_entries
+        self._entries = {}
+
+    def fingerprint(self, frequencies, impedance):
+        """ Normalized fingerprint of a spectrum used for similarity search
+
+        Parameters
+        ----------
+        frequencies : numpy array
+            Frequencies
+        impedance : numpy array of dtype 'complex128'
+            Impedances
+
+        Returns
+        -------
+        fingerprint : numpy array, shape (2 * n_points,)
+            log10 of the modulus and phase (in units of pi/2) of the
+            impedance at n_points log-spaced frequencies
+        """
+        f = np.array(frequencies, dtype=float)
+        Z = np.array(impedance, dtype=complex)
+        order = np.argsort(f)
+        log_f, Z = np.log10(f[order]), Z[order]
+
+        grid = np.linspace(log_f[0], log_f[-1], self.n_points)
+        with np.errstate(divide='ignore'):
+            log_mod = np.log10(np.abs(Z))
+        phase = np.angle(Z) / (np.pi / 2)
+        fingerprint = np.hstack([np.interp(grid, log_f, log_mod),
+                                 np.interp(grid, log_f, phase)])
+        return np.nan_to_num(fingerprint, neginf=-300.0)
+
+    def add(self, frequencies, impedance, circuit, parameters, constants={}):
+        """ Adds a fitted spectrum to the store
+
+        Parameters
+        ----------
+        frequencies : numpy array
+            Frequencies
+        impedance : numpy array of dtype 'complex128'
+            Impedances
+        circuit : string
+            String defining the fitted equivalent circuit
+        parameters : array_like of floats
+            Fitted parameters (e.g. `parameters_` of a fitted circuit)
+        constants : dictionary, optional
+            Parameters held constant during the fit. Defaults to {}
+        """
+        key = _key(circuit, constants)
+        entry = self._entries.setdefault(key, _Entries())
+        entry.append(self.fingerprint(frequencies, impedance),
+                     np.array(parameters, dtype=float))
+        if self.max_entries is not None:
+            entry.truncate(self.max_entries)
+
+    def query(self, frequencies, impedance, circuit, constants={},
+              max_distance=None):
+        """ Parameters of the most similar stored spectrum
+
+        Parameters
+        ----------
+        frequencies : numpy array
+            Frequencies
+        impedance : numpy array of dtype 'complex128'
+            Impedances
+        circuit : string
+            String defining the equivalent circuit to be fit
+        constants : dictionary, optional
+            Parameters held constant during the fit. Defaults to {}
+        max_distance : float, optional
+            Only return a match if its fingerprint is closer than this.
+            Defaults to None (always return the nearest match)
+
+        Returns
+        -------
+        parameters : numpy array or None
+            Fitted parameters of the nearest stored spectrum, or None if
+            there is no (close enough) match
+        """
+        entry = self._entries.get(_key(circuit, constants))
+        if entry is None or len(entry) == 0:
+            return None
+
+        distance, index = entry.nearest(self.fingerprint(frequencies,
+                                                         impedance))
+        if max_distance is not None and distance > max_distance:
+            return None
+        return entry.parameters[index].copy()
+
+    def __len__(self):
+        return sum(len(entry) for entry in self._entries.values())
+
+    def save(self, filepath):
+        """ Saves the store to a .npz file
+
+        Parameters
+        ----------
+        filepath : str
+            Destination for the store
+        """
+        arrays, keys = {}, []
+        for i, (key, entry) in enumerate(self._entries.items()):
+            keys.append(key)
+            arrays[f'fingerprints_{i}'] = entry.fingerprints
+            arrays[f'parameters_{i}'] = entry.parameters
+        meta = {'n_points': self.n_points, 'max_entries': self.max_entries,
+                'keys': keys}
+        np.savez(filepath, meta=json.dumps(meta), **arrays)
+
+    @classmethod
+    def load(cls, filepath):
+        """ Loads a store saved with `save`
+
+        Parameters
+        ----------
+        filepath : str
+            Path of a store written by `WarmStartStore.save`
+
+        Returns
+        -------
+        store : WarmStartStore
+        """
+        with np.load(filepath) as data:
+            meta = json.loads(str(data['meta']))
+            store = cls(n_points=meta['n_points'],
+                        max_entries=meta['max_entries'])
+            for i, key in enumerate(meta['keys']):
+                store._entries[tuple(key)] = \
+                    _Entries(data[f'fingerprints_{i}'],
+                             data[f'parameters_{i}'])
+        return store
+
+
+def _key(circuit, constants):
+    """ stored fits are only reused for the same circuit and the same
+    constant parameters (which fix the length of the parameter vector) """
+    return (circuit.replace(' ', ''), ','.join(sorted(constants)))
+
+
+class _Entries:
+    """ Fingerprints and parameters of one circuit, stored in arrays that
+    grow by doubling. The KD-tree is rebuilt lazily: recent additions are
+    searched by brute force until they make up a sizeable fraction of the
+    entries. """
+    def __init__(self, fingerprints=None, parameters=None):
+        self._fingerprints = fingerprints
+        self._parameters = parameters
+        self._size = 0 if parameters is None else len(parameters)
+        self._tree = None
+        self._n_indexed = 0
+
+    @property
+    def fingerprints(self):
+        return self._fingerprints[:self._size]
+
+    @property
+    def parameters(self):
+        return self._parameters[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def append(self, fingerprint, parameters):
+        if self._parameters is None:
+            self._fingerprints = np.empty((16,) + fingerprint.shape)
+            self._parameters = np.empty((16,) + parameters.shape)
+        elif parameters.shape != self._parameters.shape[1:]:
+            raise ValueError('number of parameters does not match the ' +
+                             'fits stored for this circuit')
+        elif self._size == len(self._parameters):
+            self._fingerprints = np.concatenate([self._fingerprints,
+                                                 self._fingerprints])
+            self._parameters = np.concatenate([self._parameters,
+                                               self._parameters])
+        self._fingerprints[self._size] = fingerprint
+        self._parameters[self._size] = parameters
+        self._size += 1
+
+    def truncate(self, max_entries):
+        if self._size > max_entries:
+            self._fingerprints = self.fingerprints[-max_entries:].copy()
+            self._parameters = self.parameters[-max_entries:].copy()
+            self._size = max_entries
+            self._tree, self._n_indexed = None, 0
+
+    def nearest(self, fingerprint):
+        n = self._size
+        if n - self._n_indexed > max(64, n // 10):
+            self._tree = cKDTree(self.fingerprints)
+            self._n_indexed = n
+
+        distance, index = np.inf, None
+        if self._tree is not None:
+            distance, index = self._tree.query(fingerprint)
+        recent = self.fingerprints[self._n_indexed:]
+        if len(recent):
+            distances = np.linalg.norm(recent - fingerprint, axis=1)
+            i = np.argmin(distances)
+            if distances[i] < distance:
+                distance, index = distances[i], self._n_indexed + i
+        return distance, index
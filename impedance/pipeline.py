@@ -0,0 +1,434 @@
+"""
+Staged processing of many spectra
+
+A :class:`Pipeline` runs each item through a sequence of stages. Stages
+are connected by bounded queues and each has its own workers: threads for
+stages that wait on I/O (e.g. reading files) and processes for stages
+that need the CPU (e.g. fitting), so that reading and fitting overlap and
+a slow stage holds back the ones before it instead of filling memory::
+
+    pipeline = standard_pipeline(circuit, instrument='gamry',
+                                 export=write_row)
+    for filename, record in pipeline.run(sorted(glob.glob('data/*.DTA'))):
+        ...
+    print(pipeline.report())
+
+The report shows how busy each stage was and how many items waited for
+it, which tells which stage needs more workers.
+"""
+
+import concurrent.futures
+import contextlib
+import functools
+import io
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from .models.circuits.fitting import circuit_fit
+from .preprocessing import cropFrequencies, ignoreBelowX, readFile
+from .validation import linKK
+
+__all__ = ['Stage', 'Pipeline', 'StageError', 'standard_pipeline', 'read',
+           'clean', 'validate', 'fit']
+
+
+class StageError(Exception):
+    """ An exception raised by a stage of a :class:`Pipeline` for one item
+
+    Attributes
+    ----------
+    stage : str
+        Name of the stage
+    error : Exception
+        The exception raised
+    """
+    def __init__(self, stage, error):
+        super().__init__(f'{stage}: {type(error).__name__}: {error}')
+        self.stage = stage
+        self.error = error
+
+
+class Stage:
+    """ A step of a :class:`Pipeline`
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage in errors and reports
+    function : callable
+        Called with the output of the previous stage (or an input item)
+        and returns the input of the next stage. For process stages, it
+        and its inputs and outputs must be picklable (e.g. a module-level
+        function or a functools.partial of one)
+    workers : int, optional
+        Number of items processed at once. Defaults to 1
+    processes : bool, optional
+        Whether to run the function in worker processes (for CPU-bound
+        stages) instead of threads (for I/O-bound stages). Defaults to
+        False
+    """
+    def __init__(self, name, function, workers=1, processes=False):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.processes = processes
+
+    def __repr__(self):
+        kind = 'processes' if self.processes else 'threads'
+        return f'Stage({self.name!r}, {self.workers} {kind})'
+
+
+class Pipeline:
+    """ Stages connected by bounded queues
+
+    Parameters
+    ----------
+    stages : list of Stage
+        Stages, in the order items go through them
+    queue_size : int, optional
+        Maximum number of items waiting in front of each stage. Defaults
+        to twice the number of workers of the stage
+
+    Attributes
+    ----------
+    stats : dict
+        Statistics of the last run for each stage name (see `report`)
+    """
+    def __init__(self, stages, queue_size=None):
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f'stage names must be unique, got {names}')
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.stats = {}
+
+    def run(self, items, errors='yield'):
+        """ Runs items through the stages
+
+        Items are yielded as soon as they leave the last stage, which need
+        not be in the order of the input.
+
+        Parameters
+        ----------
+        items : iterable
+            Inputs of the first stage. They are read as the first stage
+            has room for them, so a generator can be arbitrarily long
+        errors : {'yield', 'raise'}, optional
+            Whether an item for which a stage raises an exception is
+            yielded with a :class:`StageError` as its result (skipping the
+            remaining stages) or stops the run. Defaults to 'yield'
+
+        Yields
+        ------
+        index : int
+            Position of the item in `items`
+        result :
+            Output of the last stage, or a StageError
+        """
+        if errors not in ['raise', 'yield']:
+            raise ValueError("errors must be 'raise' or 'yield', not " +
+                             repr(errors))
+
+        stop = threading.Event()
+        queues = [queue.Queue(self.queue_size or 2 * stage.workers)
+                  for stage in self.stages] + [queue.Queue()]
+        self.stats = {stage.name: _StageStats(stage) for stage in self.stages}
+        executors = []
+        threads = [threading.Thread(target=_feed,
+                                    args=(items, queues[0], stop),
+                                    daemon=True)]
+        for k, stage in enumerate(self.stages):
+            executor = None
+            if stage.processes:
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    stage.workers)
+                executors.append(executor)
+            remaining = [stage.workers]
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=_work,
+                    args=(stage, executor, queues[k], queues[k + 1],
+                          self.stats[stage.name], remaining, stop),
+                    daemon=True))
+
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _FeedError):
+                    raise item.error
+                index, result = item
+                if isinstance(result, StageError) and errors == 'raise':
+                    raise result
+                yield index, result
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            for executor in executors:
+                executor.shutdown()
+            for stats in self.stats.values():
+                stats.finish()
+
+    def report(self):
+        """ Table of the statistics of the last run
+
+        For each stage: the number of items and errors, the throughput
+        (items/s over the run), the utilization (fraction of the time its
+        workers were busy) and the mean and maximum number of items
+        waiting in front of it. A stage with a high utilization and a
+        full queue is the bottleneck; one with a low utilization and an
+        empty queue has more workers than it needs.
+
+        Returns
+        -------
+        report : str
+        """
+        lines = [f'{"stage":<12} {"workers":>9} {"items":>8} ' +
+                 f'{"errors":>7} {"items/s":>9} {"busy %":>7} ' +
+                 f'{"queue":>6} {"max":>5}']
+        for stage in self.stages:
+            stats = self.stats.get(stage.name)
+            if stats is None:
+                continue
+            kind = 'p' if stage.processes else 't'
+            lines.append(f'{stage.name:<12} {stage.workers:>8}{kind} ' +
+                         f'{stats.items:>8} {stats.errors:>7} ' +
+                         f'{stats.throughput:>9.1f} ' +
+                         f'{100 * stats.utilization:>7.1f} ' +
+                         f'{stats.mean_queue_depth:>6.1f} ' +
+                         f'{stats.max_queue_depth:>5}')
+        return '\n'.join(lines)
+
+
+class _StageStats:
+    """ counters of one stage, updated by its workers """
+    def __init__(self, stage):
+        self.workers = stage.workers
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.max_queue_depth = 0
+        self._depth_total = 0
+        self._start = time.perf_counter()
+        self._end = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds, failed, queue_depth):
+        with self._lock:
+            self.items += 1
+            self.errors += failed
+            self.busy += seconds
+            self._depth_total += queue_depth
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def finish(self):
+        if self._end is None:
+            self._end = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self._end or time.perf_counter()) - self._start
+
+    @property
+    def throughput(self):
+        return self.items / max(self.elapsed, 1e-9)
+
+    @property
+    def utilization(self):
+        return self.busy / max(self.elapsed * self.workers, 1e-9)
+
+    @property
+    def mean_queue_depth(self):
+        return self._depth_total / max(self.items, 1)
+
+
+# marks the end of the items in a queue
+_DONE = object()
+
+
+class _FeedError:
+    """ an exception raised while iterating over the input items """
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(target, item, stop):
+    """ puts an item in a bounded queue unless the run is stopped """
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(source, stop):
+    """ gets an item from a queue (None if the run is stopped) """
+    while not stop.is_set():
+        try:
+            return source.get(timeout=.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def _feed(items, target, stop):
+    try:
+        for item in enumerate(items):
+            if not _put(target, item, stop):
+                return
+    except Exception as error:
+        item = _FeedError(error)
+        _put(target, item, stop)
+    _put(target, _DONE, stop)
+
+
+def _work(stage, executor, source, target, stats, remaining, stop):
+    """ a worker thread of a stage """
+    while True:
+        depth = source.qsize()
+        item = _get(source, stop)
+        if item is None:
+            return
+        if item is _DONE:
+            # let the other workers of the stage see it, and pass it on
+            # once the last one is done
+            source.put(_DONE)
+            with stats._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                _put(target, _DONE, stop)
+            return
+        if isinstance(item, _FeedError) or \
+                isinstance(item[1], StageError):
+            _put(target, item, stop)
+            continue
+
+        index, value = item
+        start = time.perf_counter()
+        try:
+            if executor is None:
+                value = stage.function(value)
+            else:
+                value = executor.submit(stage.function, value).result()
+            failed = False
+        except Exception as error:
+            value = StageError(stage.name, error)
+            failed = True
+        stats.record(time.perf_counter() - start, failed, depth)
+        if not _put(target, (index, value), stop):
+            return
+
+
+def read(filename, instrument=None):
+    """ Reads a file into a record (a stage of :func:`standard_pipeline`)
+
+    Returns
+    -------
+    record : dict
+        'file', and 'frequencies' and 'impedances' from `readFile`
+    """
+    f, Z = readFile(filename, instrument=instrument)
+    return {'file': filename, 'frequencies': f, 'impedances': Z}
+
+
+def clean(record, freqmin=None, freqmax=None, ignore_below_x=False):
+    """ Crops the spectrum of a record with `cropFrequencies` and
+    `ignoreBelowX` """
+    f, Z = record['frequencies'], record['impedances']
+    if ignore_below_x:
+        f, Z = ignoreBelowX(f, Z)
+    if freqmin is not None or freqmax is not None:
+        f, Z = cropFrequencies(f, Z, freqmin=freqmin or 0, freqmax=freqmax)
+    return dict(record, frequencies=f, impedances=Z)
+
+
+def validate(record, **kwargs):
+    """ Adds the 'M', 'mu' and largest absolute residuals ('res_real' and
+    'res_imag') of `linKK` to a record """
+    with contextlib.redirect_stdout(io.StringIO()):
+        M, mu, _, res_real, res_imag = linKK(record['frequencies'],
+                                             record['impedances'], **kwargs)
+    return dict(record, M=M, mu=mu, res_real=np.max(np.abs(res_real)),
+                res_imag=np.max(np.abs(res_imag)))
+
+
+def fit(record, circuit, initial_guess, constants={}, **kwargs):
+    """ Adds the FitResult of `circuit_fit` to a record as 'fit' """
+    _, _, result = circuit_fit(record['frequencies'], record['impedances'],
+                               circuit, initial_guess, constants=constants,
+                               full_output=True, **kwargs)
+    return dict(record, fit=result)
+
+
+def standard_pipeline(circuit, instrument=None, freqmin=None, freqmax=None,
+                      ignore_below_x=False, linkk=True, export=None,
+                      io_workers=4, cpu_workers=None, queue_size=None,
+                      **kwargs):
+    """ A pipeline that reads, cleans, validates, fits and exports files
+
+    Its items are filenames and its results are dicts with the 'file',
+    'frequencies', 'impedances', linKK results ('M', 'mu', 'res_real',
+    'res_imag') and the FitResult of `circuit_fit` ('fit').
+
+    Parameters
+    ----------
+    circuit : CustomCircuit
+        Circuit to fit, with its initial guess and constants
+    instrument : str, optional
+        Passed to `readFile`
+    freqmin, freqmax, ignore_below_x : optional
+        Cropping of the spectra (see :func:`clean`)
+    linkk : bool or dict, optional
+        Whether to run `linKK`, or keyword arguments for it. Defaults to
+        True
+    export : callable, optional
+        Called with each record after fitting, in a thread (e.g. to write
+        to a file or database). Its return value is the result
+    io_workers : int, optional
+        Threads for reading and exporting. Defaults to 4
+    cpu_workers : int, optional
+        Processes for validating and fitting. Defaults to the number of
+        CPUs
+    queue_size : int, optional
+        Passed to :class:`Pipeline`
+    kwargs :
+        Keyword arguments passed to `circuit_fit`
+
+    Returns
+    -------
+    pipeline : Pipeline
+    """
+    if circuit.elements is not None:
+        kwargs.setdefault('elements', circuit.elements)
+    if circuit.jit:
+        kwargs.setdefault('jit', circuit.jit)
+    if cpu_workers is None:
+        cpu_workers = os.cpu_count() or 1
+
+    stages = [Stage('read', functools.partial(read, instrument=instrument),
+                    io_workers),
+              Stage('clean', functools.partial(
+                  clean, freqmin=freqmin, freqmax=freqmax,
+                  ignore_below_x=ignore_below_x))]
+    if linkk:
+        options = linkk if isinstance(linkk, dict) else {}
+        stages.append(Stage('validate',
+                            functools.partial(validate, **options),
+                            cpu_workers, processes=True))
+    stages.append(Stage('fit', functools.partial(
+        fit, circuit=circuit.circuit, initial_guess=circuit.initial_guess,
+        constants=circuit.constants, **kwargs), cpu_workers, processes=True))
+    if export is not None:
+        stages.append(Stage('export', export, io_workers))
+    return Pipeline(stages, queue_size)
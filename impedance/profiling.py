@@ -0,0 +1,221 @@
+"""
+Profiling of circuit evaluation and fitting
+
+:func:`profile` attributes the time spent inside its ``with`` block to the
+stages of a fit (parsing, each circuit element, the series and parallel
+combinators, the optimizer and the covariance estimate) without an
+external profiler::
+
+    import impedance
+
+    with impedance.profile() as prof:
+        circuit.fit(frequencies, Z)
+    print(prof.report())
+
+The functions involved are only wrapped while the block is running, so
+profiling costs nothing otherwise. Only calls made by the thread that
+entered the block are recorded, so fits running concurrently in other
+threads (e.g. on a :class:`~impedance.aio.FitPool`) are not attributed to
+the profile, although they run the wrapped functions while it is active.
+"""
+
+import contextlib
+import functools
+import threading
+import time
+
+__all__ = ['profile', 'Profile']
+
+
+class Profile:
+    """ Call counts, exclusive times and output sizes collected by
+    :func:`profile`
+
+    Times are exclusive: the time of a series or parallel combination does
+    not include the time of its branches, and the optimizer's time does not
+    include the circuit evaluations it asks for, so the times add up to the
+    time spent in instrumented code.
+
+    Attributes
+    ----------
+    stats : dict
+        Maps (kind, name) to a dict with the number of 'calls', the
+        exclusive 'time' in seconds and the 'output_bytes', the total size
+        of the arrays returned. Temporary arrays allocated during a call
+        are not included, so this is a lower bound on the memory traffic.
+        kind is 'element' (name is the element in the circuit string, e.g.
+        'CPE1') or 'phase', one of
+
+        - 'parse': parsing and simplifying circuit strings
+        - 'compile': generating the loop of a JITCircuit
+        - 'evaluate': conversion of inputs and outputs of a circuit
+        - 'jit': numba-compiled circuits (including their compilation on
+          the first call), which are not broken down by element
+        - 'jacobian': setting up exact Jacobians with dual numbers
+        - 's' and 'p': series and parallel combinations
+        - 'constant': sub-circuits without free parameters, after their
+          first evaluation
+        - 'optimizer': scipy's optimizers, outside of circuit evaluations
+          (including the covariance estimate of curve_fit)
+        - 'covariance': estimating parameter errors of global fits
+    """
+    def __init__(self):
+        self.stats = {}
+        self._thread = threading.get_ident()
+        # exclusive times of the calls in progress, per thread
+        self._local = threading.local()
+
+    def record(self, kind, name, seconds, nbytes=0):
+        """ adds one call to the statistics """
+        entry = self.stats.setdefault((kind, name),
+                                      {'calls': 0, 'time': 0.0,
+                                       'output_bytes': 0})
+        entry['calls'] += 1
+        entry['time'] += seconds
+        entry['output_bytes'] += nbytes
+
+    def wrap(self, function, kind, name):
+        """ wraps a function to record its calls
+
+        `name` is either a string or a function of the wrapped function's
+        arguments returning one
+        """
+        @functools.wraps(function)
+        def wrapped(*args, **kwargs):
+            if threading.get_ident() != self._thread:
+                return function(*args, **kwargs)
+            stack = self._stack
+            stack.append(0.0)
+            start = time.perf_counter()
+            result = None
+            try:
+                result = function(*args, **kwargs)
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                self.record(kind, name(*args) if callable(name) else name,
+                            elapsed - children, _nbytes(result))
+        return wrapped
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @property
+    def total(self):
+        """ total time (s) recorded """
+        return sum(entry['time'] for entry in self.stats.values())
+
+    def report(self, sort='time'):
+        """ Table of the statistics, slowest first
+
+        Parameters
+        ----------
+        sort : {'time', 'calls', 'output_bytes'}, optional
+            Column to sort by. Defaults to 'time'
+
+        Returns
+        -------
+        report : str
+        """
+        total = self.total or 1
+        lines = [f'{"kind":<8} {"name":<14} {"calls":>8} {"time (s)":>10} ' +
+                 f'{"per call (us)":>13} {"%":>6} {"out MB":>9}']
+        for (kind, name), entry in sorted(self.stats.items(),
+                                          key=lambda item: -item[1][sort]):
+            lines.append(f'{kind:<8} {name:<14} {entry["calls"]:>8} ' +
+                         f'{entry["time"]:>10.4f} ' +
+                         f'{1e6 * entry["time"] / entry["calls"]:>13.1f} ' +
+                         f'{100 * entry["time"] / total:>6.1f} ' +
+                         f'{entry["output_bytes"] / 1e6:>9.2f}')
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.report()
+
+
+def _nbytes(result):
+    """ bytes of the array(s) returned by an instrumented function """
+    if isinstance(result, tuple):
+        return sum(_nbytes(item) for item in result)
+    if hasattr(result, 'nbytes'):
+        return result.nbytes
+    if hasattr(result, 'tangent'):
+        # dual numbers (impedance.models.circuits.dual.DualArray)
+        return _nbytes(result.value) + _nbytes(result.tangent)
+    return 0
+
+
+def _targets():
+    """ (owner, attribute, kind, name) of each instrumented function """
+    from .models.circuits import batch, compiler, fitting, jit
+
+    return [
+        (compiler.CompiledCircuit, '__init__', 'phase', 'parse'),
+        (compiler.CompiledCircuit, '__call__', 'phase', 'evaluate'),
+        (compiler.CompiledCircuit, 'jacobian', 'phase', 'jacobian'),
+        (jit.JITCircuit, '_compile', 'phase', 'compile'),
+        (jit.JITCircuit, '__call__', 'phase', 'jit'),
+        (compiler.Element, 'evaluate', 'element',
+         lambda node, *args: node.name),
+        (compiler.Series, 'evaluate', 'phase', 's'),
+        (compiler.Parallel, 'evaluate', 'phase', 'p'),
+        (compiler.Constant, 'evaluate', 'phase', 'constant'),
+        (fitting, 'curve_fit', 'phase', 'optimizer'),
+        (fitting, 'basinhopping', 'phase', 'optimizer'),
+        (batch, 'least_squares', 'phase', 'optimizer'),
+        (fitting, 'inv', 'phase', 'covariance'),
+    ]
+
+
+_active = []
+
+
+@contextlib.contextmanager
+def profile():
+    """ Profiles circuit evaluation and fitting within a ``with`` block
+
+    Yields
+    ------
+    profile : Profile
+        Statistics, filled in while the block runs
+
+    Notes
+    -----
+    Profiles cannot be nested. Only the calling thread is profiled.
+    Elements are evaluated one at a time by
+    :class:`~impedance.models.circuits.compiler.CompiledCircuit`, but not
+    by circuits compiled with numba (``jit=True``), whose time is reported
+    as a whole.
+
+    Examples
+    --------
+    >>> with impedance.profile() as prof:
+    ...     circuit.fit(frequencies, Z)
+    >>> print(prof.report())  # doctest: +SKIP
+    kind     name              calls   time (s)  per call (us)      %   out MB
+    phase    optimizer             1     0.0120        12000.0   35.2    0.10
+    element  CPE1                212     0.0051           24.1   15.0    2.71
+    ...
+    """
+    if _active:
+        raise RuntimeError('impedance.profile() cannot be nested')
+
+    result = Profile()
+    originals = []
+    for owner, attribute, kind, name in _targets():
+        function = vars(owner)[attribute]
+        originals.append((owner, attribute, function))
+        setattr(owner, attribute, result.wrap(function, kind, name))
+    _active.append(result)
+    try:
+        yield result
+    finally:
+        _active.pop()
+        for owner, attribute, function in reversed(originals):
+            setattr(owner, attribute, function)
@@ -0,0 +1,470 @@
+"""
+A long-lived local server for low-latency fits
+
+Starting Python, importing impedance.py and SciPy, parsing a circuit and
+the first calls into NumPy and SciPy can take much longer than a fit
+itself. :class:`FitServer` pays these costs once: it keeps compiled
+circuits and a pool of warmed-up worker processes, and answers fit,
+predict and linKK requests from :class:`FitClient` over a Unix socket or
+a local TCP port::
+
+    python -m impedance.server --socket /tmp/impedance.sock
+
+    from impedance.server import FitClient
+
+    client = FitClient('/tmp/impedance.sock')
+    circuit = CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, .1, 1])
+    client.fit(circuit, frequencies, Z)
+
+Messages are a JSON header followed by the raw bytes of the arrays it
+describes. The server is meant for a single machine and has no
+authentication, so do not expose it on a public interface.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import threading
+import warnings
+
+import numpy as np
+
+from .models.circuits.fitting import FitResult, _compile, circuit_fit
+from .validation import linKK
+
+# lengths of the header and of the array data
+_PREFIX = struct.Struct('!II')
+
+
+def _send(sock, header, arrays=()):
+    """ writes a message of a JSON header and arrays to a socket """
+    arrays = [np.ascontiguousarray(array) for array in arrays]
+    header = dict(header, arrays=[[array.dtype.str, array.shape]
+                                  for array in arrays])
+    head = json.dumps(header).encode()
+    sock.sendall(_PREFIX.pack(len(head), sum(a.nbytes for a in arrays)) +
+                 head + b''.join(array.tobytes() for array in arrays))
+
+
+def _recv(sock):
+    """ reads a message from a socket as (header, arrays), or returns None
+    if the connection was closed """
+    prefix = _read(sock, _PREFIX.size)
+    if prefix is None:
+        return None
+    n_head, n_body = _PREFIX.unpack(prefix)
+    header = json.loads(_read(sock, n_head).decode())
+    body = _read(sock, n_body) if n_body else b''
+
+    arrays, offset = [], 0
+    for dtype, shape in header.pop('arrays'):
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        arrays.append(np.frombuffer(body, dtype, count, offset)
+                      .reshape(shape))
+        offset += count * dtype.itemsize
+    return header, arrays
+
+
+def _read(sock, n_bytes):
+    """ reads exactly n_bytes (None if the connection closes first) """
+    buffer = bytearray(n_bytes)
+    view = memoryview(buffer)
+    while view:
+        n_read = sock.recv_into(view)
+        if n_read == 0:
+            return None
+        view = view[n_read:]
+    return bytes(buffer)
+
+
+def _encode(value):
+    """ JSON encoding of numpy values in request parameters """
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f'{value!r} cannot be sent to a fit server')
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    # Unix sockets are not available (e.g. on Windows)
+    _UnixServer = None
+
+
+def _remove_socket(path):
+    """ removes a Unix socket left at `path`, but no other kind of file """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if stat.S_ISSOCK(mode):
+        os.remove(path)
+
+
+def _fit_job(circuit, initial_guess, constants, kwargs, frequencies,
+             impedance):
+    """ runs a fit (in a worker) and returns what is sent back """
+    parameters, conf, info = circuit_fit(frequencies, impedance, circuit,
+                                         initial_guess, constants=constants,
+                                         full_output=True, **kwargs)
+    summary = {key: info[key] for key in ['method', 'cost', 'converged',
+                                          'stopped', 'message', 'status',
+                                          'minimization_failures', 'nfev',
+                                          'njev', 'nit', 'n_data',
+                                          'timings']}
+    return parameters, conf, _native(summary)
+
+
+def _native(value):
+    """ converts numpy scalars in nested dicts to Python numbers """
+    if isinstance(value, dict):
+        return {key: _native(item) for key, item in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _linKK_job(f, Z, kwargs):
+    return linKK(f, Z, **kwargs)
+
+
+def _warm_up():
+    """ makes the first calls into NumPy and SciPy in a worker """
+    f = np.logspace(4, -1, 20)
+    Z = _compile('R0-p(R1,C1)', {})(f, [.01, .1, 1])
+    _fit_job('R0-p(R1,C1)', [.02, .05, 2], {}, {}, f, Z)
+    _linKK_job(f, Z, {'max_M': 5})
+    return os.getpid()
+
+
+class FitServer:
+    """ A local server for fits, predictions and lin-KK tests
+
+    Parameters
+    ----------
+    address : str or (str, int)
+        Path of a Unix socket, or (host, port) of a TCP socket. Port 0
+        picks a free port (see `address` after construction)
+    n_workers : int, optional
+        Number of worker processes for fits and linKK. With 0, requests
+        are handled in the server's threads (one per connection).
+        Defaults to the number of CPUs
+
+    Attributes
+    ----------
+    address : str or (str, int)
+        Address the server listens on
+
+    Notes
+    -----
+    Only elements in the default registry (built-in elements and those
+    added with the `element` decorator before the workers start) can be
+    used by clients.
+
+    Examples
+    --------
+    >>> with FitServer('/tmp/impedance.sock', n_workers=4) as server:
+    ...     server.serve_forever()
+    """
+    def __init__(self, address, n_workers=None, warm_up=True):
+        if isinstance(address, str) and _UnixServer is None:
+            raise ValueError('Unix sockets are not available on this ' +
+                             'platform, use a (host, port) address')
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        self.n_workers = n_workers
+        self.executor = None
+        if n_workers > 0:
+            self.executor = concurrent.futures.ProcessPoolExecutor(n_workers)
+            if warm_up:
+                for future in [self.executor.submit(_warm_up)
+                               for _ in range(n_workers)]:
+                    future.result()
+        elif warm_up:
+            _warm_up()
+
+        if isinstance(address, str):
+            _remove_socket(address)
+            server = _UnixServer
+        else:
+            server = _TCPServer
+        self._server = server(address, _Handler)
+        self._server.fit_server = self
+        self.address = self._server.server_address
+        self._thread = None
+
+    def serve_forever(self):
+        """ Handles requests until `shutdown` is called """
+        self._server.serve_forever()
+
+    def start(self):
+        """ Handles requests in a background thread
+
+        Returns
+        -------
+        self : FitServer
+        """
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        """ Stops serving, closes the socket and stops the workers """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        if isinstance(self.address, str):
+            _remove_socket(self.address)
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def handle(self, header, arrays):
+        """ Answers one request
+
+        Parameters
+        ----------
+        header : dict
+            Request, with the operation ('ping', 'fit', 'predict' or
+            'linKK') under 'op' and its parameters
+        arrays : list of numpy arrays
+            Data of the request
+
+        Returns
+        -------
+        header : dict
+        arrays : list of numpy arrays
+        """
+        op = header.get('op')
+        if op == 'ping':
+            return {'pid': os.getpid(), 'n_workers': self.n_workers}, []
+
+        if op == 'predict':
+            frequencies, parameters = arrays
+            model = _compile(header['circuit'], header['constants'],
+                             header.get('jit', False))
+            return {}, [model(frequencies, parameters)]
+
+        if op == 'fit':
+            parameters, conf, summary = self._run(
+                _fit_job, header['circuit'], header['initial_guess'],
+                header['constants'], header['kwargs'], *arrays)
+            arrays = [parameters] if conf is None else [parameters, conf]
+            return {'info': summary}, arrays
+
+        if op == 'linKK':
+            M, mu, Z_fit, res_real, res_imag = self._run(
+                _linKK_job, *arrays, header['kwargs'])
+            return {'M': int(M), 'mu': float(mu)}, \
+                [Z_fit, res_real, res_imag]
+
+        raise ValueError(f'unknown operation {op!r}')
+
+    def _run(self, function, *args):
+        if self.executor is None:
+            return function(*args)
+        return self.executor.submit(function, *args).result()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """ answers the requests on one connection until it is closed """
+    def handle(self):
+        while True:
+            message = _recv(self.request)
+            if message is None:
+                return
+            try:
+                reply = self.server.fit_server.handle(*message)
+            except Exception as error:
+                reply = {'error': f'{type(error).__name__}: {error}'}, []
+            _send(self.request, *reply)
+
+
+class FitClient:
+    """ A connection to a :class:`FitServer`
+
+    Requests on one client are sent one at a time (it can be shared
+    between threads); open several clients to run fits in parallel.
+
+    Parameters
+    ----------
+    address : str or (str, int)
+        Address of the server
+    timeout : float, optional
+        Seconds to wait for a reply before raising socket.timeout.
+        Defaults to None (wait indefinitely)
+    """
+    def __init__(self, address, timeout=None):
+        if isinstance(address, str) and _UnixServer is None:
+            raise ValueError('Unix sockets are not available on this ' +
+                             'platform, use a (host, port) address')
+        family = socket.AF_UNIX if isinstance(address, str) else \
+            socket.AF_INET
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(address if isinstance(address, str)
+                             else tuple(address))
+        self._lock = threading.Lock()
+
+    def _request(self, header, arrays=()):
+        with self._lock:
+            _send(self._socket, header, arrays)
+            reply = _recv(self._socket)
+        if reply is None:
+            raise ConnectionError('the fit server closed the connection')
+        if 'error' in reply[0]:
+            raise RuntimeError(f'fit server error: {reply[0]["error"]}')
+        return reply
+
+    def ping(self):
+        """ Checks the server
+
+        Returns
+        -------
+        info : dict
+            Process ID ('pid') and number of workers ('n_workers') of
+            the server
+        """
+        return self._request({'op': 'ping'})[0]
+
+    def fit(self, model, frequencies, impedance, bounds=None,
+            weight_by_modulus=False, **kwargs):
+        """ Fits a circuit on the server, like `BaseCircuit.fit`
+
+        Parameters
+        ----------
+        model : BaseCircuit
+            Circuit to fit (with an initial guess), using elements of the
+            server's default registry
+        frequencies, impedance, bounds, weight_by_modulus, kwargs :
+            As for `BaseCircuit.fit`, except that kwargs must be JSON
+            serializable (e.g. no iteration_callback)
+
+        Returns
+        -------
+        model : BaseCircuit
+            The fitted model
+        """
+        if model.initial_guess == []:
+            raise ValueError('No initial guess supplied')
+        if getattr(model, 'elements', None) is not None:
+            raise ValueError('circuits with their own element registry ' +
+                             'cannot be fit on a server')
+        frequencies = np.array(frequencies, dtype=float)
+        impedance = np.array(impedance, dtype=complex)
+        if len(frequencies) != len(impedance):
+            raise TypeError('length of frequencies and impedance do not match')
+
+        kwargs = dict(kwargs, bounds=bounds,
+                      weight_by_modulus=weight_by_modulus)
+        kwargs.setdefault('jit', model.jit)
+        header = {'op': 'fit', 'circuit': model.circuit,
+                  'initial_guess': model.initial_guess,
+                  'constants': model.constants, 'kwargs': kwargs}
+        header = json.loads(json.dumps(header, default=_encode))
+        reply, arrays = self._request(header, [frequencies, impedance])
+
+        info = reply['info']
+        model.parameters_ = np.array(arrays[0])
+        if len(arrays) > 1:
+            model.conf_ = np.array(arrays[1])
+        model.converged_ = info['converged']
+        model.fit_result_ = FitResult(circuit=model.circuit,
+                                      parameters=model.parameters_,
+                                      perror=model.conf_, **info)
+        if not info['converged']:
+            reason = 'stopped early' if info['stopped'] \
+                else 'did not converge'
+            warnings.warn(f'fit {reason} ({info["message"]}), ' +
+                          'keeping the best parameters found')
+        return model
+
+    def predict(self, model, frequencies, use_initial=False):
+        """ Predicts the impedance of a circuit on the server, like
+        `BaseCircuit.predict`
+
+        Returns
+        -------
+        impedance : numpy array of dtype 'complex128'
+        """
+        if model.parameters_ is not None and not use_initial:
+            parameters = model.parameters_
+        else:
+            warnings.warn("Simulating circuit based on initial parameters")
+            parameters = model.initial_guess
+        header = {'op': 'predict', 'circuit': model.circuit,
+                  'constants': model.constants, 'jit': model.jit}
+        header = json.loads(json.dumps(header, default=_encode))
+        _, (Z,) = self._request(header, [
+            np.array(frequencies, dtype=float),
+            np.array(parameters, dtype=float)])
+        return np.array(Z)
+
+    def linKK(self, f, Z, **kwargs):
+        """ Runs `impedance.validation.linKK` on the server
+
+        Returns
+        -------
+        M, mu, Z_fit, res_real, res_imag :
+            As returned by `linKK`
+        """
+        header = {'op': 'linKK', 'kwargs': kwargs}
+        reply, arrays = self._request(header, [
+            np.array(f, dtype=float), np.array(Z, dtype=complex)])
+        Z_fit, res_real, res_imag = (np.array(a) for a in arrays)
+        return reply['M'], reply['mu'], Z_fit, res_real, res_imag
+
+    def close(self):
+        """ Closes the connection """
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve impedance.py fits on a local socket')
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument('--socket', help='path of a Unix socket')
+    address.add_argument('--port', type=int, help='local TCP port')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='interface for --port (default 127.0.0.1)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: CPUs)')
+    args = parser.parse_args(argv)
+
+    address = args.socket if args.socket else (args.host, args.port)
+    with FitServer(address, n_workers=args.workers) as server:
+        print(f'serving on {server.address}', flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""
+A columnar store for large numbers of fit results
+
+:meth:`BaseCircuit.save` writes one JSON file per model, which does not
+scale to millions of fits. A :class:`ResultStore` keeps one table per
+circuit, with one binary file of float64 values per column, so appending
+a chunk of results writes a few contiguous blocks and reading a parameter
+for every spectrum is a single memory-mapped array::
+
+    store = ResultStore('results')
+    store.append(circuit, ids, parameters, conf, cost, status)
+    R1 = store.table(circuit).column('R1')
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from .models.circuits import CircuitFamily
+from .models.circuits.circuits import _param_names
+
+__all__ = ['ResultStore', 'ResultTable', 'CONVERGED', 'NOT_CONVERGED',
+           'FAILED']
+
+# values of the status column
+CONVERGED = 1
+NOT_CONVERGED = 0
+FAILED = -1
+
+
+class ResultTable:
+    """ Fit results of one circuit, stored column by column
+
+    The directory holds meta.json (circuit, constants, parameter names and
+    units, and the number of rows), one file of little-endian float64
+    values per parameter (param.<name>.f64) and per parameter error
+    (conf.<name>.f64), cost.f64, status.i1 (int8, see `CONVERGED`,
+    `NOT_CONVERGED` and `FAILED`) and ids.txt (one id per line).
+
+    The number of rows is recorded after the columns are written, so rows
+    of an interrupted append are discarded when the table is next opened.
+    A table has a single writer; reading while appending is safe.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the table (use :meth:`ResultStore.table` to create
+        one)
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.circuit = self.meta['circuit']
+        self.constants = self.meta['constants']
+        self.names = self.meta['names']
+        self.units = self.meta['units']
+        self._lock = threading.Lock()
+        self._repaired = False
+
+    @classmethod
+    def create(cls, directory, circuit, constants, names, units):
+        """ Creates an empty table """
+        os.makedirs(directory, exist_ok=True)
+        meta = {'circuit': circuit, 'constants': constants,
+                'names': list(names), 'units': list(units),
+                'n_rows': 0, 'ids_bytes': 0}
+        _write_json(os.path.join(directory, 'meta.json'), meta)
+        return cls(directory)
+
+    def _files(self):
+        """ path and dtype of each column file """
+        files = {}
+        for name in self.names:
+            files[f'param.{name}'] = ('<f8', f'param.{name}.f64')
+            files[f'conf.{name}'] = ('<f8', f'conf.{name}.f64')
+        files['cost'] = ('<f8', 'cost.f64')
+        files['status'] = ('i1', 'status.i1')
+        return {key: (dtype, os.path.join(self.directory, name))
+                for key, (dtype, name) in files.items()}
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    def _repair(self):
+        """ truncates columns to the recorded number of rows """
+        n_rows = len(self)
+        for dtype, path in self._files().values():
+            with open(path, 'ab') as f:
+                f.truncate(n_rows * np.dtype(dtype).itemsize)
+        with open(os.path.join(self.directory, 'ids.txt'), 'ab') as f:
+            f.truncate(self.meta['ids_bytes'])
+        self._repaired = True
+
+    def append(self, ids, parameters, conf=None, cost=None, status=None):
+        """ Appends a chunk of results
+
+        Parameters
+        ----------
+        ids : list of str
+            Identifiers of the spectra (without newlines)
+        parameters : array-like, shape (n_rows, n_params)
+            Fitted parameters, in the order of `names`
+        conf : array-like, shape (n_rows, n_params), optional
+            Parameter errors. Defaults to NaN
+        cost : array-like, shape (n_rows,), optional
+            Final cost of each fit. Defaults to NaN
+        status : array-like of int, shape (n_rows,), optional
+            `CONVERGED`, `NOT_CONVERGED` or `FAILED`. Defaults to
+            CONVERGED for rows with finite parameters and FAILED otherwise
+        """
+        ids = [str(i) for i in ids]
+        n_rows = len(ids)
+        parameters = np.asarray(parameters, dtype=float).reshape(
+            n_rows, len(self.names))
+        conf = np.full_like(parameters, np.nan) if conf is None else \
+            np.asarray(conf, dtype=float).reshape(parameters.shape)
+        cost = np.full(n_rows, np.nan) if cost is None else \
+            np.asarray(cost, dtype=float).reshape(n_rows)
+        if status is None:
+            status = np.where(np.isfinite(parameters).all(axis=1),
+                              CONVERGED, FAILED)
+        status = np.asarray(status).reshape(n_rows)
+        if any('\n' in i for i in ids):
+            raise ValueError('ids cannot contain newlines')
+
+        columns = {'cost': cost, 'status': status}
+        for k, name in enumerate(self.names):
+            columns[f'param.{name}'] = parameters[:, k]
+            columns[f'conf.{name}'] = conf[:, k]
+        encoded = ''.join(i + '\n' for i in ids).encode()
+
+        with self._lock:
+            if not self._repaired:
+                self._repair()
+            for key, (dtype, path) in self._files().items():
+                with open(path, 'ab') as f:
+                    f.write(np.ascontiguousarray(columns[key],
+                                                 dtype=dtype).tobytes())
+            with open(os.path.join(self.directory, 'ids.txt'), 'ab') as f:
+                f.write(encoded)
+            meta = dict(self.meta, n_rows=len(self) + n_rows,
+                        ids_bytes=self.meta['ids_bytes'] + len(encoded))
+            _write_json(os.path.join(self.directory, 'meta.json'), meta)
+            self.meta = meta
+
+    def column(self, name, conf=False):
+        """ Reads a column without copying it into memory
+
+        Parameters
+        ----------
+        name : str
+            Parameter name (e.g. 'R1' or 'CPE1_0'), 'cost' or 'status'
+        conf : bool, optional
+            Read the errors of the parameter instead of its values.
+            Defaults to False
+
+        Returns
+        -------
+        column : read-only numpy array (memory-mapped), shape (n_rows,)
+        """
+        key = name if name in ['cost', 'status'] else \
+            f'{"conf" if conf else "param"}.{name}'
+        files = self._files()
+        if key not in files:
+            raise KeyError(f'{name!r} is not a column of {self.circuit} ' +
+                           f'(parameters: {self.names})')
+        dtype, path = files[key]
+        if len(self) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(len(self),))
+
+    def parameters(self, conf=False):
+        """ All parameters (or their errors) as an array of shape
+        (n_rows, n_params) """
+        return np.column_stack([self.column(name, conf)
+                                for name in self.names]) \
+            if self.names else np.empty((len(self), 0))
+
+    def family(self, mask=None):
+        """ The results as a CircuitFamily, e.g. for printing, predicting
+        or plotting individual fits
+
+        Parameters
+        ----------
+        mask : array-like of bool or int, optional
+            Rows to include. Defaults to all rows
+
+        Returns
+        -------
+        family : CircuitFamily
+            Family whose fitted parameters are the stored parameters and
+            whose ids are the stored ids. Its initial guess is the fitted
+            parameters
+        """
+        parameters, conf = self.parameters(), self.parameters(conf=True)
+        ids = self.ids()
+        if mask is not None:
+            parameters, conf = parameters[mask], conf[mask]
+            ids = list(np.asarray(ids, dtype=object)[mask])
+        return CircuitFamily(self.circuit, parameters, parameters, conf,
+                             constants=self.constants, ids=ids)
+
+    def ids(self):
+        """ Identifiers of the rows
+
+        Returns
+        -------
+        ids : list of str
+        """
+        with open(os.path.join(self.directory, 'ids.txt'), 'rb') as f:
+            data = f.read(self.meta['ids_bytes'])
+        return data.decode().split('\n')[:-1]
+
+    def __repr__(self):
+        return f'ResultTable({self.circuit!r}, {len(self)} rows)'
+
+
+class ResultStore:
+    """ Fit results of many spectra and circuits, one table per circuit
+    and set of constant values
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the store, created if needed
+
+    Examples
+    --------
+    >>> store = ResultStore('results')
+    >>> for chunk in chunks:
+    ...     popt, perror, _ = batch_circuit_fit(f, chunk.Z, circuit.circuit,
+    ...                                         circuit.initial_guess)
+    ...     store.append(circuit, chunk.ids, popt, perror)
+    >>> store.table(circuit).column('R1')
+    memmap([0.1 , 0.12, ...])
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def tables(self):
+        """ The tables of the store
+
+        Returns
+        -------
+        tables : list of ResultTable
+        """
+        return [self._open(name) for name in sorted(os.listdir(
+            self.directory)) if os.path.exists(os.path.join(
+                self.directory, name, 'meta.json'))]
+
+    def _open(self, name):
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = ResultTable(
+                    os.path.join(self.directory, name))
+            return self._tables[name]
+
+    def table(self, circuit, constants=None):
+        """ The table of a circuit and its constants, created if needed
+
+        Parameters
+        ----------
+        circuit : BaseCircuit or str
+            Model (whose circuit string, constants and parameter names are
+            used) or circuit string
+        constants : dict, optional
+            Constants of the circuit, if given as a string. Defaults to
+            no constants
+
+        Returns
+        -------
+        table : ResultTable
+        """
+        if isinstance(circuit, str):
+            circuit, elements = circuit.replace(' ', ''), None
+            constants = constants or {}
+        else:
+            circuit, constants, elements = \
+                circuit.circuit, circuit.constants, circuit.elements
+        names, units = _param_names(circuit, constants, elements)
+        constants = {key: float(value) for key, value in constants.items()}
+        name = _table_name(circuit, constants)
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            ResultTable.create(path, circuit, constants, names, units)
+        return self._open(name)
+
+    def append(self, circuit, ids, parameters, conf=None, cost=None,
+               status=None):
+        """ Appends a chunk of results to the table of a circuit (see
+        :meth:`ResultTable.append`) """
+        self.table(circuit).append(ids, parameters, conf, cost, status)
+
+    def append_models(self, ids, models):
+        """ Appends fitted models (e.g. CustomCircuits after `fit`)
+
+        Parameters
+        ----------
+        ids : list of str
+            Identifiers of the models
+        models : list of BaseCircuit
+            Models, grouped into one append per circuit. Unfitted models
+            are stored as FAILED
+        """
+        groups = {}
+        for spectrum_id, model in zip(ids, models):
+            table = self.table(model)
+            groups.setdefault(table.directory, (table, []))[1].append(
+                (spectrum_id, model))
+        for table, rows in groups.values():
+            n_params = len(table.names)
+            parameters = np.full((len(rows), n_params), np.nan)
+            conf = np.full((len(rows), n_params), np.nan)
+            status = np.full(len(rows), FAILED)
+            cost = np.full(len(rows), np.nan)
+            for k, (_, model) in enumerate(rows):
+                if model.parameters_ is None:
+                    continue
+                parameters[k] = model.parameters_
+                if model.conf_ is not None:
+                    conf[k] = model.conf_
+                if model.fit_result_ is not None:
+                    cost[k] = model.fit_result_.cost
+                status[k] = NOT_CONVERGED if model.converged_ is False \
+                    else CONVERGED
+            table.append([i for i, _ in rows], parameters, conf, cost,
+                         status)
+
+
+def _table_name(circuit, constants):
+    """ directory name of the table of a circuit and its constants """
+    key = json.dumps([circuit, sorted(constants.items())])
+    readable = ''.join(c if c.isalnum() else '_' for c in circuit)[:40]
+    return f'{readable}-{hashlib.sha1(key.encode()).hexdigest()[:12]}'
+
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+
+from impedance.aio import FitPool
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits.simulation import simulate_spectra
+from impedance.preprocessing import readCSV
+
+circuit = 'R0-p(R1,CPE1)'
+initial_guess = [.01, .1, 1e-3, .85]
+f, parameters, Z = next(simulate_spectra(
+    CustomCircuit(circuit, initial_guess=initial_guess), 8, seed=0))
+
+
+def circuit_fit_reference(spectrum):
+    model = CustomCircuit(circuit, initial_guess=initial_guess)
+    return model.fit(f, spectrum).parameters_
+
+
+def test_FitPool_circuit_fit():
+    running = []
+
+    def callback(parameters, cost):
+        running.append(len(running))
+        return False
+
+    async def main():
+        async with FitPool(max_concurrency=2) as pool:
+            return await asyncio.gather(*[
+                pool.circuit_fit(f, spectrum, circuit, initial_guess,
+                                 iteration_callback=callback)
+                for spectrum in Z])
+
+    results = asyncio.run(main())
+    assert len(results) == len(Z)
+    popt, perror = results[0]
+    assert np.allclose(popt, circuit_fit_reference(Z[0]))
+    assert running
+
+
+def test_FitPool_fit_and_linKK():
+    model = CustomCircuit(circuit, initial_guess=initial_guess)
+    data = os.path.join(os.path.dirname(__file__), '../../data')
+    f_data, Z_data = readCSV(os.path.join(data, 'exampleData.csv'))
+
+    async def main():
+        pool = FitPool(max_concurrency=2, processes=True)
+        try:
+            fitted = await pool.fit(model, f, Z[0])
+            kk = await pool.linKK(f_data, Z_data, max_M=20)
+        finally:
+            pool.shutdown()
+        return fitted, kk
+
+    fitted, (M, mu, Z_fit, _, _) = asyncio.run(main())
+    assert fitted is model
+    assert np.allclose(model.parameters_, circuit_fit_reference(Z[0]))
+    assert model.converged_
+    assert len(Z_fit) == len(f_data)
+
+
+def slow_callback(parameters, cost):
+    time.sleep(0.05)
+    return False
+
+
+def test_FitPool_cancel_and_timeout():
+    model = CustomCircuit(circuit, initial_guess=initial_guess)
+
+    async def main():
+        pool = FitPool(max_concurrency=1)
+        # stopped at the next iteration, leaving the model untouched
+        start = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.fit(model, f, Z[0], timeout=0.1,
+                           iteration_callback=slow_callback)
+        assert time.perf_counter() - start < 1
+        assert not hasattr(model, 'parameters_') or \
+            model.parameters_ is None
+
+        # cancelled while running, and while waiting for the running fit
+        fits = [pool.circuit_fit(f, Z[0], circuit, initial_guess,
+                                 iteration_callback=slow_callback)
+                for _ in range(2)]
+        tasks = [asyncio.ensure_future(fit) for fit in fits]
+        await asyncio.sleep(0.1)
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(r, asyncio.CancelledError) for r in results)
+        pool.shutdown()
+
+    with pytest.warns(UserWarning, match='stopped early'):
+        asyncio.run(main())
+
+
+def test_FitPool_cancel_global_opt():
+    # started at the optimum of exact data, basinhopping never improves on
+    # its first cost, but is still stopped right away
+    guess = list(parameters[0])
+    exact = CustomCircuit(circuit, initial_guess=guess).predict(f)
+
+    async def main():
+        pool = FitPool(max_concurrency=1)
+        task = asyncio.ensure_future(pool.circuit_fit(
+            f, exact, circuit, guess, global_opt=True, niter=20))
+        await asyncio.sleep(0.2)
+        start = time.perf_counter()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        cancelled = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.circuit_fit(f, exact, circuit, guess,
+                                   global_opt=True, niter=20, timeout=0.2)
+        timed_out = time.perf_counter() - start
+        pool.shutdown()
+        return cancelled, timed_out
+
+    with pytest.warns(UserWarning, match='stopped early'):
+        cancelled, timed_out = asyncio.run(main())
+    assert cancelled < 0.1
+    assert timed_out < 0.3
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from impedance.models.circuits.batch import batch_circuit_fit, \
+    joint_circuit_fit
+from impedance.models.circuits.compiler import CompiledCircuit
+from impedance.models.circuits.elements import ElementRegistry
+from impedance.models.circuits.fitting import circuit_fit
+
+
+def test_batch_circuit_fit():
+    circuit = 'R0-p(R1,C1)-p(R2,CPE1)'
+    frequencies = np.logspace(5, -2, 40)
+    true = np.array([.01, .05, 1e-4, .1, .01, .8])
+    initial_guess = [.02, .02, 1e-3, .2, .05, .9]
+
+    rng = np.random.default_rng(0)
+    params = true * np.exp(rng.normal(0, .2, size=(8, len(true))))
+    params[:, -1] = np.minimum(params[:, -1], .95)
+    Z = CompiledCircuit(circuit)(frequencies, params)
+
+    # noise-free spectra are recovered
+    popt, perror, converged = batch_circuit_fit(frequencies, Z, circuit,
+                                                initial_guess)
+    assert converged.all()
+    assert popt.shape == perror.shape == params.shape
+    assert np.allclose(popt, params, rtol=1e-4)
+
+    # matches a single curve_fit on noisy data
+    noise = rng.normal(0, 1e-4, size=(2, len(frequencies)))
+    Z_noisy = Z[0] + noise[0] + 1j * noise[1]
+    popt, perror, _ = batch_circuit_fit(frequencies, Z_noisy, circuit,
+                                        initial_guess)
+    p_single, e_single = circuit_fit(frequencies, Z_noisy, circuit,
+                                     initial_guess)
+    assert np.allclose(popt[0], p_single, rtol=1e-3)
+    assert np.allclose(perror[0], e_single, rtol=1e-2)
+
+    # per-spectrum initial guesses and weights
+    initial_guesses = np.minimum(params * 1.1, 1)
+    popt, _, _ = batch_circuit_fit(frequencies, Z, circuit, initial_guesses,
+                                   weight_by_modulus=True)
+    assert np.allclose(popt, params, rtol=1e-4)
+
+    with pytest.raises(ValueError):
+        batch_circuit_fit(frequencies[1:], Z, circuit, initial_guess)
+
+    # non-finite data is rejected before fitting
+    Z_bad = Z.copy()
+    Z_bad[[2, 5], 3] = np.nan
+    with pytest.raises(ValueError, match=r'\[2, 5\]'):
+        batch_circuit_fit(frequencies, Z_bad, circuit, initial_guess)
+
+
+def test_batch_circuit_fit_stalled():
+    # a jagged cost stalls the iteration, which is not convergence
+    registry = ElementRegistry.default().derive()
+
+    @registry.element(num_params=1, units=['Ohm'])
+    def Rj(p, f):
+        return (p[0] + 1e-2 * np.sin(1e7 * p[0])) * np.ones(len(f))
+
+    frequencies = np.logspace(3, -1, 20)
+    Z = CompiledCircuit('Rj0-p(R1,C1)', elements=registry)(
+        frequencies, [[1, .5, 1e-2], [2, .5, 1e-2]])
+    with pytest.warns(UserWarning, match='2 of 2 spectra did not converge'):
+        _, _, converged = batch_circuit_fit(frequencies, Z, 'Rj0-p(R1,C1)',
+                                            [.5, .4, 2e-2],
+                                            elements=registry)
+    assert not converged.any()
+
+
+def test_joint_circuit_fit():
+    circuit = 'R0-p(R1,CPE1)-p(R2,C2)'
+    frequencies = np.logspace(5, -2, 30)
+    rng = np.random.default_rng(1)
+    params = np.array([.01, .05, 1e-3, .85, .1, 1]) * \
+        np.exp(rng.normal(0, .3, size=(6, 6)))
+    params[:, 0], params[:, 3] = .01, .85
+    model = CompiledCircuit(circuit)
+    Z = model(frequencies, params)
+    initial_guess = [.02, .05, 1e-3, .9, .1, 1]
+
+    popt, perror = joint_circuit_fit(frequencies, Z, circuit, initial_guess,
+                                     shared=['R0', 'CPE1_1'])
+    assert popt.shape == perror.shape == params.shape
+    assert np.allclose(popt, params, rtol=1e-4)
+    assert np.all(popt[:, 0] == popt[0, 0])
+
+    # one frequency grid per spectrum
+    grids = [frequencies[i:] for i in range(len(Z))]
+    spectra = [model(f_i, p_i) for f_i, p_i in zip(grids, params)]
+    popt, _ = joint_circuit_fit(grids, spectra, circuit, params,
+                                shared=['R0'], weight_by_modulus=True)
+    assert np.allclose(popt, params, rtol=1e-4)
+
+    with pytest.raises(ValueError):
+        joint_circuit_fit(frequencies, Z, circuit, initial_guess,
+                          shared=['R5'])
@@ -0,0 +1,72 @@
+import json
+
+import numpy as np
+import pytest
+
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits.checkpoint import read_results, \
+    resumable_fit
+from impedance.models.circuits.fitting import circuit_fit
+from impedance.models.circuits.simulation import simulate_spectra
+
+circuit = CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, .1, 1])
+f, _, Z = next(simulate_spectra(circuit, 10, seed=0))
+spectra = [(f, spectrum, f'cell-{i}') for i, spectrum in enumerate(Z)]
+spectra[4] = (f[:3], Z[4][:2], 'cell-4')  # mismatched lengths
+
+
+class Preempted(Exception):
+    pass
+
+
+def preempted_after(n):
+    for i, spectrum in enumerate(spectra):
+        if i == n:
+            raise Preempted()
+        yield spectrum
+
+
+def test_resumable_fit(tmp_path):
+    reference = str(tmp_path / 'reference.jsonl')
+    assert resumable_fit(circuit, spectra, reference,
+                         checkpoint_every=3) == 10
+
+    # interrupted after 7 spectra, of which 6 were checkpointed
+    output = str(tmp_path / 'output.jsonl')
+    with pytest.raises(Preempted):
+        resumable_fit(circuit, preempted_after(7), output,
+                      checkpoint_every=3)
+    with open(output, 'a') as file:
+        file.write('{"id": "cell-7", "param')  # partially written line
+    assert resumable_fit(circuit, spectra, output, checkpoint_every=3) == 4
+
+    with open(reference, 'rb') as expected, open(output, 'rb') as actual:
+        assert expected.read() == actual.read()
+    assert resumable_fit(circuit, spectra, output) == 0
+
+    results = read_results(output)
+    assert results['id'] == [spectrum_id for _, _, spectrum_id in spectra]
+    popt, perror = circuit_fit(f, Z[0], circuit.circuit,
+                               circuit.initial_guess)
+    assert np.array_equal(results['parameters'][0], popt)
+    assert np.array_equal(results['conf'][0], perror)
+    assert results['converged'][0]
+    assert np.isnan(results['parameters'][4]).all()
+    assert results['error'][4].startswith('ValueError')
+
+    with open(output + '.checkpoint') as checkpoint:
+        assert json.load(checkpoint)['offset'] > 0
+    with pytest.raises(ValueError, match='different fit'):
+        resumable_fit(circuit, spectra, output, global_opt=True)
+
+    # files without a checkpoint are never truncated silently
+    other = tmp_path / 'other.jsonl'
+    other.write_text('{"id": "not a fit result"}\n')
+    with pytest.raises(FileExistsError):
+        resumable_fit(circuit, spectra, str(other))
+    assert other.read_text() == '{"id": "not a fit result"}\n'
+    assert resumable_fit(circuit, spectra, str(other), overwrite=True) == 10
+    with open(reference, 'rb') as expected:
+        assert other.read_bytes() == expected.read()
+    assert resumable_fit(circuit, spectra, output, global_opt=True,
+                         seed=0, overwrite=True, niter=1) == 10
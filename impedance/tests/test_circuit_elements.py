@@ -4,9 +4,11 @@ import warnings
 import numpy as np
 import pytest
 
+from impedance.models.circuits import CustomCircuit
 from impedance.models.circuits.elements import (OverwriteError,
                                                 circuit_elements, element, p,
-                                                s, ElementError)
+                                                s, ElementError,
+                                                ElementRegistry)
 
 
 def test_each_element():
@@ -215,3 +217,52 @@ def test_add_element_overwrite():
 
     assert "NE3" in circuit_elements
     assert circuit_elements["NE3"]([1], [1]) == [[1, 1]]
+
+
+def test_overwrite_shared_circuit():
+    # circuits compiled before an element is redefined are not reused
+    @element(num_params=1, units=["Ohm"])
+    def NEX(p, f):
+        return p[0] * np.ones(len(f))
+
+    circuit = CustomCircuit("R0-NEX1", initial_guess=[1, 2])
+    assert np.allclose(circuit.predict([1, 10], use_initial=True), 3)
+
+    @element(num_params=1, units=["Ohm"], overwrite=True)
+    def NEX(p, f):  # noqa: F811
+        return 10 * p[0] * np.ones(len(f))
+
+    assert np.allclose(circuit.predict([1, 10], use_initial=True), 21)
+
+
+def test_ElementRegistry():
+    default = ElementRegistry.default()
+    assert set(circuit_elements) - set(default) == {"np"}
+
+    registry = default.derive()
+    assert registry["R"] is default["R"]
+
+    @registry.element(num_params=1, units=["Ohm"])
+    def NE4(p, f):
+        return p[0] * np.ones(len(f))
+
+    assert "NE4" in registry
+    assert registry["NE4"]([2.0], [1.0, 2.0]).tolist() == [2, 2]
+    assert registry["NE4"].units == ["Ohm"]
+    assert "NE4" not in default and "NE4" not in circuit_elements
+
+    # elements added to the default afterwards are not inherited
+    @element(num_params=1, units=["Ohm"])
+    def NE5(p, f):
+        return p[0] * np.ones(len(f))
+
+    assert "NE5" in default and "NE5" not in registry
+
+    registry.add(default["NE5"])
+    with pytest.raises(OverwriteError):
+        registry.add(default["NE5"])
+    registry.add(default["R"], overwrite=True)
+    with pytest.raises(ElementError):
+        @registry.element(num_params=1, units=["Ohm"])
+        def p(p, f):
+            return np.nan
@@ -1,3 +1,4 @@
+import concurrent.futures
 import json
 import os
 
@@ -5,7 +6,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 import pytest
 
-from impedance.models.circuits import BaseCircuit, CustomCircuit, Randles
+from impedance.models.circuits import BaseCircuit, CircuitFamily, \
+    CustomCircuit, ElementRegistry, Randles, estimate_initial_guess
 
 # get example data
 data = np.genfromtxt(os.path.join("./data/",
@@ -198,3 +200,147 @@ def test_CustomCircuit():
     circuit = circuit = 'R0-p(R1, C1)'
     initial_guess = [1, 2, 3]
     circuit = CustomCircuit(circuit, initial_guess=initial_guess)
+
+
+def test_fit_diagnostics():
+    circuit = CustomCircuit('R0-p(R1,C1)-p(R2-Wo1,C2)',
+                            initial_guess=[.01, .01, 100, .01, .05, 100, 1])
+    circuit.fit(f, Z)
+    assert circuit.converged_
+    assert circuit.fit_result_.converged
+    assert np.allclose(circuit.fit_result_.parameters, circuit.parameters_)
+
+    with pytest.warns(UserWarning, match='fit stopped early'):
+        circuit.fit(f, Z, time_budget=0)
+    assert not circuit.converged_
+    assert np.allclose(circuit.parameters_, circuit.initial_guess)
+
+
+def test_CustomCircuit_auto_guess(tmp_path):
+    frequencies = np.logspace(5, -2, 50)
+    true = [.01, .05, 1e-4, .1, 1, .85]
+    Z_true = CustomCircuit('R0-p(R1,C1)-p(R2,CPE1)',
+                           initial_guess=true).predict(frequencies)
+
+    circuit = CustomCircuit('R0-p(R1,C1)-p(R2,CPE1)', initial_guess='auto')
+    assert 'auto' in str(circuit)
+    with pytest.raises(ValueError):
+        circuit.predict(frequencies)
+
+    circuit.fit(frequencies, Z_true)
+    assert circuit.initial_guess == 'auto'
+    assert np.allclose(circuit.parameters_, true, rtol=1e-3)
+
+    # same as fitting from the estimate
+    guess = estimate_initial_guess(frequencies, Z_true, circuit.circuit)
+    manual = CustomCircuit(circuit.circuit, initial_guess=list(guess))
+    manual.fit(frequencies, Z_true)
+    assert np.allclose(manual.parameters_, circuit.parameters_)
+
+    # the guess is estimated again for each spectrum
+    circuit.fit(frequencies, 2 * Z_true)
+    assert np.allclose(circuit.parameters_[:2], 2 * np.array(true[:2]),
+                       rtol=1e-3)
+
+    circuit.save(tmp_path / 'auto.json')
+    loaded = CustomCircuit()
+    loaded.load(tmp_path / 'auto.json')
+    assert loaded.initial_guess == 'auto'
+
+    with pytest.raises(ValueError):
+        CustomCircuit('R0-p(R1,C1)', initial_guess='guess')
+
+
+def test_CustomCircuit_elements():
+    # two tenants with different elements of the same name
+    tenants = []
+    for scale in [1, 10]:
+        registry = ElementRegistry.default().derive()
+
+        @registry.element(num_params=2, units=['Ohm', 'F'])
+        def Tenant(p, f, scale=scale):
+            """ an RC arc scaled differently for each tenant """
+            omega = 2 * np.pi * np.array(f)
+            return scale * p[0] / (1 + 1j * omega * p[0] * p[1])
+
+        tenants.append(registry)
+
+    with pytest.raises(ValueError):
+        CustomCircuit('R0-Tenant1', initial_guess=[.01, .1, 1])
+
+    frequencies = np.logspace(4, -2, 40)
+    true = [.01, .1, 1]
+    guesses = [.02, .05, 2]
+    data = [CustomCircuit('R0-Tenant1', initial_guess=true,
+                          elements=registry).predict(frequencies)
+            for registry in tenants]
+    assert not np.allclose(data[0], data[1])
+
+    def fit(tenant):
+        model = CustomCircuit('R0-Tenant1', initial_guess=guesses,
+                              elements=tenants[tenant])
+        return model.fit(frequencies, data[tenant])
+
+    assert fit(0).get_param_names() == \
+        (['R0', 'Tenant1_0', 'Tenant1_1'], ['Ohm', 'Ohm', 'F'])
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        fitted = list(executor.map(fit, [0, 1] * 4))
+    for model in fitted:
+        assert np.allclose(model.parameters_, true, rtol=1e-3)
+
+
+def test_CircuitFamily():
+    circuit = 'R0-p(R1,CPE1)'
+    guess = [.01, .1, 1e-3]
+    models = []
+    for scale in [1, 2, 3]:
+        model = CustomCircuit(circuit, initial_guess=guess,
+                              constants={'CPE1_1': .9}, name=f'cell-{scale}')
+        model.parameters_ = scale * np.array(guess)
+        model.conf_ = .1 * model.parameters_
+        models.append(model)
+
+    family = CircuitFamily.from_models(models)
+    assert len(family) == 3 and family.ids == ['cell-1', 'cell-2', 'cell-3']
+    assert np.allclose(family.column('R1'), [.1, .2, .3])
+
+    # members print and predict like the models they came from
+    f = np.logspace(5, -2, 20)
+    Z = family.predict(f)
+    assert Z.shape == (3, 20)
+    for k, (member, model) in enumerate(zip(family, models)):
+        assert str(member) == str(model)
+        assert np.allclose(member.predict(f), model.predict(f))
+        assert np.allclose(Z[k], model.predict(f))
+    assert family[-1].to_circuit() == models[-1]
+    with pytest.raises(TypeError):
+        family[0].fit(f, Z[0])
+
+    subset = family[family.column('R1') > .15]
+    assert subset.ids == ['cell-2', 'cell-3']
+    assert np.allclose(subset.parameters_, family.parameters_[1:])
+
+    # one shared initial guess is broadcast (and stored once)
+    shared = CircuitFamily(circuit, guess, constants={'CPE1_1': .9},
+                           parameters=family.parameters_)
+    assert shared.initial_guess.shape == (3, 3)
+    assert shared.initial_guess.strides[0] == 0
+    with pytest.raises(ValueError):
+        CircuitFamily(circuit, guess)
+    with pytest.raises(ValueError):
+        CircuitFamily(circuit, guess[:2], constants={'CPE1_1': .9})
+
+    # with the elements of its own registry
+    registry = ElementRegistry.default().derive()
+
+    @registry.element(num_params=2, units=['Ohm', 's'])
+    def TauRC(p, f):
+        """ parallel RC with a time constant """
+        omega = 2 * np.pi * np.array(f)
+        return p[0] / (1 + 1j * omega * p[1])
+
+    tau = CircuitFamily('R0-TauRC1', [[.01, .1, 1], [.02, .2, 2]],
+                        elements=registry)
+    assert tau.get_param_names() == \
+        (['R0', 'TauRC1_0', 'TauRC1_1'], ['Ohm', 'Ohm', 's'])
+    assert tau[1].get_param_names() == tau.get_param_names()
@@ -0,0 +1,109 @@
+import csv
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from impedance.cli import main
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits.checkpoint import read_results
+from impedance.models.circuits.simulation import load_spectra
+from impedance.preprocessing import ignoreBelowX, readCSV
+from impedance.validation import linKK
+
+data = os.path.join(os.path.dirname(__file__), '../../data')
+circuit = 'R0-p(R1,CPE1)-p(R2,CPE2)'
+guess = [.01, .005, .1, .9, .005, .1, .9]
+
+
+@pytest.fixture
+def files(tmp_path):
+    for name in ['a.csv', 'b.csv']:
+        shutil.copy(os.path.join(data, 'exampleData.csv'), tmp_path / name)
+    (tmp_path / 'broken.csv').write_text('not a spectrum\n')
+    return tmp_path
+
+
+def test_validate(files, capsys):
+    output = str(files / 'linkk.csv')
+    assert main(['validate', str(files / '*.csv'), '-j', '2', '-o', output,
+                 '--ignore-below-x']) == 1
+    with open(output) as f:
+        rows = list(csv.DictReader(f))
+    assert [os.path.basename(row['file']) for row in rows] == \
+        ['a.csv', 'b.csv', 'broken.csv']
+
+    f, Z = ignoreBelowX(*readCSV(os.path.join(data, 'exampleData.csv')))
+    M, mu, _, _, _ = linKK(f, Z)
+    assert int(rows[0]['M']) == M and float(rows[0]['mu']) == mu
+    assert rows[2]['error']
+    assert '3 spectra' in capsys.readouterr().err
+
+
+def test_fit(files, tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp('fit')
+    (files / 'broken.csv').unlink()
+    output = str(tmp_path / 'fits.jsonl')
+    args = ['fit', str(files / '*.csv'), '-c', circuit, '-g'] + \
+        [str(x) for x in guess] + ['-o', output, '--ignore-below-x', '-q']
+    assert main(args) == 0
+
+    f, Z = ignoreBelowX(*readCSV(os.path.join(data, 'exampleData.csv')))
+    model = CustomCircuit(circuit, initial_guess=guess).fit(f, Z)
+    results = read_results(output)
+    assert [os.path.basename(i) for i in results['id']] == ['a.csv', 'b.csv']
+    assert np.allclose(results['parameters'], model.parameters_)
+
+    # a saved model gives the initial guess, and fits are not repeated
+    model.save(str(tmp_path / 'model.json'))
+    assert main(['fit', str(files), '-m', str(tmp_path / 'model.json'),
+                 '-o', str(tmp_path / 'refit.jsonl'), '-q']) == 0
+    assert main(args) == 0
+    assert len(read_results(output)['id']) == 2
+
+    # other files are only replaced with --overwrite
+    args[args.index(output)] = str(tmp_path / 'model.json')
+    with pytest.raises(SystemExit, match='--overwrite'):
+        main(args)
+    assert main(args + ['--overwrite']) == 0
+    assert len(read_results(str(tmp_path / 'model.json'))['id']) == 2
+
+
+def test_simulate(tmp_path):
+    output = str(tmp_path / 'spectra')
+    assert main(['simulate', '-c', 'R0-p(R1,C1)', '-g', '.01', '.1', '1',
+                 '-n', '25', '--chunk-size', '10', '--seed', '0', '-o',
+                 output, '-q']) == 0
+    chunks = list(load_spectra(output))
+    assert [len(parameters) for _, parameters, _ in chunks] == [10, 10, 5]
+
+    # bad models and options are reported without a traceback
+    with pytest.raises(SystemExit, match='impedance: The number of initial'):
+        main(['simulate', '-c', 'R0-p(R1,C1)', '-g', '.01', '.1', '-n',
+              '5', '-o', output])
+    with pytest.raises(SystemExit, match='impedance: cannot load'):
+        main(['simulate', '-m', str(tmp_path / 'missing.json'), '-n', '5',
+              '-o', output])
+    with pytest.raises(SystemExit) as error:
+        main(['simulate', '-c', 'R0', '-g', '1', '-n', '5', '-j', '2',
+              '-o', output])
+    assert error.value.code == 2
+
+    with pytest.raises(SystemExit):
+        main(['simulate', '-c', 'R0-p(R1,C1)', '-n', '1', '-o', output])
+
+
+def test_fit_manifest(files, tmp_path_factory, capsys):
+    tmp_path = tmp_path_factory.mktemp('manifest')
+    args = ['fit', str(files / '*.csv'), '-c', circuit, '-g'] + \
+        [str(x) for x in guess] + ['-o', str(tmp_path / 'fits.jsonl'),
+                                   '--manifest', str(tmp_path / 'manifest')]
+    assert main(args) == 1
+    assert '3 files read, 2 fit' in capsys.readouterr().err
+    assert main(args) == 1
+    assert '0 files read, 0 fit, 2 unchanged' in capsys.readouterr().err
+
+    results = read_results(str(tmp_path / 'fits.jsonl'))
+    assert len(results['id']) == 3
+    assert results['converged'][:2].all() and results['error'][2]
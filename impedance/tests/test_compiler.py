@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from impedance.models.circuits.compiler import CompiledCircuit, Constant, \
+    Element, Parallel, Series, split_circuit
+from impedance.models.circuits.elements import circuit_elements
+from impedance.models.circuits.fitting import buildCircuit
+
+
+def test_split_circuit():
+    assert split_circuit('R0-p(R1,C1)-W1', '-') == ['R0', 'p(R1,C1)', 'W1']
+    assert split_circuit('R1-p(R2,C2),C1', ',') == ['R1-p(R2,C2)', 'C1']
+
+
+def test_CompiledCircuit():
+    frequencies = np.logspace(4, -2, 15)
+    circuit = 'R0-p(R1,CPE1)-p(R2-Wo1,C2)-T1'
+    constants = {'R0': 0.1, 'CPE1_1': 0.9}
+    params = [.01, 5, .05, 100, 1, .01, 1, 2, 50, 100]
+
+    model = CompiledCircuit(circuit, constants)
+    assert model.num_params == len(params)
+    assert model.param_names[:3] == ['R1', 'CPE1_0', 'R2']
+
+    # matches the string based evaluation
+    Z = model(frequencies, params)
+    Z_eval = eval(buildCircuit(circuit, frequencies, *params,
+                               constants=constants, eval_string='',
+                               index=0)[0], {}, circuit_elements)
+    assert np.allclose(Z, Z_eval)
+
+    # batches of parameters evaluate row by row
+    batch = np.array([params, np.array(params) * 1.1])
+    Z_batch = model(frequencies, batch)
+    assert Z_batch.shape == (2, len(frequencies))
+    assert np.allclose(Z_batch[1], model(frequencies, batch[1]))
+
+    with pytest.raises(ValueError):
+        model(frequencies, params[:-1])
+
+    with pytest.raises(ValueError):
+        CompiledCircuit('R0-X1')
+
+
+def test_simplify():
+    frequencies = np.logspace(4, -2, 15)
+
+    # single branch groups are removed and nested series are flattened
+    model = CompiledCircuit('R0-p(R1-p(C1))-p(R2,p(C2,CPE2))')
+    assert isinstance(model.tree, Series)
+    assert [type(node) for node in model.tree.children] == \
+        [Element, Element, Element, Parallel]
+    assert len(model.tree.children[3].children) == 3
+
+    # branches without free parameters are folded into one constant
+    constants = {'R0': 0.1, 'R1': 0.5, 'CPE2_0': 1e-3, 'CPE2_1': 0.9}
+    model = CompiledCircuit('R0-p(R2,C2,CPE2)-R1-Wo1', constants)
+    assert len(model.tree.children) == 3
+    assert isinstance(model.tree.children[0], Constant)
+    assert isinstance(model.tree.children[1].children[2], Constant)
+    assert model.param_names == ['R2', 'C2', 'Wo1_0', 'Wo1_1']
+
+    for circuit in ['R0-p(R1-p(C1))-p(R2,p(C2,CPE2))',
+                    'R0-p(R2,C2,CPE2)-R1-Wo1']:
+        simplified = CompiledCircuit(circuit, constants)
+        reference = CompiledCircuit(circuit, constants, simplify=False)
+        params = np.linspace(0.5, 0.9, simplified.num_params)
+        for f in [frequencies, frequencies[::2], frequencies]:
+            assert np.allclose(simplified(f, params), reference(f, params))
+        assert np.allclose(simplified(frequencies, [params, params / 2]),
+                           reference(frequencies, [params, params / 2]))
+
+    # circuits without any free parameters
+    model = CompiledCircuit('R0-p(R1,C1)', {'R0': 1, 'R1': 2, 'C1': 3})
+    assert isinstance(model.tree, Constant)
+    assert model(frequencies, []).shape == frequencies.shape
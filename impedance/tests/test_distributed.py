@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import socketserver
+import threading
+
+import numpy as np
+
+from impedance.distributed import Coordinator, WorkQueue, fit_shard, work
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits.fitting import circuit_fit
+from impedance.models.circuits.simulation import load_spectra, \
+    save_spectra, simulate_spectra
+
+circuit = CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, .1, 1])
+f, _, Z = next(simulate_spectra(circuit, 7, seed=0))
+
+
+def check_results(results, spectra):
+    assert results['parameters'].shape == (len(spectra), 3)
+    for i, (frequencies, impedances) in enumerate(spectra):
+        popt, _ = circuit_fit(frequencies, impedances, circuit.circuit,
+                              circuit.initial_guess)
+        assert np.allclose(results['parameters'][i], popt)
+    assert results['converged'].all()
+    assert (results['error'] == '').all()
+
+
+def test_WorkQueue_processes(tmp_path):
+    save_spectra(simulate_spectra(circuit, 7, chunk_size=4, seed=0),
+                 str(tmp_path / 'store'))
+    queue = WorkQueue.create(str(tmp_path / 'queue'), circuit,
+                             str(tmp_path / 'store'), shard_size=2)
+    assert queue.job['n_spectra'] == 7
+    assert queue.status() == {'pending': 4, 'running': 0, 'results': 0,
+                              'failed': 0}
+
+    # workers are processes sharing the queue's directory
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=work, args=(queue.directory,))
+               for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    results = Coordinator(queue, timeout=30).wait(poll=.1)
+    for worker in workers:
+        worker.join()
+    spectra = [(frequencies, spectrum) for frequencies, _, impedances
+               in load_spectra(str(tmp_path / 'store'))
+               for spectrum in impedances]
+    check_results(results, spectra)
+
+
+def test_WorkQueue_retries(tmp_path):
+    spectra = [(f, Z[0]), (f, Z[1]), (f[:3], Z[2])]
+    queue = WorkQueue.create(str(tmp_path), circuit, spectra, shard_size=1,
+                             max_retries=1)
+
+    # a worker that dies without heartbeats loses its shard
+    name, index, _ = queue.claim('dead')
+    assert queue.requeue_stale(timeout=0) == [name]
+    assert queue.status()['pending'] == 3
+
+    # and is given up after max_retries retries
+    name, index, _ = queue.claim('flaky')
+    assert index.tolist() == [0] and name.startswith('shard_00000.a1')
+    queue.fail(name, 'worker crashed')
+    assert queue.status()['failed'] == 1
+
+    assert work(queue, 'healthy') == 2
+    results = queue.results()
+    assert results['error'][0] == 'shard failed: worker crashed'
+    assert np.isnan(results['parameters'][0]).all()
+    assert np.allclose(results['parameters'][1],
+                       circuit_fit(f, Z[1], circuit.circuit,
+                                   circuit.initial_guess)[0])
+    # errors of single spectra do not fail their shard
+    assert 'ValueError' in results['error'][2]
+
+    # shards that waited long in pending/ are not stale once claimed
+    queue = WorkQueue.create(str(tmp_path / 'slow'), circuit, spectra[:1])
+    pending = os.path.join(queue.directory, 'pending', 'shard_00000.a0.npz')
+    os.utime(pending, (0, 0))
+    name, index, shard = queue.claim('slow')
+    assert queue.requeue_stale(timeout=60) == []
+
+    # and the results of a worker whose shard was requeued are discarded
+    assert queue.requeue_stale(timeout=0) == [name]
+    assert not queue.complete(name, fit_shard(queue.job, index, shard))
+    assert queue.status() == {'pending': 1, 'running': 0, 'results': 0,
+                              'failed': 0}
+
+    # circuits with jit=True are fit with numba-compiled circuits
+    compiled = CustomCircuit(circuit.circuit, jit=True,
+                             initial_guess=circuit.initial_guess)
+    queue = WorkQueue.create(str(tmp_path / 'jit'), compiled, spectra[:1])
+    assert queue.job['kwargs'] == {'jit': True}
+
+
+def test_Coordinator_tcp(tmp_path):
+    spectra = list(zip([f] * len(Z), Z))
+    queue = WorkQueue.create(str(tmp_path), circuit, spectra, shard_size=3)
+    with Coordinator(queue, address=('127.0.0.1', 0)) as coordinator:
+        counts = []
+
+        def worker():
+            counts.append(work(coordinator.address, heartbeat=.1))
+
+        workers = [threading.Thread(target=worker) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        results = coordinator.wait(poll=.1)
+        for worker in workers:
+            worker.join()
+    assert sum(counts) == 3
+    check_results(results, spectra)
+    assert not socketserver.ThreadingTCPServer.allow_reuse_address
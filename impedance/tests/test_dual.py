@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+from scipy import special
+
+from impedance.models.circuits.batch import batch_circuit_fit
+from impedance.models.circuits.compiler import CompiledCircuit
+from impedance.models.circuits.dual import DualArray, seed
+from impedance.models.circuits.elements import ElementRegistry, element
+from impedance.models.circuits.fitting import circuit_fit, wrapCircuit
+
+
+def add_custom_elements():
+    @element(num_params=2, units=['Ohm', 's'], overwrite=True)
+    def DualRC(p, f):
+        """ parallel RC written with plain numpy operations """
+        omega = 2 * np.pi * np.array(f)
+        return p[0] / (1 + 1j * omega * p[1])
+
+    @element(num_params=1, units=['Ohm'], overwrite=True)
+    def ListR(p, f):
+        """ builds its output as a list, which dual numbers cannot track """
+        return np.array(len(f) * [p[0]])
+
+
+def finite_differences(model, frequencies, params, h=1e-6):
+    params = np.array(params, dtype=float)
+    J = []
+    for j in range(len(params)):
+        step = h * max(1, abs(params[j])) * np.eye(len(params))[j]
+        J.append((model(frequencies, params + step) -
+                  model(frequencies, params - step)) / (2 * step[j]))
+    return np.stack(J, axis=-1)
+
+
+def test_DualArray():
+    x = seed([2.0, 3.0])
+    y = np.exp(x[0]) * x[1]**2 / (1 + 1j * x[0])
+    assert isinstance(y, DualArray)
+
+    def func(a, b):
+        return np.exp(a) * b**2 / (1 + 1j * a)
+
+    h = 1e-7
+    assert np.isclose(y.value, func(2, 3))
+    assert np.isclose(y.tangent[0], (func(2 + h, 3) - func(2 - h, 3)) / 2 / h)
+    assert np.isclose(y.tangent[1], (func(2, 3 + h) - func(2, 3 - h)) / 2 / h)
+
+
+def test_jacobian_elements():
+    frequencies = np.logspace(5, -2, 20)
+    circuit = 'R0-p(R1,CPE1)-p(R2-Wo1,C2)-T1-La1-W1-Ws1-G1-Gs1-K1-' + \
+        'Zarc1-TLMQ1-L1'
+    model = CompiledCircuit(circuit)
+    params = np.array([0.9 if name.endswith('_1') else 1.5
+                       for name in model.param_names])
+
+    Z, J = model.jacobian(frequencies, params)
+    assert J.shape == (len(frequencies), model.num_params)
+    assert np.allclose(Z, model(frequencies, params))
+    J_fd = finite_differences(model, frequencies, params)
+    assert np.allclose(J, J_fd, rtol=1e-5, atol=1e-8 * np.abs(J).max())
+
+    # batches of parameters
+    batch = np.array([params, params * 0.9])
+    _, J_batch = model.jacobian(frequencies, batch)
+    assert J_batch.shape == (2, len(frequencies), model.num_params)
+    assert np.allclose(J_batch[1], model.jacobian(frequencies, batch[1])[1])
+
+
+def test_jacobian_custom_element():
+    add_custom_elements()
+    frequencies = np.logspace(4, -2, 15)
+    model = CompiledCircuit('R0-DualRC1')
+    params = [0.1, 2, 0.5]
+    _, J = model.jacobian(frequencies, params)
+    assert np.allclose(J, finite_differences(model, frequencies, params))
+
+    with pytest.raises(TypeError):
+        CompiledCircuit('R0-ListR1').jacobian(frequencies, [0.1, 1])
+
+
+def test_circuit_fit_dual():
+    frequencies = np.logspace(5, -2, 60)
+    circuit = 'R0-p(R1,CPE1)-p(R2-Wo1,C2)'
+    params = np.array([.01, .05, 1e-3, .85, .1, .05, 10, 1])
+    Z_stacked = wrapCircuit(circuit, {})(frequencies, *params)
+    Z = Z_stacked[:60] + 1j * Z_stacked[60:]
+    Z *= 1 + 0.005 * np.random.default_rng(0).standard_normal(60)
+    initial_guess = params * 1.3
+    initial_guess[3] = 0.8
+
+    popt, perror = circuit_fit(frequencies, Z, circuit, initial_guess)
+    popt_dual, perror_dual = circuit_fit(frequencies, Z, circuit,
+                                         initial_guess, jac='dual')
+    assert np.allclose(popt_dual, popt, rtol=1e-4)
+    assert np.allclose(perror_dual, perror, rtol=1e-2)
+
+    x, _, converged = batch_circuit_fit(frequencies, np.array([Z, Z]),
+                                        circuit, initial_guess, jac='dual')
+    assert converged.all()
+    assert np.allclose(x, popt, rtol=1e-4)
+
+    # elements without dual number support fall back to finite differences
+    add_custom_elements()
+    with pytest.warns(UserWarning):
+        circuit_fit(frequencies, Z, 'R0-ListR1', [0.1, 1], jac='dual')
+
+    # including those that fail with other errors than TypeError
+    registry = ElementRegistry.default().derive()
+
+    @registry.element(num_params=1, units=['Ohm'])
+    def ConjR(p, f):
+        """ calls an array method that dual numbers do not have """
+        return p[0].conj() * np.ones(len(f))
+
+    @registry.element(num_params=1, units=['Ohm'])
+    def ErfR(p, f):
+        """ calls a scipy.special function on a parameter """
+        return special.erf(p[0]) * np.ones(len(f))
+
+    for name in ['ConjR', 'ErfR']:
+        with pytest.raises(TypeError, match='cannot be evaluated on dual'):
+            CompiledCircuit(f'R0-{name}1', elements=registry).jacobian(
+                frequencies, [0.1, 1])
+        with pytest.warns(UserWarning, match='finite differences'):
+            circuit_fit(frequencies, Z, f'R0-{name}1', [0.1, 1],
+                        jac='dual', elements=registry)
+        with pytest.warns(UserWarning, match='finite differences'):
+            batch_circuit_fit(frequencies, np.array([Z, Z]), f'R0-{name}1',
+                              [0.1, 1], jac='dual', elements=registry)
@@ -1,12 +1,14 @@
 from impedance.preprocessing import ignoreBelowX
 from impedance.models.circuits.fitting import buildCircuit, \
     circuit_fit, rmse, extract_circuit_elements, \
-    set_default_bounds
+    set_default_bounds, decimate_frequencies, wrapCircuit, \
+    register_fit_hook, unregister_fit_hook
 from impedance.tests.test_preprocessing import frequencies \
     as example_frequencies
 from impedance.tests.test_preprocessing import Z_correct
 
 import numpy as np
+import pytest
 
 
 def test_set_default_bounds():
@@ -144,6 +146,204 @@ def test_circuit_fit():
                        results_global, rtol=1e-1)
 
 
+def test_circuit_fit_coarse_to_fine():
+    circuit = 'R0-p(R1,C1)-p(R2-Wo1,C2)'
+    frequencies = np.logspace(5, -2, 400)
+    true = [1.65e-2, 8.68e-3, 3.32, 5.39e-3, 6.31e-2, 2.33e2, 2.20e-1]
+    initial_guess = [.01, .01, 100, .01, .05, 100, 1]
+
+    Z_stacked = wrapCircuit(circuit, {})(frequencies, *true)
+    Z = Z_stacked[:400] + 1j * Z_stacked[400:]
+
+    p_full, _ = circuit_fit(frequencies, Z, circuit, initial_guess)
+    for coarse_to_fine in [True, 25, [20, 100]]:
+        p_coarse, _ = circuit_fit(frequencies, Z, circuit, initial_guess,
+                                  coarse_to_fine=coarse_to_fine)
+        assert np.allclose(p_coarse, p_full, rtol=1e-3)
+
+    sigma = np.hstack([np.abs(Z), np.abs(Z)])
+    p_coarse, _ = circuit_fit(frequencies, Z, circuit, initial_guess,
+                              sigma=sigma, coarse_to_fine=True)
+    assert np.allclose(p_coarse, true, rtol=1e-3)
+
+    # the callback only sees costs on all of the data
+    calls = []
+    circuit_fit(frequencies, Z, circuit, initial_guess, coarse_to_fine=25,
+                iteration_callback=lambda p, cost: calls.append((p, cost)))
+    assert np.all(np.diff([cost for _, cost in calls]) < 0)
+    for p, cost in calls:
+        residuals = wrapCircuit(circuit, {})(frequencies, *p) - Z_stacked
+        assert np.isclose(cost, 0.5 * np.sum(residuals**2))
+
+
+def test_circuit_fit_time_budget():
+    circuit = 'R0-p(R1,C1)-p(R2-Wo1,C2)'
+    frequencies = np.logspace(5, -2, 100)
+    true = [1.65e-2, 8.68e-3, 3.32, 5.39e-3, 6.31e-2, 2.33e2, 2.20e-1]
+    initial_guess = [.01, .01, 100, .01, .05, 100, 1]
+
+    Z_stacked = wrapCircuit(circuit, {})(frequencies, *true)
+    Z = Z_stacked[:100] + 1j * Z_stacked[100:]
+
+    p, _, info = circuit_fit(frequencies, Z, circuit, initial_guess,
+                             full_output=True)
+    assert info.converged
+    assert info.cost < 1e-15
+    assert info.nfev > 0
+
+    # a spent budget returns the best parameters evaluated so far
+    for global_opt in [False, True]:
+        p, perror, info = circuit_fit(frequencies, Z, circuit,
+                                      initial_guess, time_budget=0,
+                                      global_opt=global_opt,
+                                      full_output=True)
+        assert not info.converged
+        assert info.nfev == 1
+        assert np.allclose(p, initial_guess)
+        assert np.isnan(perror).all()
+
+    with pytest.warns(UserWarning, match='time_budget'):
+        circuit_fit(frequencies, Z, circuit, initial_guess, time_budget=0,
+                    coarse_to_fine=True)
+
+    # the callback sees decreasing costs and can stop the fit
+    costs = []
+
+    def callback(parameters, cost):
+        costs.append(cost)
+        return cost < 1e-4
+
+    p, _, info = circuit_fit(frequencies, Z, circuit, initial_guess,
+                             iteration_callback=callback, full_output=True)
+    assert not info.converged
+    assert info.message == 'stopped by iteration_callback'
+    assert np.all(np.diff(costs) < 0)
+    assert np.isclose(info.cost, costs[-1])
+
+    # stop is checked after every evaluation, improving or not
+    for options in [{}, {'global_opt': True}, {'jac': 'dual'}]:
+        calls = []
+
+        def stop():
+            calls.append(1)
+            return len(calls) == 30
+
+        p, perror, info = circuit_fit(frequencies, Z, circuit,
+                                      initial_guess, stop=stop,
+                                      full_output=True, **options)
+        assert not info.converged
+        assert info.message == 'stopped'
+        assert info.nfev + info.njev == 30
+        assert np.isnan(perror).all()
+
+
+def test_circuit_fit_result():
+    circuit = 'R0-p(R1,C1)-p(R2-Wo1,C2)'
+    frequencies = np.logspace(5, -2, 100)
+    true = [1.65e-2, 8.68e-3, 3.32, 5.39e-3, 6.31e-2, 2.33e2, 2.20e-1]
+    initial_guess = [.01, .01, 100, .01, .05, 100, 1]
+
+    Z_stacked = wrapCircuit(circuit, {})(frequencies, *true)
+    Z = Z_stacked[:100] + 1j * Z_stacked[100:]
+
+    results = []
+    hook = register_fit_hook(results.append)
+    try:
+        p, perror = circuit_fit(frequencies, Z, circuit, initial_guess)
+        _, _, info = circuit_fit(frequencies, Z, circuit, initial_guess,
+                                 jac='dual', coarse_to_fine=True,
+                                 record_history=True, full_output=True)
+    finally:
+        unregister_fit_hook(hook)
+    circuit_fit(frequencies, Z, circuit, initial_guess)
+    assert len(results) == 2
+
+    result = results[0]
+    assert result.circuit == circuit and result.method == 'curve_fit'
+    assert np.allclose(result.parameters, p)
+    assert np.allclose(result['perror'], perror)
+    assert result.n_data == 200
+    assert result.njev == 0 and result.nit is None
+    assert result.cost_history is None
+    assert set(result.timings) == {'setup', 'optimize', 'covariance',
+                                   'total'}
+    assert result.timings['total'] >= result.timings['optimize'] > 0
+
+    # coarse-to-fine stages count towards the totals
+    assert results[1] is info
+    assert info.njev > 0 and info.nit == info.njev
+    assert 0 < len(info.cost_history) < info.nfev
+    assert np.isclose(info.cost_history.min(), info.cost)
+
+    assert result.converged and not result.stopped
+    assert result.status in [1, 2, 3, 4]
+    assert 'termination condition' in result.message
+    assert result.minimization_failures is None
+
+    # running out of evaluations keeps the best parameters found
+    with pytest.warns(UserWarning, match='did not converge'):
+        p, perror = circuit_fit(frequencies, Z, circuit, initial_guess,
+                                maxfev=5)
+    _, _, info = circuit_fit(frequencies, Z, circuit, initial_guess,
+                             maxfev=5, full_output=True)
+    assert not info.converged and not info.stopped
+    assert 'maximum number of function evaluations' in info.message
+    assert np.allclose(p, info.parameters) and np.isnan(perror).all()
+    assert info.cost < 0.5 * np.sum(
+        (wrapCircuit(circuit, {})(frequencies, *initial_guess) -
+         Z_stacked)**2)
+
+    # global fits report the lowest local minimization
+    _, _, info = circuit_fit(frequencies, Z, circuit, initial_guess,
+                             global_opt=True, niter=2, full_output=True)
+    assert info.converged and info.status == 0
+    assert info.minimization_failures == 0
+    _, _, info = circuit_fit(frequencies, Z, circuit, initial_guess,
+                             global_opt=True, niter=2, full_output=True,
+                             minimizer_kwargs={'options': {'maxiter': 1}})
+    assert not info.converged and not info.stopped
+    assert info.minimization_failures == 3
+
+    # a covariance matrix sigma whitens the residuals, as in curve_fit
+    Z_noisy = Z * (1 + 0.01 * np.random.default_rng(0).standard_normal(100))
+    sigma = np.hstack([np.abs(Z), np.abs(Z)])
+    covariance = np.diag(sigma**2) + 1e-6
+    p_1d, _, info_1d = circuit_fit(frequencies, Z_noisy, circuit,
+                                   initial_guess, sigma=sigma,
+                                   full_output=True)
+    for coarse_to_fine in [False, 25]:
+        p_2d, _, info_2d = circuit_fit(frequencies, Z_noisy, circuit,
+                                       initial_guess, sigma=covariance,
+                                       coarse_to_fine=coarse_to_fine,
+                                       full_output=True)
+        residuals = wrapCircuit(circuit, {})(frequencies, *p_2d) - \
+            np.hstack([Z_noisy.real, Z_noisy.imag])
+        whitened = np.linalg.solve(np.linalg.cholesky(covariance), residuals)
+        assert np.isclose(info_2d.cost, 0.5 * np.sum(whitened**2))
+        assert np.isclose(info_2d.cost, info_1d.cost, rtol=1e-2)
+        assert np.allclose(p_2d, p_1d, rtol=1e-2)
+
+    # hooks that fail only warn
+    def broken(result):
+        raise RuntimeError('metrics are down')
+
+    register_fit_hook(broken)
+    try:
+        with pytest.warns(UserWarning, match='metrics are down'):
+            circuit_fit(frequencies, Z, circuit, initial_guess)
+    finally:
+        unregister_fit_hook(broken)
+
+
+def test_decimate_frequencies():
+    frequencies = np.logspace(5, -2, 71)
+    subset = decimate_frequencies(frequencies, 8)
+    assert len(subset) == 8
+    assert np.allclose(np.diff(np.log10(frequencies[subset])), -1)
+
+    assert len(decimate_frequencies(frequencies, 100)) == 71
+
+
 def test_buildCircuit():
 
     # Test simple Randles circuit with CPE
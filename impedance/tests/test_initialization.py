@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits.compiler import CompiledCircuit
+from impedance.models.circuits.fitting import set_default_bounds
+from impedance.models.circuits.initialization import estimate_initial_guess
+
+
+def test_estimate_initial_guess():
+    circuit = 'R0-p(R1,C1)-p(R2,CPE1)-W1'
+    frequencies = np.logspace(5, -2, 50)
+    true = np.array([.01, .05, 1e-4, .1, 1, .85, .01])
+    Z = CompiledCircuit(circuit)(frequencies, true)
+
+    for method in ['peaks', 'linKK']:
+        guess = estimate_initial_guess(frequencies, Z, circuit, method=method)
+        lb, ub = set_default_bounds(circuit)
+        assert guess.shape == true.shape
+        assert np.all(guess >= lb) and np.all(guess <= ub)
+
+        # resistances and capacitances within an order of magnitude
+        assert np.allclose(np.log10(guess[:3]), np.log10(true[:3]), atol=1)
+
+        # fitting from the estimate recovers the true parameters
+        model = CustomCircuit(circuit, initial_guess=list(guess))
+        model.fit(frequencies, Z)
+        assert np.allclose(model.parameters_, true, rtol=1e-3)
+
+    # batches of spectra, with a constant
+    batch = np.vstack([Z, 2 * Z])
+    guess = estimate_initial_guess(frequencies, batch, circuit,
+                                   constants={'W1': .01})
+    assert guess.shape == (2, len(true) - 1)
+    assert np.allclose(guess[1, :2], 2 * guess[0, :2])
+
+    with pytest.raises(ValueError):
+        estimate_initial_guess(frequencies, Z, circuit, method='other')
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits import jit
+from impedance.models.circuits.compiler import CompiledCircuit
+from impedance.models.circuits.elements import ElementRegistry
+from impedance.models.circuits.jit import JITCircuit
+
+pytestmark = pytest.mark.filterwarnings('ignore:numba is not installed')
+
+
+def test_JITCircuit():
+    frequencies = np.logspace(5, -2, 30)
+    circuit = 'R0-p(R1,CPE1)-p(R2-Wo1,C2)-T1-La1-W1-Ws1-G1-Gs1-K1-' + \
+        'Zarc1-TLMQ1-L1'
+    constants = {'R0': 0.1, 'T1_2': 1}
+    model = JITCircuit(circuit, constants)
+    assert model.compiled == jit.HAS_NUMBA
+
+    reference = CompiledCircuit(circuit, constants)
+    assert model.param_names == reference.param_names
+    params = np.array([0.9 if name.endswith('_1') else 1.5
+                       for name in model.param_names])
+    assert np.allclose(model(frequencies, params),
+                       reference(frequencies, params))
+
+    batch = np.array([params, params * 0.9, params * 0.8])
+    assert np.allclose(model(frequencies, batch),
+                       reference(frequencies, batch))
+
+    with pytest.raises(ValueError):
+        model(frequencies, params[:-1])
+
+
+def test_JITCircuit_custom_elements():
+    registry = ElementRegistry.default().derive()
+
+    @registry.element(num_params=2, units=['Ohm', 's'])
+    def ScalarRC(p, f):
+        """ parallel RC that numba can compile """
+        return p[0] / (1 + 2j * np.pi * f * p[1])
+
+    @registry.element(num_params=2, units=['Ohm', 's'])
+    def ArrayRC(p, f):
+        """ parallel RC that numba cannot compile (np.array of an array) """
+        omega = 2 * np.pi * np.array(f)
+        return p[0] / (1 + 1j * omega * p[1])
+
+    frequencies = np.logspace(5, -2, 30)
+    circuit = 'R0-ScalarRC1-p(ArrayRC1,C1)'
+    params = np.array([0.1, 1, 1e-3, 2, 1e-2, 5])
+    model = JITCircuit(circuit, elements=registry)
+    reference = CompiledCircuit(circuit, elements=registry)
+    assert np.allclose(model(frequencies, params),
+                       reference(frequencies, params))
+    assert np.allclose(model(frequencies, [params, params * 2]),
+                       reference(frequencies, [params, params * 2]))
+
+
+def test_JITCircuit_without_numba(monkeypatch):
+    monkeypatch.setattr(jit, 'HAS_NUMBA', False)
+    with pytest.warns(UserWarning, match='numba is not installed'):
+        model = JITCircuit('R0-p(R1,C1)')
+    assert not model.compiled
+
+    frequencies = np.logspace(3, -2, 10)
+    assert np.allclose(model(frequencies, [0.1, 1, 1e-3]),
+                       CompiledCircuit('R0-p(R1,C1)')(frequencies,
+                                                      [0.1, 1, 1e-3]))
+
+
+def test_CustomCircuit_jit():
+    frequencies = np.logspace(5, -2, 50)
+    circuit = 'R0-p(R1,CPE1)-Wo1'
+    params = [0.01, 0.05, 1e-3, 0.85, 0.1, 10]
+    Z = CustomCircuit(circuit, initial_guess=params).predict(frequencies)
+
+    initial_guess = [0.02, 0.1, 2e-3, 0.8, 0.2, 5]
+    default = CustomCircuit(circuit, initial_guess=initial_guess)
+    compiled = CustomCircuit(circuit, initial_guess=initial_guess, jit=True)
+    default.fit(frequencies, Z)
+    compiled.fit(frequencies, Z)
+
+    assert np.allclose(compiled.parameters_, default.parameters_)
+    assert np.allclose(compiled.predict(frequencies),
+                       default.predict(frequencies))
@@ -0,0 +1,66 @@
+import os
+import shutil
+
+import numpy as np
+
+import impedance.manifest
+from impedance.manifest import Manifest, incremental_fit
+from impedance.models.circuits import CustomCircuit
+from impedance.preprocessing import readCSV, saveCSV
+
+data = os.path.join(os.path.dirname(__file__), '../../data')
+circuit = CustomCircuit('R0-p(R1,CPE1)-p(R2,CPE2)',
+                        initial_guess=[.01, .005, .1, .9, .005, .1, .9])
+
+
+def test_incremental_fit(tmp_path, monkeypatch):
+    files = [str(tmp_path / f'{i}.csv') for i in range(3)]
+    for path in files:
+        shutil.copy(os.path.join(data, 'exampleData.csv'), path)
+    manifest = str(tmp_path / 'manifest')
+
+    reads = []
+
+    def readFile(filename, instrument=None):
+        reads.append(filename)
+        return readCSV(filename)
+
+    monkeypatch.setattr(impedance.manifest, 'readFile', readFile)
+
+    def run(**kwargs):
+        reads.clear()
+        return incremental_fit(circuit, files, manifest,
+                               ignore_below_x=True, **kwargs)
+
+    results, counts = run()
+    assert counts == {'read': 3, 'fit': 3, 'reused': 0, 'removed': 0}
+    f, Z = readCSV(files[0])
+    model = CustomCircuit(circuit.circuit,
+                          initial_guess=circuit.initial_guess)
+    model.fit(f[np.imag(Z) < 0], Z[np.imag(Z) < 0])
+    assert np.allclose(results[files[0]]['parameters'], model.parameters_)
+
+    # unchanged and touched files are neither read nor fit
+    os.utime(files[1], ns=(0, 0))
+    again, counts = run()
+    assert counts == {'read': 0, 'fit': 0, 'reused': 3, 'removed': 0}
+    assert again == results and reads == []
+
+    # changed files are read and fit, changed options refit from the cache
+    saveCSV(files[2], f, 1.1 * Z)
+    _, counts = run()
+    assert counts == {'read': 1, 'fit': 1, 'reused': 2, 'removed': 0}
+    assert reads == [files[2]]
+    _, counts = run(weight_by_modulus=True)
+    assert counts == {'read': 0, 'fit': 3, 'reused': 0, 'removed': 0}
+    assert reads == []
+
+    # removed files are dropped with their cached arrays
+    os.remove(files.pop())
+    with open(files[1], 'w') as f:
+        f.write('not a spectrum\n')
+    results, counts = run(weight_by_modulus=True)
+    assert counts == {'read': 1, 'fit': 0, 'reused': 1, 'removed': 1}
+    assert 'error' in results[files[1]]
+    assert len(os.listdir(os.path.join(manifest, 'cache'))) == 1
+    assert set(Manifest(manifest).entries) == set(files)
@@ -1,5 +1,7 @@
 import numpy as np
-from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits import CustomCircuit, load_models, \
+    save_models
+from impedance.models.circuits.fitting import _compile
 import os
 
 
@@ -31,3 +33,47 @@ def test_model_io():
 
     fitted_template = CustomCircuit()
     fitted_template.load('test_io.json', fitted_as_initial=True)
+
+
+def test_load_quiet(capsys):
+    circuit = CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, .1, 1])
+    circuit.save('./test_io.json')
+    capsys.readouterr()
+    CustomCircuit().load('./test_io.json')
+    assert capsys.readouterr().out == ''
+
+
+def test_bulk_model_io():
+    frequencies = np.logspace(5, -2, 20)
+    models = [CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, R1, 1],
+                            name=f'model {i}')
+              for i, R1 in enumerate(np.linspace(.1, 1, 50))]
+    models.append(CustomCircuit('R0-p(R1,CPE1)', initial_guess=[.01, .1, 1],
+                                constants={'CPE1_1': .9}))
+    for model in models[:10]:
+        model.parameters_ = np.array(model.initial_guess) * 2
+        model.conf_ = np.array(model.initial_guess) / 10
+    save_models(models, './test_io.jsonl')
+
+    loaded = load_models('./test_io.jsonl')
+    assert len(loaded) == len(models)
+    assert all(model is None for model in loaded._models)
+    assert loaded[-1] == models[-1]
+    assert sum(model is not None for model in loaded._models) == 1
+    assert loaded[3:6] == models[3:6]
+    assert list(loaded) == models
+    assert loaded[5] is loaded[5]
+    assert 'model 20' == loaded[20].name
+
+    fitted = load_models('./test_io.jsonl', fitted_as_initial=True)
+    assert np.allclose(fitted[0].initial_guess, models[0].parameters_)
+    assert not fitted[0]._is_fit()
+
+    # models with the same circuit share one compiled circuit
+    Z = loaded[1].predict(frequencies)
+    assert np.allclose(Z, models[1].predict(frequencies))
+    assert _compile(loaded[1].circuit, loaded[1].constants) is \
+        _compile(loaded[2].circuit, loaded[2].constants)
+    assert _compile(loaded[1].circuit, loaded[1].constants) is not \
+        _compile(loaded[-1].circuit, loaded[-1].constants)
+    os.remove('./test_io.jsonl')
@@ -0,0 +1,89 @@
+import math
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from impedance.models.circuits import CustomCircuit
+from impedance.pipeline import Pipeline, Stage, StageError, \
+    standard_pipeline
+
+data = os.path.join(os.path.dirname(__file__), '../../data')
+
+
+def test_Pipeline():
+    pipeline = Pipeline([Stage('double', lambda x: 2 * x, workers=2),
+                         Stage('sqrt', math.sqrt, workers=2, processes=True),
+                         Stage('round', round)])
+    results = dict(pipeline.run([8, -1, 2, 0.5]))
+    assert results[0] == 4 and results[2] == 2 and results[3] == 1
+
+    # errors only affect their item and skip the following stages
+    assert isinstance(results[1], StageError)
+    assert results[1].stage == 'sqrt'
+    assert isinstance(results[1].error, ValueError)
+    assert pipeline.stats['sqrt'].items == 4
+    assert pipeline.stats['sqrt'].errors == 1
+    assert pipeline.stats['round'].items == 3
+    assert 'sqrt' in pipeline.report()
+
+    with pytest.raises(StageError):
+        list(pipeline.run([1, -1, 2], errors='raise'))
+
+
+def test_Pipeline_backpressure():
+    release = threading.Event()
+    pulled = []
+
+    def items():
+        for i in range(100):
+            pulled.append(i)
+            yield i
+
+    pipeline = Pipeline([Stage('wait', lambda x: release.wait() and x)],
+                        queue_size=2)
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.extend(pipeline.run(items())))
+    thread.start()
+    time.sleep(.5)
+    # one item in the worker, two in the queue and one being put
+    assert len(pulled) <= 4
+    release.set()
+    thread.join()
+    assert sorted(i for i, _ in results) == list(range(100))
+
+
+def test_standard_pipeline(tmp_path):
+    files = []
+    for i in range(3):
+        files.append(str(tmp_path / f'{i}.csv'))
+        shutil.copy(os.path.join(data, 'exampleData.csv'), files[-1])
+    files.append(str(tmp_path / 'missing.csv'))
+
+    circuit = CustomCircuit('R0-p(R1,CPE1)-p(R2,CPE2)',
+                            initial_guess=[.01, .005, .1, .9, .005, .1, .9])
+    exported = []
+    pipeline = standard_pipeline(circuit, ignore_below_x=True,
+                                 linkk={'max_M': 10}, export=exported.append,
+                                 cpu_workers=2)
+    results = dict(pipeline.run(files))
+
+    assert results[3].stage == 'read'
+    assert len(exported) == 3
+    record = exported[0]
+    assert record['M'] <= 10
+    assert np.all(np.imag(record['impedances']) < 0)
+    model = CustomCircuit(circuit.circuit, initial_guess=circuit.initial_guess)
+    model.fit(record['frequencies'], record['impedances'])
+    assert np.allclose(record['fit'].parameters, model.parameters_)
+    assert [stage.name for stage in pipeline.stages] == \
+        ['read', 'clean', 'validate', 'fit', 'export']
+
+    compiled = CustomCircuit(circuit.circuit, jit=True,
+                             initial_guess=circuit.initial_guess)
+    pipeline = standard_pipeline(compiled)
+    assert pipeline.stages[-1].function.keywords['jit']
@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+import pytest
+
+import impedance
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits.compiler import Element
+from impedance.models.circuits.fitting import _compile_cached, circuit_fit
+
+
+def test_profile():
+    frequencies = np.logspace(5, -2, 50)
+    circuit = 'R0-p(R1,CPE1)-p(R2,C2)'
+    params = [0.01, 0.05, 1e-3, 0.85, 0.1, 0.05]
+    Z = CustomCircuit(circuit, initial_guess=params).predict(frequencies)
+    evaluate = Element.evaluate
+
+    # compiled circuits are cached, parse the circuit again in the profile
+    _compile_cached.cache_clear()
+    with impedance.profile() as prof:
+        circuit_fit(frequencies, Z, circuit,
+                    [0.02, 0.1, 2e-3, 0.8, 0.2, 0.1])
+        with pytest.raises(RuntimeError):
+            with impedance.profile():
+                pass
+
+    # the instrumentation is removed afterwards
+    assert Element.evaluate is evaluate
+
+    stats = prof.stats
+    for name in ['R0', 'R1', 'CPE1', 'R2', 'C2']:
+        assert stats['element', name]['calls'] > 1
+        assert stats['element', name]['output_bytes'] > 0
+    assert stats['element', 'R0']['calls'] == stats['phase', 'evaluate'][
+        'calls']
+    for phase in ['parse', 's', 'p', 'optimizer']:
+        assert stats['phase', phase]['time'] > 0
+    assert stats['phase', 'optimizer']['calls'] == 1
+
+    assert np.isclose(prof.total, sum(entry['time']
+                                      for entry in stats.values()))
+    assert ('phase', 'buildCircuit') not in stats
+    report = prof.report(sort='output_bytes')
+    assert report.splitlines()[0].split()[:3] == ['kind', 'name', 'calls']
+    assert len(report.splitlines()) == len(stats) + 1
+    assert 'CPE1' in str(prof)
+
+
+def test_profile_threads():
+    frequencies = np.logspace(5, -2, 50)
+    circuit = 'R0-p(R1,C1)'
+    Z = CustomCircuit(circuit, initial_guess=[.01, .1, 1e-3]).predict(
+        frequencies)
+
+    def fit():
+        circuit_fit(frequencies, Z, 'R0-p(R1,CPE1)', [.02, .2, 1e-3, .9])
+
+    # fits in other threads are not attributed to the profile
+    with impedance.profile() as prof:
+        thread = threading.Thread(target=fit)
+        thread.start()
+        thread.join()
+        circuit_fit(frequencies, Z, circuit, [.02, .2, 2e-3],
+                    global_opt=True, niter=1)
+    names = {name for kind, name in prof.stats if kind == 'element'}
+    assert names == {'R0', 'R1', 'C1'}
+    assert prof.stats['phase', 'covariance']['calls'] == 1
@@ -0,0 +1,101 @@
+import os
+import socketserver
+
+import numpy as np
+import pytest
+
+from impedance import server as server_module
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits.fitting import _compile_cached
+from impedance.server import FitClient, FitServer
+from impedance.validation import linKK
+
+circuit = 'R0-p(R1,C1)-p(R2,CPE1)'
+initial_guess = [.02, .05, 2, .2, .5, .7]
+f = np.logspace(5, -2, 50)
+Z = CustomCircuit(circuit, initial_guess=[.01, .1, 1, .1, 1, .8]) \
+    .predict(f, use_initial=True)
+
+
+@pytest.mark.parametrize('n_workers', [0, 1])
+def test_FitServer(tmp_path, n_workers):
+    address = str(tmp_path / 'impedance.sock')
+    with FitServer(address, n_workers=n_workers).start() as server:
+        assert os.path.exists(address)
+        with FitClient(server.address) as client:
+            assert client.ping()['n_workers'] == n_workers
+
+            # fits match local fits and update the model like fit()
+            remote = CustomCircuit(circuit, initial_guess=initial_guess)
+            local = CustomCircuit(circuit, initial_guess=initial_guess)
+            assert client.fit(remote, f, Z) is remote
+            local.fit(f, Z)
+            assert np.allclose(remote.parameters_, local.parameters_)
+            assert np.allclose(remote.conf_, local.conf_)
+            assert remote.converged_
+            assert remote.fit_result_.nfev == local.fit_result_.nfev
+
+            # fits in the server's threads reuse the compiled circuit
+            hits = _compile_cached.cache_info().hits
+            client.fit(remote, f, Z)
+            if n_workers == 0:
+                assert _compile_cached.cache_info().hits > hits
+
+            assert np.allclose(client.predict(remote, f),
+                               local.predict(f))
+
+            M, mu, Z_fit, res_real, res_imag = client.linKK(f, Z,
+                                                            max_M=20)
+            expected = linKK(f, Z, max_M=20)
+            assert (M, mu) == expected[:2]
+            assert np.allclose(Z_fit, expected[2])
+
+            # errors are raised in the client without closing the connection
+            with pytest.raises(RuntimeError, match='ValueError'):
+                client.fit(CustomCircuit('R0-p(R1,C1)',
+                                         initial_guess=[1, 1, 1]),
+                           f, Z, bounds=([0, 0], [1, 1]))
+            with pytest.raises(TypeError):
+                client.fit(remote, f, Z, iteration_callback=print)
+            assert client.ping()['pid'] == os.getpid()
+    assert not os.path.exists(address)
+
+
+def test_FitServer_tcp():
+    with FitServer(('127.0.0.1', 0), n_workers=0, warm_up=False).start() \
+            as server:
+        with FitClient(server.address) as client:
+            model = CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, .1, 1])
+            Z_model = client.predict(model, f, use_initial=True)
+            assert np.allclose(Z_model, model.predict(f, use_initial=True))
+
+
+def test_FitServer_socket_path(tmp_path):
+    # only a stale socket is replaced, never another file
+    path = tmp_path / 'data.csv'
+    path.write_text('1,2,3\n')
+    with pytest.raises(OSError):
+        FitServer(str(path), n_workers=0, warm_up=False)
+    assert path.read_text() == '1,2,3\n'
+
+    address = str(tmp_path / 'impedance.sock')
+    FitServer(address, n_workers=0, warm_up=False)._server.server_close()
+    assert os.path.exists(address)
+    FitServer(address, n_workers=0, warm_up=False).shutdown()
+    assert not os.path.exists(address)
+
+    # the settings of the servers do not leak into socketserver
+    FitServer(('127.0.0.1', 0), n_workers=0, warm_up=False).shutdown()
+    assert not socketserver.ThreadingTCPServer.allow_reuse_address
+    assert not socketserver.ThreadingTCPServer.daemon_threads
+    assert not socketserver.ThreadingUnixStreamServer.daemon_threads
+
+
+def test_FitServer_without_unix_sockets(monkeypatch, tmp_path):
+    monkeypatch.setattr(server_module, '_UnixServer', None)
+    address = str(tmp_path / 'impedance.sock')
+    with pytest.raises(ValueError, match='Unix sockets'):
+        FitServer(address, n_workers=0, warm_up=False)
+    with pytest.raises(ValueError, match='Unix sockets'):
+        FitClient(address)
+    assert not os.path.exists(address)
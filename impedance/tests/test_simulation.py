@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits.simulation import add_noise, load_spectra, \
+    sample_parameters, save_spectra, simulate_spectra
+from impedance.preprocessing import readCSV
+
+
+def test_sample_parameters():
+    circuit = CustomCircuit('R0-p(R1,CPE1)', initial_guess=[.01, .1, 1, .9])
+    parameters = sample_parameters(circuit, 1000, rng=0)
+    assert parameters.shape == (1000, 4)
+    guess = np.array(circuit.initial_guess)
+    assert np.all(parameters >= guess / 10)
+    assert np.all(parameters <= guess * 10)
+    # the CPE exponent stays within its bounds
+    assert np.all(parameters[:, 3] <= 1)
+
+    uniform = sample_parameters(circuit, 1000, spread=0.5,
+                                distribution='uniform', rng=0)
+    assert np.all(uniform <= guess * 10**0.5)
+    assert not np.allclose(uniform, parameters)
+
+    with pytest.raises(ValueError):
+        sample_parameters(circuit, 10, distribution='normal')
+    with pytest.raises(ValueError):
+        sample_parameters(CustomCircuit('R0'), 10)
+
+
+def test_add_noise():
+    Z = np.ones((2, 5)) * (1 - 1j)
+    assert np.allclose(add_noise(Z), Z)
+    assert np.allclose(add_noise(Z, drift=0.1)[:, -1], 1.1 * (1 - 1j))
+
+    noisy = add_noise(np.ones((2000, 100)), proportional=0.01,
+                      additive=0.02, rng=0)
+    assert np.isclose(np.std(noisy.real), np.hypot(0.01, 0.02), rtol=0.05)
+
+
+def test_simulate_spectra(tmpdir):
+    circuit = CustomCircuit('R0-p(R1,C1)', initial_guess=[.1, 1],
+                            constants={'R0': 0.01})
+    frequencies = np.logspace(3, -1, 20)
+    chunks = list(simulate_spectra(circuit, 25, frequencies, chunk_size=10,
+                                   proportional=0, seed=1))
+    assert [len(Z) for _, _, Z in chunks] == [10, 10, 5]
+    f, parameters, Z = chunks[0]
+    assert Z.shape == (10, 20)
+    for params, spectrum in zip(parameters, Z):
+        circuit.parameters_ = params
+        assert np.allclose(circuit.predict(f), spectrum)
+
+    # reproducible with a seed
+    again = next(simulate_spectra(circuit, 25, frequencies, chunk_size=10,
+                                  proportional=0, seed=1))
+    assert np.allclose(again[2], Z)
+
+    directory = str(tmpdir)
+    assert save_spectra(iter(chunks), directory) == 25
+    loaded = list(load_spectra(directory))
+    assert len(loaded) == 3
+    assert np.allclose(loaded[2][1], chunks[2][1])
+    assert np.allclose(loaded[2][2], chunks[2][2])
+
+    csv_dir = tmpdir.mkdir('csv')
+    assert save_spectra(chunks[:1], str(csv_dir), fmt='csv') == 10
+    f_csv, Z_csv = readCSV(str(csv_dir.join('spectrum_0000003.csv')))
+    assert np.allclose(f_csv, frequencies)
+    assert np.allclose(Z_csv, Z[3])
+
+    with pytest.raises(ValueError):
+        save_spectra(chunks, directory, fmt='hdf5')
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from impedance.models.circuits import CircuitFamily, CustomCircuit, \
+    ElementRegistry
+from impedance.models.circuits.batch import batch_circuit_fit
+from impedance.models.circuits.simulation import simulate_spectra
+from impedance.store import CONVERGED, FAILED, NOT_CONVERGED, ResultStore, \
+    ResultTable
+
+
+def test_ResultStore(tmp_path):
+    store = ResultStore(str(tmp_path))
+    model = CustomCircuit('R0-p(R1,CPE1)', initial_guess=[.01, .1, 1e-3],
+                          constants={'CPE1_1': .9})
+    f, _, Z = next(simulate_spectra(model, 25, seed=0))
+
+    ids = [f'cell-{i}' for i in range(len(Z))]
+    chunks = []
+    for start in range(0, 25, 10):
+        chunks.append(batch_circuit_fit(f, Z[start:start + 10],
+                                        model.circuit, model.initial_guess,
+                                        constants=model.constants))
+        popt, perror, converged = chunks[-1]
+        store.append(model, ids[start:start + 10], popt, perror,
+                     status=np.where(converged, CONVERGED, NOT_CONVERGED))
+    popt, perror, converged = (np.concatenate(c) for c in zip(*chunks))
+
+    table = store.table('R0-p(R1,CPE1)', constants={'CPE1_1': .9})
+    assert table.names == ['R0', 'R1', 'CPE1_0']
+    assert table.units == ['Ohm', 'Ohm', 'Ohm^-1 sec^a']
+    assert len(table) == 25 and table.ids() == ids
+    assert store.tables() == [table]
+
+    # columns are memory-mapped and round-trip exactly
+    R1 = table.column('R1')
+    assert isinstance(R1, np.memmap) and np.array_equal(R1, popt[:, 1])
+    assert np.array_equal(table.parameters(), popt)
+    assert np.array_equal(table.parameters(conf=True), perror)
+    assert np.array_equal(table.column('status') == CONVERGED, converged)
+    with pytest.raises(KeyError):
+        table.column('CPE1_1')
+
+    # fitted models, possibly of different circuits
+    other = CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, .1, 1])
+    fitted = CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, .1, 1])
+    fitted.fit(f, Z[0])
+    store.append_models(['a', 'b', 'c'], [fitted, other, model])
+    table = store.table(other)
+    assert table.ids() == ['a', 'b']
+    assert np.array_equal(table.parameters()[0], fitted.parameters_)
+    assert table.column('cost')[0] == fitted.fit_result_.cost
+    assert table.column('status').tolist() == [CONVERGED, FAILED]
+    assert len(store.table(model)) == 26
+    assert len(store.tables()) == 2
+
+    # constants with other values are stored in their own table
+    other = store.table('R0-p(R1,CPE1)', constants={'CPE1_1': .8})
+    assert len(other) == 0 and other.constants == {'CPE1_1': .8}
+    assert store.table(model).constants == {'CPE1_1': .9}
+    assert len(store.tables()) == 3
+
+    # the names of elements in a circuit's own registry
+    registry = ElementRegistry.default().derive()
+
+    @registry.element(num_params=2, units=['Ohm', 's'])
+    def TauRC(p, f):
+        """ parallel RC with a time constant """
+        omega = 2 * np.pi * np.array(f)
+        return p[0] / (1 + 1j * omega * p[1])
+
+    family = CircuitFamily('R0-TauRC1', [[.01, .1, 1]], elements=registry)
+    table = store.table(family)
+    assert table.names == ['R0', 'TauRC1_0', 'TauRC1_1']
+    assert table.units == ['Ohm', 'Ohm', 's']
+
+
+def test_ResultTable_interrupted_append(tmp_path):
+    table = ResultStore(str(tmp_path)).table('R0-p(R1,C1)')
+    table.append(['a', 'b'], [[1, 2, 3], [4, 5, 6]], cost=[.1, .2],
+                 status=[CONVERGED, NOT_CONVERGED])
+
+    # columns written without updating the number of rows
+    with open(table._files()['param.R0'][1], 'ab') as f:
+        f.write(np.zeros(3).tobytes())
+    with open(table.directory + '/ids.txt', 'a') as f:
+        f.write('c\nd')
+
+    table = ResultTable(table.directory)
+    assert len(table) == 2 and table.ids() == ['a', 'b']
+    table.append(['c'], [[7, 8, 9]])
+    assert table.column('R0').tolist() == [1, 4, 7]
+    assert table.ids() == ['a', 'b', 'c']
+    assert table.column('status').tolist() == [CONVERGED, NOT_CONVERGED,
+                                               CONVERGED]
+
+
+def test_ResultTable_family(tmp_path):
+    table = ResultStore(str(tmp_path)).table('R0-p(R1,C1)')
+    table.append(['a', 'b', 'c'], [[1, 2, 3], [4, 5, 6], [7, 8, 9]],
+                 conf=np.ones((3, 3)))
+    family = table.family(table.column('R0') > 2)
+    assert family.ids == ['b', 'c']
+    assert np.array_equal(family.parameters_, [[4, 5, 6], [7, 8, 9]])
+    assert family[0].name == 'b'
+    assert 'R1 = 5.00e+00' in str(family[0])
@@ -0,0 +1,99 @@
+import concurrent.futures
+
+import numpy as np
+import pytest
+
+import impedance
+from impedance.models.circuits import CustomCircuit, ElementRegistry
+from impedance.models.circuits.checkpoint import resumable_fit
+from impedance.models.circuits.simulation import simulate_spectra
+from impedance.models.circuits.streaming import iter_fit
+
+circuit = CustomCircuit('R0-p(R1,C1)', initial_guess=[.01, .1, 1])
+
+# elements of derived registries defined at module level can be pickled
+registry = ElementRegistry.default().derive()
+
+
+@registry.element(num_params=2, units=['Ohm', 'F'])
+def RCx(p, f):
+    """ parallel RC, with the time constant as its second parameter """
+    omega = 2 * np.pi * np.array(f)
+    return p[0] / (1 + 1j * omega * p[1])
+
+
+def spectra(n, read=None):
+    f, _, Z = next(simulate_spectra(circuit, n, chunk_size=n, seed=0))
+    for i in range(n):
+        if read is not None:
+            read.append(i)
+        yield f, Z[i], f'spectrum {i}'
+
+
+def test_iter_fit():
+    f, parameters, Z = next(simulate_spectra(circuit, 4, proportional=0,
+                                             seed=0))
+    results = list(iter_fit(circuit, zip([f] * 4, Z)))
+    assert [index for index, _ in results] == [0, 1, 2, 3]
+    for (_, result), true in zip(results, parameters):
+        assert np.allclose(result.parameters, true, rtol=1e-4)
+
+    # spectra are read lazily, at most `window` ahead of the results
+    read = []
+    stream = iter_fit(circuit, spectra(10, read),
+                      executor=concurrent.futures.ThreadPoolExecutor(2),
+                      window=3)
+    metadata, result = next(stream)
+    assert metadata == 'spectrum 0'
+    assert len(read) == 3
+    assert [m for m, _ in stream] == [f'spectrum {i}' for i in range(1, 10)]
+
+    unordered = iter_fit(circuit, spectra(6), ordered=False,
+                         executor=concurrent.futures.ThreadPoolExecutor(3))
+    assert sorted(m for m, _ in unordered) == \
+        sorted(f'spectrum {i}' for i in range(6))
+
+
+@pytest.mark.filterwarnings('ignore:numba is not installed')
+def test_iter_fit_jit(tmp_path):
+    # circuits with jit=True are fit with numba-compiled circuits
+    compiled = CustomCircuit(circuit.circuit, jit=True,
+                             initial_guess=circuit.initial_guess)
+    with impedance.profile() as prof:
+        results = list(iter_fit(compiled, spectra(2)))
+    assert len(results) == 2
+    assert prof.stats['phase', 'jit']['calls'] > 0
+
+    with impedance.profile() as prof:
+        resumable_fit(compiled, spectra(2), str(tmp_path / 'fits.jsonl'))
+    assert prof.stats['phase', 'jit']['calls'] > 0
+
+
+def test_iter_fit_processes():
+    results = dict(iter_fit(circuit, spectra(4), n_jobs=2))
+    assert sorted(results) == [f'spectrum {i}' for i in range(4)]
+    assert all(result.converged for result in results.values())
+
+    derived = CustomCircuit('R0-RCx1', initial_guess=[.01, .1, .1],
+                            elements=registry)
+    f, parameters, Z = next(simulate_spectra(derived, 4, proportional=0,
+                                             seed=0))
+    results = list(iter_fit(derived, zip([f] * 4, Z), n_jobs=2))
+    for (_, result), true in zip(results, parameters):
+        assert np.allclose(result.parameters, true, rtol=1e-4)
+
+
+def test_iter_fit_errors():
+    f = np.logspace(3, -1, 10)
+    bad = [(f, np.ones(10)), (f, np.ones(5)), (f, np.ones(10))]
+
+    with pytest.raises(ValueError):
+        list(iter_fit(circuit, bad))
+    results = list(iter_fit(circuit, bad, errors='yield'))
+    assert isinstance(results[1][1], Exception)
+    assert results[2][1].converged is not None
+
+    with pytest.raises(ValueError):
+        list(iter_fit(circuit, bad, n_jobs=2))
+    with pytest.raises(ValueError):
+        next(iter_fit(circuit, bad, errors='ignore'))
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+
+from impedance.models.circuits import CustomCircuit
+from impedance.models.circuits.compiler import CompiledCircuit
+from impedance.models.circuits.warmstart import WarmStartStore
+
+
+def test_WarmStartStore():
+    circuit = 'R0-p(R1,C1)-p(R2,C2)'
+    frequencies = np.logspace(5, -2, 40)
+    true = np.array([.01, .05, 1e-4, .1, 1])
+    model = CompiledCircuit(circuit)
+
+    store = WarmStartStore()
+    assert store.query(frequencies, model(frequencies, true), circuit) is None
+
+    # nearest neighbor among a drift of parameters
+    drift = true * np.linspace(1, 2, 100)[:, None]
+    for params in drift:
+        store.add(frequencies, model(frequencies, params), circuit, params)
+    assert len(store) == 100
+
+    query = model(frequencies, drift[42] * 1.001)
+    assert np.allclose(store.query(frequencies, query, circuit), drift[42])
+    assert store.query(frequencies, query, circuit, max_distance=0) is None
+    assert store.query(frequencies, query, circuit,
+                       constants={'R0': .01}) is None
+
+    # persistence
+    store.save('./test_warmstart.npz')
+    loaded = WarmStartStore.load('./test_warmstart.npz')
+    os.remove('./test_warmstart.npz')
+    assert np.allclose(loaded.query(frequencies, query, circuit), drift[42])
+
+    # fits start from the nearest match and are added to the store
+    limited = WarmStartStore(max_entries=2)
+    custom_circuit = CustomCircuit(circuit, initial_guess=[1, 1, 1, 1, 1])
+    for params in drift[:3]:
+        Z = model(frequencies, params)
+        custom_circuit.fit(frequencies, Z, warm_start=limited)
+        assert np.allclose(custom_circuit.parameters_, params, rtol=1e-4)
+    assert len(limited) == 2
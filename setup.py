@@ -13,11 +13,13 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://impedancepy.readthedocs.io/en/latest/",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['benchmarks', 'benchmarks.*']),
     python_requires="~=3.8",
     install_requires=['altair>=3.0', 'matplotlib>=3.5',
                       'numpy>=1.22.4', 'scipy>=1.0',
                       'pandas'],
+    extras_require={'jit': ['numba']},
+    entry_points={'console_scripts': ['impedance = impedance.cli:main']},
     classifiers=(
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",